@@ -0,0 +1,251 @@
+"""Per-symbol prefix-sum index over the 1m perps bars.
+
+The stratify scripts all ask the same question of a symbol's bars: what is
+the sum of some bar column over (t - window, t]? They used to answer it by
+loading the bar parquet into DuckDB, building a `SUM(...) OVER (ORDER BY
+start_us)` table and ASOF-joining every trip against it, once per symbol,
+trips file and window. A `.cumsum` file stores those running sums once:
+
+    {bars_root}/{SYMBOL}.cumsum, little-endian, next to {SYMBOL}.parquet
+    [0, 8)       magic b"BARCUMSM"
+    [8, 16)      uint64 header length H
+    [16, 16+H)   JSON header: version, rows, source size/mtime, first_us
+                 per bar filter, and {name: [offset, dtype, shape]} per block
+    blocks, each starting on a 64-byte boundary:
+      start_us                                    int64   (rows,)
+      n_priced, vwap_vol, vol, vwap, vwap2,       float64 (rows + 1,)
+      buy_dv, sell_dv
+
+`start_us` holds every bar with volume or dollar flow. Each cumulative
+column has a leading 0, so cum[k] is the sum over the first k bars and the
+sum over bars starting strictly before t is cum[searchsorted(start_us, t)].
+A trailing-window sum is two searchsorted lookups, for any number of trips.
+
+Columns and the bars they sum over, matching the old per-script filters:
+    n_priced, vwap, vwap2, vwap_vol   volume > 0 and vwap > 0  ("priced")
+    vol                               volume > 0
+    buy_dv, sell_dv                   buy or sell dollar volume > 0
+
+The index is rebuilt when the parquet's size or mtime changes.
+
+Usage:
+    python scripts/crypto/bar_cumsum.py                  # every symbol
+    python scripts/crypto/bar_cumsum.py --symbols BTCUSDT ETHUSDT --force
+
+    from bar_cumsum import BarCumsum
+    idx = BarCumsum.for_symbol("data/crypto/perps_bars/1m", "BTCUSDT")
+    vol_24h = idx.window_sum("vol", entry_us - 24 * US_PER_HOUR, entry_us)
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pyarrow.parquet as pq
+
+MAGIC = b"BARCUMSM"
+VERSION = 1
+ALIGN = 64
+DEFAULT_BARS_ROOT = "data/crypto/perps_bars/1m"
+
+CUM_COLUMNS = ("n_priced", "vwap_vol", "vol", "vwap", "vwap2", "buy_dv", "sell_dv")
+
+# Bar filter each cumulative column sums over (see the module docstring).
+COLUMN_FILTER = {
+    "n_priced": "priced", "vwap_vol": "priced", "vwap": "priced", "vwap2": "priced",
+    "vol": "volume",
+    "buy_dv": "flow", "sell_dv": "flow",
+}
+
+
+def cumsum_path(parquet_path: str) -> str:
+    return os.path.splitext(parquet_path)[0] + ".cumsum"
+
+
+def source_stat(path: str) -> dict:
+    st = os.stat(path)
+    return {"bytes": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _layout(rows: int) -> dict:
+    """{block: [offset, dtype, shape]}, offsets relative to the data start."""
+    blocks = [("start_us", "<i8", [rows])] + [(c, "<f8", [rows + 1]) for c in CUM_COLUMNS]
+    out, pos = {}, 0
+    for name, dtype, shape in blocks:
+        out[name] = [pos, dtype, shape]
+        pos += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // ALIGN) * ALIGN
+    out["_end"] = [pos, "", []]
+    return out
+
+
+class BarCumsum:
+    """One symbol's `.cumsum` file. Arrays are read-only np.memmap views."""
+
+    def __init__(self, header: dict, arrays: dict[str, np.ndarray]):
+        self.header = header
+        self.start_us = arrays["start_us"]
+        self.cum = {c: arrays[c] for c in CUM_COLUMNS}
+        self.first_us = header["first_us"]
+
+    @classmethod
+    def open(cls, path: str) -> "BarCumsum":
+        with open(path, "rb") as f:
+            magic, n = struct.unpack("<8sQ", f.read(16))
+            if magic != MAGIC:
+                raise ValueError(f"{path}: not a bar cumsum file")
+            header = json.loads(f.read(n))
+        if header.get("version") != VERSION:
+            raise ValueError(f"{path}: cumsum version {header.get('version')}, expected {VERSION}")
+        arrays = {}
+        for name, (offset, dtype, shape) in header["blocks"].items():
+            if name.startswith("_"):
+                continue
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r",
+                                         offset=header["data_start"] + offset, shape=tuple(shape))
+        return cls(header, arrays)
+
+    @classmethod
+    def for_symbol(cls, bars_root: str, symbol: str, rebuild: bool = False) -> "BarCumsum | None":
+        """The symbol's index, (re)built first when missing or older than its
+        parquet. None when the symbol has no bar parquet."""
+        parquet_path = os.path.join(bars_root, f"{symbol}.parquet")
+        if not os.path.exists(parquet_path):
+            return None
+        path = cumsum_path(parquet_path)
+        if not rebuild:
+            try:
+                idx = cls.open(path)
+                if idx.header.get("source") == source_stat(parquet_path):
+                    return idx
+            except (OSError, ValueError):
+                pass
+        build(parquet_path, path)
+        return cls.open(path)
+
+    def __len__(self) -> int:
+        return len(self.start_us)
+
+    def bars_before(self, t_us) -> np.ndarray:
+        """Number of bars starting strictly before each t (the row into the
+        cumulative columns)."""
+        return np.searchsorted(self.start_us, np.asarray(t_us, dtype=np.int64), side="left")
+
+    def at(self, column: str, t_us) -> np.ndarray:
+        """Sum of `column` over bars starting strictly before each t."""
+        return self.cum[column][self.bars_before(t_us)]
+
+    def window_sum(self, column: str, t_lo_us, t_hi_us) -> np.ndarray:
+        """Sum of `column` over bars with t_lo <= start < t_hi."""
+        return self.at(column, t_hi_us) - self.at(column, t_lo_us)
+
+    def last_bar_us(self, t_us) -> np.ndarray:
+        """start_us of the last bar before each t, as float64 (NaN when
+        there is none), like the bar_us column of an ASOF LEFT JOIN."""
+        i = self.bars_before(t_us)
+        out = np.full(i.shape, np.nan)
+        has = i > 0
+        out[has] = self.start_us[i[has] - 1]
+        return out
+
+
+def build(parquet_path: str, out_path: str | None = None) -> str:
+    """Write the `.cumsum` index for one bar parquet, atomically (.tmp +
+    os.replace). Returns the output path."""
+    out_path = out_path or cumsum_path(parquet_path)
+    source = source_stat(parquet_path)
+    names = set(pq.read_schema(parquet_path).names)
+    cols = [c for c in ("start_us", "volume", "vwap", "buy_dollar_volume", "sell_dollar_volume")
+            if c in names]
+    tbl = pq.read_table(parquet_path, columns=cols)
+
+    def col(name):
+        if name not in names:
+            return np.zeros(tbl.num_rows)
+        return np.nan_to_num(tbl.column(name).to_numpy(zero_copy_only=False).astype(np.float64))
+
+    start_us = tbl.column("start_us").to_numpy().astype(np.int64)
+    volume, vwap = col("volume"), col("vwap")
+    buy, sell = col("buy_dollar_volume"), col("sell_dollar_volume")
+    if len(start_us) > 1 and (np.diff(start_us) < 0).any():
+        order = np.argsort(start_us, kind="stable")
+        start_us, volume, vwap, buy, sell = (a[order] for a in (start_us, volume, vwap, buy, sell))
+
+    masks = {"priced": (volume > 0) & (vwap > 0), "volume": volume > 0,
+             "flow": (buy > 0) | (sell > 0)}
+    keep = masks["volume"] | masks["flow"] | masks["priced"]
+    start_us = start_us[keep]
+    masks = {k: m[keep] for k, m in masks.items()}
+    volume, vwap, buy, sell = volume[keep], vwap[keep], buy[keep], sell[keep]
+    values = {
+        "n_priced": np.ones(len(start_us)),
+        "vwap_vol": vwap * volume,
+        "vol": volume,
+        "vwap": vwap,
+        "vwap2": vwap * vwap,
+        "buy_dv": buy,
+        "sell_dv": sell,
+    }
+
+    rows = len(start_us)
+    blocks = _layout(rows)
+    header = {
+        "version": VERSION, "rows": rows, "blocks": blocks,
+        "source": source, "source_name": os.path.basename(parquet_path),
+        "first_us": {k: int(start_us[m][0]) if m.any() else None for k, m in masks.items()},
+    }
+    head = json.dumps(header).encode()
+    # Reserve room for the final header (same length: only data_start changes).
+    data_start = -(-(16 + len(head) + 32) // ALIGN) * ALIGN
+    header["data_start"] = data_start
+    head = json.dumps(header).encode()
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<8sQ", MAGIC, len(head)))
+        f.write(head)
+        f.truncate(data_start + blocks["_end"][0])
+        f.seek(data_start + blocks["start_us"][0])
+        f.write(start_us.astype("<i8").tobytes())
+        for c in CUM_COLUMNS:
+            cum = np.zeros(rows + 1)
+            np.cumsum(np.where(masks[COLUMN_FILTER[c]], values[c], 0.0), out=cum[1:])
+            f.seek(data_start + blocks[c][0])
+            f.write(cum.astype("<f8").tobytes())
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--bars-root", default=DEFAULT_BARS_ROOT,
+                    help=f"1m bar-parquet root. Default: {DEFAULT_BARS_ROOT}")
+    ap.add_argument("--symbols", nargs="+", help="Symbols to index. Default: every parquet.")
+    ap.add_argument("--force", action="store_true", help="Rebuild current indexes too.")
+    args = ap.parse_args()
+
+    if args.symbols:
+        symbols = args.symbols
+    else:
+        symbols = sorted(os.path.splitext(os.path.basename(p))[0]
+                         for p in glob.glob(os.path.join(args.bars_root, "*.parquet")))
+    n_missing = 0
+    for i, sym in enumerate(symbols, start=1):
+        if BarCumsum.for_symbol(args.bars_root, sym, rebuild=args.force) is None:
+            n_missing += 1
+        if i % 50 == 0 or i == len(symbols):
+            print(f"  [{i:>4d}/{len(symbols)}] indexed", file=sys.stderr)
+    print(f"indexed={len(symbols) - n_missing} missing={n_missing}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
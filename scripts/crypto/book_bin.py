@@ -0,0 +1,314 @@
+"""Memory-mappable binary layout for Crypto Lake `book` snapshots.
+
+The `book` parquet stores 80 level columns that every consumer re-stacks
+into (rows, 20) matrices on each run. A `.bookbin` file stores them already
+stacked, so a day opens zero-copy through np.memmap:
+
+    {date}.bookbin, little-endian, next to {date}.parquet
+    [0, 8)       magic b"LAKEBOOK"
+    [8, 16)      uint64 header length H
+    [16, 16+H)   JSON header: version, rows, levels, tick_size, tick_base,
+                 the source parquet's name and stat, and
+                 {name: [offset, dtype, shape]} per block
+    blocks, each starting on a 64-byte boundary:
+      timestamp_us, received_time_us, sequence_number   int64   (rows,)
+      bid_ticks, ask_ticks                               int32   (rows, levels)
+      bid_size, ask_size                                 float32 (rows, levels)
+
+Prices are integer ticks relative to `tick_base`: price = (tick_base +
+ticks) * tick_size, decoded to the nearest float of that decimal (so it
+equals the parquet's and the delta stream's price bit for bit), with
+MISSING_TICK marking an empty level (NaN price in the parquet). Sizes are float32, 0 for an empty level. That is 8 bytes per
+level instead of the parquet's 16 once decoded; the file is uncompressed,
+so it is larger than the zstd parquet on disk, but opening it reads only
+the header and a scan touches only the levels it slices.
+
+The header records the parquet's size and mtime, as bar_cumsum does for
+`.cumsum`. BookBin.for_parquet only returns a `.bookbin` that still
+matches, and the converter rebuilds the ones that don't.
+
+Usage:
+    # Convert one day, or every day under a directory (tick size from
+    # obi.TICK_SIZES, else inferred from the day's prices)
+    python scripts/crypto/book_bin.py \\
+        /mnt/d/trading-edge-bulk/crypto/lake/book/BINANCE_FUTURES/BTC-USDT-PERP
+
+    from book_bin import BookBin
+    book = BookBin.for_parquet(".../2026-01-31.parquet")  # None when stale
+    sizes = book.size("bid", 10)       # (rows, 10) float32 memmap view
+    prices = book.price("ask", 10)     # (rows, 10) float64, NaN when empty
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pyarrow.parquet as pq
+
+MAGIC = b"LAKEBOOK"
+VERSION = 1
+ALIGN = 64
+N_LEVELS = 20
+MISSING_TICK = np.iinfo(np.int32).min
+
+# Largest |price - decoded price| accepted by the converter, in ticks.
+# Anything above this means the tick size is wrong for the symbol.
+TICK_TOLERANCE = 1e-3
+
+_META = ("timestamp_us", "received_time_us", "sequence_number")
+
+
+def bookbin_path(parquet_path: str) -> str:
+    return os.path.splitext(parquet_path)[0] + ".bookbin"
+
+
+def _source_stat(path: str) -> dict:
+    st = os.stat(path)
+    return {"bytes": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def tick_decimals(tick_size: float) -> int:
+    """Decimal places of a tick size: 0.1 -> 1, 0.25 -> 2, 1.0 -> 0."""
+    return len(np.format_float_positional(tick_size, trim="-").partition(".")[2])
+
+
+def _layout(rows: int, levels: int) -> dict:
+    """{block: [offset, dtype, shape]}, offsets relative to the data start."""
+    blocks = [(name, "<i8", [rows]) for name in _META]
+    blocks += [(f"{side}_ticks", "<i4", [rows, levels]) for side in ("bid", "ask")]
+    blocks += [(f"{side}_size", "<f4", [rows, levels]) for side in ("bid", "ask")]
+    out, pos = {}, 0
+    for name, dtype, shape in blocks:
+        out[name] = [pos, dtype, shape]
+        pos += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // ALIGN) * ALIGN
+    out["_end"] = [pos, "", []]
+    return out
+
+
+class BookBin:
+    """A `.bookbin` day (or a row slice of one). Block arrays are read-only
+    np.memmap views; slicing with book[lo:hi] stays zero-copy."""
+
+    def __init__(self, header: dict, arrays: dict[str, np.ndarray]):
+        self.header = header
+        self.tick_size = float(header["tick_size"])
+        self.tick_base = int(header["tick_base"])
+        # price = (tick_base + ticks) * tick_units / 10**decimals, exact in
+        # integers up to the one rounding of the final division.
+        self._decimals = tick_decimals(self.tick_size)
+        self._tick_units = int(round(self.tick_size * 10 ** self._decimals))
+        self.levels = int(header["levels"])
+        self.timestamp_us = arrays["timestamp_us"]
+        self.received_time_us = arrays["received_time_us"]
+        self.sequence_number = arrays["sequence_number"]
+        self.bid_ticks = arrays["bid_ticks"]
+        self.ask_ticks = arrays["ask_ticks"]
+        self.bid_size = arrays["bid_size"]
+        self.ask_size = arrays["ask_size"]
+
+    @classmethod
+    def open(cls, path: str) -> "BookBin":
+        with open(path, "rb") as f:
+            magic, n = struct.unpack("<8sQ", f.read(16))
+            if magic != MAGIC:
+                raise ValueError(f"{path}: not a bookbin file")
+            header = json.loads(f.read(n))
+        if header.get("version") != VERSION:
+            raise ValueError(f"{path}: bookbin version {header.get('version')}, expected {VERSION}")
+        data_start = header["data_start"]
+        arrays = {}
+        for name, (offset, dtype, shape) in header["blocks"].items():
+            if name.startswith("_"):
+                continue
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r",
+                                         offset=data_start + offset, shape=tuple(shape))
+        return cls(header, arrays)
+
+    @classmethod
+    def for_parquet(cls, parquet_path: str) -> "BookBin | None":
+        """The `.bookbin` next to a book parquet, or None when it is missing,
+        unreadable, or was built from a different version of the parquet.
+        Without the parquet there is nothing to check against, and the
+        `.bookbin` is returned as is."""
+        path = bookbin_path(parquet_path)
+        try:
+            book = cls.open(path)
+        except (OSError, ValueError):
+            return None
+        if os.path.exists(parquet_path) and book.header.get("source_stat") != _source_stat(parquet_path):
+            return None
+        return book
+
+    def __len__(self) -> int:
+        return len(self.timestamp_us)
+
+    def __getitem__(self, rows: slice) -> "BookBin":
+        if not isinstance(rows, slice):
+            raise TypeError("BookBin rows are selected with a slice; use row(i) for one row")
+        return BookBin(self.header, {
+            name: getattr(self, name)[rows]
+            for name in (*_META, "bid_ticks", "ask_ticks", "bid_size", "ask_size")
+        })
+
+    def ticks(self, side: str, depth: int | None = None) -> np.ndarray:
+        """(rows, depth) int32 tick view, MISSING_TICK for empty levels."""
+        return getattr(self, f"{side}_ticks")[:, :depth]
+
+    def size(self, side: str, depth: int | None = None) -> np.ndarray:
+        """(rows, depth) float32 size view, 0 for empty levels."""
+        return getattr(self, f"{side}_size")[:, :depth]
+
+    def _decode(self, t: np.ndarray) -> np.ndarray:
+        px = (t.astype(np.int64) + self.tick_base) * self._tick_units / 10.0 ** self._decimals
+        px[t == MISSING_TICK] = np.nan
+        return px
+
+    def price(self, side: str, depth: int | None = None) -> np.ndarray:
+        """(rows, depth) float64 prices decoded from ticks, NaN for empty
+        levels."""
+        return self._decode(self.ticks(side, depth))
+
+    def mid(self) -> np.ndarray:
+        return (self.price("bid", 1)[:, 0] + self.price("ask", 1)[:, 0]) / 2.0
+
+    def row(self, i: int) -> dict:
+        """One snapshot as a dict of the parquet's columns (usable as the
+        seed row of obi.replay_deltas / obi_from_delta). Sizes go through
+        their shortest float32 repr, which gives back the parquet's value
+        for lots of up to 7 significant digits."""
+        out = {name: int(getattr(self, name)[i]) for name in _META}
+        for side in ("bid", "ask"):
+            px = self._decode(self.ticks(side)[i])
+            sz = self.size(side)[i]
+            for j in range(self.levels):
+                out[f"{side}_{j}_price"] = float(px[j])
+                out[f"{side}_{j}_size"] = np.nan if np.isnan(px[j]) else float(str(sz[j]))
+        return out
+
+
+def _encode_ticks(px: np.ndarray, tick_size: float, tick_base: int, path: str) -> np.ndarray:
+    """Parquet prices (NaN = empty) -> int32 ticks relative to tick_base."""
+    missing = np.isnan(px)
+    abs_ticks = np.rint(np.where(missing, 0.0, px) / tick_size)
+    err = np.abs(np.where(missing, 0.0, px) / tick_size - abs_ticks)
+    if err.size and err.max() > TICK_TOLERANCE:
+        raise ValueError(f"{path}: prices are not on a {tick_size:g} tick grid "
+                         f"(off by up to {err.max():.3f} ticks)")
+    ticks = abs_ticks - tick_base
+    if np.abs(ticks[~missing]).max(initial=0) >= 2 ** 31 - 1:
+        raise ValueError(f"{path}: price range too wide for int32 ticks at {tick_size:g}")
+    out = ticks.astype(np.int32)
+    out[missing] = MISSING_TICK
+    return out
+
+
+def convert(parquet_path: str, tick_size: float, out_path: str | None = None) -> str:
+    """Write the `.bookbin` for one book parquet, a row group at a time,
+    atomically (.tmp + os.replace). Returns the output path."""
+    out_path = out_path or bookbin_path(parquet_path)
+    source = _source_stat(parquet_path)
+    pf = pq.ParquetFile(parquet_path)
+    rows = pf.metadata.num_rows
+    names = set(pf.schema_arrow.names)
+    levels = 0
+    while levels < N_LEVELS and f"bid_{levels}_price" in names:
+        levels += 1
+
+    blocks = _layout(rows, levels)
+    header = {"version": VERSION, "rows": rows, "levels": levels,
+              "tick_size": tick_size, "tick_base": 0, "blocks": blocks,
+              "source": os.path.basename(parquet_path), "source_stat": source}
+    # Anchor ticks near the day's prices so int32 covers any symbol.
+    if rows:
+        first = pf.read_row_group(0, columns=["bid_0_price", "ask_0_price"]).to_pandas()
+        anchor = np.nanmin(first.to_numpy()) if first.notna().any().any() else 0.0
+        header["tick_base"] = int(np.rint(anchor / tick_size)) if np.isfinite(anchor) else 0
+    head = json.dumps(header).encode()
+    # Reserve room for the final header (same length: only data_start changes).
+    data_start = -(-(16 + len(head) + 32) // ALIGN) * ALIGN
+    header["data_start"] = data_start
+    head = json.dumps(header).encode()
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<8sQ", MAGIC, len(head)))
+        f.write(head)
+        f.truncate(data_start + blocks["_end"][0])
+
+    if rows:
+        mm = {name: np.memmap(tmp, dtype=dtype, mode="r+", offset=data_start + offset,
+                              shape=tuple(shape))
+              for name, (offset, dtype, shape) in blocks.items() if not name.startswith("_")}
+        lo = 0
+        for rg in range(pf.num_row_groups):
+            tbl = pf.read_row_group(rg)
+            hi = lo + tbl.num_rows
+            for name in _META:
+                if name in names:
+                    mm[name][lo:hi] = tbl.column(name).to_numpy()
+            for side in ("bid", "ask"):
+                px = np.column_stack([tbl.column(f"{side}_{i}_price").to_numpy().astype(np.float64)
+                                      for i in range(levels)])
+                sz = np.column_stack([tbl.column(f"{side}_{i}_size").to_numpy().astype(np.float64)
+                                      for i in range(levels)])
+                mm[f"{side}_ticks"][lo:hi] = _encode_ticks(px, tick_size, header["tick_base"],
+                                                           parquet_path)
+                mm[f"{side}_size"][lo:hi] = np.nan_to_num(sz)
+            lo = hi
+        for m in mm.values():
+            m.flush()
+        del mm
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def main() -> int:
+    # obi imports this module, so its tick table is imported late.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from obi import tick_size_for
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("inputs", nargs="+", help="Book parquet(s) or directories of {date}.parquet.")
+    ap.add_argument("--symbol", help="Symbol for the tick-size lookup. Default: parent directory name.")
+    ap.add_argument("--tick-size", type=float, help="Override the tick size.")
+    ap.add_argument("--force", action="store_true",
+                    help="Rebuild .bookbin files even when they match their parquet.")
+    args = ap.parse_args()
+
+    paths = []
+    for p in args.inputs:
+        if os.path.isdir(p):
+            paths.extend(sorted(glob.glob(os.path.join(p, "**", "*.parquet"), recursive=True)))
+        else:
+            paths.append(p)
+
+    n_done = n_skip = 0
+    for path in paths:
+        out = bookbin_path(path)
+        if not args.force and BookBin.for_parquet(path) is not None:
+            n_skip += 1
+            continue
+        tick = args.tick_size
+        if tick is None:
+            symbol = args.symbol or os.path.basename(os.path.dirname(path))
+            prices = pq.read_table(path, columns=["bid_0_price", "ask_0_price"]).to_pandas()
+            tick = tick_size_for(symbol, prices.to_numpy())
+        convert(path, tick, out)
+        n_done += 1
+        print(f"  OK   {out}: tick {tick:g}, {os.path.getsize(out) / 1e6:.1f} MB "
+              f"(parquet {os.path.getsize(path) / 1e6:.1f} MB)")
+    print(f"converted={n_done} skipped={n_skip}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
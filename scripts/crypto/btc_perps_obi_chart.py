@@ -28,7 +28,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from obi import obi_from_book, obi_from_delta  # noqa: E402
+from book_bin import BookBin, bookbin_path  # noqa: E402
+from obi import obi_sweep_from_book, obi_sweep_from_delta, tick_size_for  # noqa: E402
 
 LAKE_ROOT = "/mnt/d/trading-edge-bulk/crypto/lake"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -41,13 +42,37 @@ def _us_to_dt(us: np.ndarray) -> np.ndarray:
     return pd.to_datetime(us, unit="us", utc=True)
 
 
-def _load_book(date: str, symbol: str, exchange: str) -> pd.DataFrame:
+def _load_book(date: str, symbol: str, exchange: str, use_bin: bool = False) -> pd.DataFrame | BookBin:
+    """The day's snapshots: the parquet as a DataFrame, or with `use_bin`
+    its memory-mapped .bookbin (see book_bin.py). A missing or stale
+    .bookbin falls back to the parquet."""
     path = f"{LAKE_ROOT}/book/{exchange}/{symbol}/{date}.parquet"
+    if use_bin:
+        book = BookBin.for_parquet(path)
+        if book is not None:
+            return book
+        print(f"  {bookbin_path(path)} is missing or older than its parquet; "
+              f"reading the parquet (rebuild with book_bin.py)")
     if not os.path.exists(path):
         raise FileNotFoundError(path)
     return pd.read_parquet(path)
 
 
+def _book_window(book, t_lo: int, t_hi: int):
+    """Snapshots with t_lo <= timestamp_us < t_hi (a zero-copy slice for a
+    BookBin, whose rows are in time order)."""
+    if isinstance(book, BookBin):
+        lo, hi = np.searchsorted(book.timestamp_us, [t_lo, t_hi], side="left")
+        return book[lo:hi]
+    return book[(book["timestamp_us"] >= t_lo) & (book["timestamp_us"] < t_hi)]
+
+
+def _book_timestamps(book) -> np.ndarray:
+    if isinstance(book, BookBin):
+        return np.asarray(book.timestamp_us)
+    return book["timestamp_us"].to_numpy()
+
+
 def _load_delta(date: str, symbol: str, exchange: str) -> pd.DataFrame:
     path = f"{LAKE_ROOT}/book_delta_v2/{exchange}/{symbol}/{date}.parquet"
     if not os.path.exists(path):
@@ -77,6 +102,15 @@ def main() -> int:
     ap.add_argument("--lambda-decay", type=float, default=0.58,
                     help="OBI exponential decay per level index (default 0.58: "
                          "level 4 carries ~10%% of level 0).")
+    ap.add_argument("--true-distance", action="store_true",
+                    help="Weight levels by |price - mid| / tick_size instead of level "
+                         "index; lambda is then per tick. Use on alts and thin books "
+                         "where the spread is often wider than one tick.")
+    ap.add_argument("--tick-size", type=float, default=None,
+                    help="Tick size for --true-distance. Default: obi.TICK_SIZES, else "
+                         "inferred from the day's snapshot prices.")
+    ap.add_argument("--bin", action="store_true",
+                    help="Read the day's .bookbin (book_bin.py) instead of the book parquet.")
     ap.add_argument("--sample-cadence-ms", type=int, default=100,
                     help="Resample cadence for delta-replay OBI (ms). Default 100.")
     ap.add_argument("--start-hour", type=int, default=None,
@@ -89,7 +123,7 @@ def main() -> int:
     args = ap.parse_args()
 
     print(f"Loading book snapshots for {args.symbol} {args.date}...")
-    book_df = _load_book(args.date, args.symbol, args.exchange)
+    book_df = _load_book(args.date, args.symbol, args.exchange, args.bin)
     print(f"  {len(book_df):,} snapshots")
 
     if args.start_hour is not None or args.end_hour is not None:
@@ -102,56 +136,68 @@ def main() -> int:
         t_lo = midnight_us + sh * 3600 * 1_000_000
         t_hi = midnight_us + eh * 3600 * 1_000_000
         n_before = len(book_df)
-        book_df = book_df[(book_df["timestamp_us"] >= t_lo) & (book_df["timestamp_us"] < t_hi)]
+        book_df = _book_window(book_df, t_lo, t_hi)
         print(f"  filtered to [{sh}, {eh}) UTC: {n_before:,} -> {len(book_df):,}")
-    else:
-        t_lo = int(book_df["timestamp_us"].iloc[0])
-        t_hi = int(book_df["timestamp_us"].iloc[-1])
 
     if len(book_df) == 0:
         print("ERROR: no snapshots in window", file=sys.stderr)
         return 1
+    book_ts = _book_timestamps(book_df)
 
     print(f"Loading book_delta_v2 for {args.symbol} {args.date}...")
     delta_df = _load_delta(args.date, args.symbol, args.exchange)
     print(f"  {len(delta_df):,} delta events")
     # Filter deltas to the same window.
     delta_df = delta_df[
-        (delta_df["timestamp_us"] >= int(book_df["timestamp_us"].iloc[0]))
-        & (delta_df["timestamp_us"] <= int(book_df["timestamp_us"].iloc[-1]))
+        (delta_df["timestamp_us"] >= int(book_ts[0]))
+        & (delta_df["timestamp_us"] <= int(book_ts[-1]))
     ].reset_index(drop=True)
     print(f"  {len(delta_df):,} delta events in window")
 
+    tick_size = None
+    if args.true_distance:
+        if args.tick_size:
+            tick_size = args.tick_size
+        elif isinstance(book_df, BookBin):
+            tick_size = book_df.tick_size
+        else:
+            tick_size = tick_size_for(
+                args.symbol, book_df[["bid_0_price", "ask_0_price"]].to_numpy())
+        print(f"True-distance weights, tick size {tick_size:g}")
+
     # --- OBI from snapshots (cheap, vectorised) ---
     print("Computing OBI from snapshots...")
-    ts_book, obi5_book = obi_from_book(book_df, depth=5,  lambda_decay=args.lambda_decay)
-    _,       obi10_book = obi_from_book(book_df, depth=10, lambda_decay=args.lambda_decay)
+    ts_book, _, obi_book = obi_sweep_from_book(
+        book_df, depths=[5, 10], lambdas=[args.lambda_decay], tick_size=tick_size)
+    obi5_book, obi10_book = obi_book[:, 0], obi_book[:, 1]
 
-    # --- OBI from delta replay (slow, Python loop). Seed from first book row. ---
-    seed_row = book_df.iloc[0]
+    # --- OBI from delta replay (array ladder). Seed from first book row. ---
+    # One replay at depth 10 serves both the top-5 and top-10 series.
+    seed_row = book_df.row(0) if isinstance(book_df, BookBin) else book_df.iloc[0]
     cadence_us = args.sample_cadence_ms * 1000
-    t_end_us = int(book_df["timestamp_us"].iloc[-1])
-    print(f"Replaying deltas from t_seed={seed_row['timestamp_us']} for OBI top-5...")
-    ts_delta, obi5_delta = obi_from_delta(
-        seed_row, delta_df, depth=5, lambda_decay=args.lambda_decay,
-        sample_cadence_us=cadence_us, t_end_us=t_end_us,
+    t_end_us = int(book_ts[-1])
+    print(f"Replaying deltas from t_seed={seed_row['timestamp_us']} for OBI top-5/top-10...")
+    ts_delta, _, obi_delta = obi_sweep_from_delta(
+        seed_row, delta_df, depths=[5, 10], lambdas=[args.lambda_decay],
+        sample_cadence_us=cadence_us, t_end_us=t_end_us, tick_size=tick_size,
     )
+    obi5_delta, obi10_delta = obi_delta[:, 0], obi_delta[:, 1]
     print(f"  {len(ts_delta):,} samples")
-    print(f"Replaying deltas for OBI top-10...")
-    ts_delta10, obi10_delta = obi_from_delta(
-        seed_row, delta_df, depth=10, lambda_decay=args.lambda_decay,
-        sample_cadence_us=cadence_us, t_end_us=t_end_us,
-    )
 
     # --- Mid-price track from snapshots ---
-    mid = (book_df["bid_0_price"].to_numpy() + book_df["ask_0_price"].to_numpy()) / 2.0
+    if isinstance(book_df, BookBin):
+        mid = book_df.mid()
+    else:
+        mid = (book_df["bid_0_price"].to_numpy() + book_df["ask_0_price"].to_numpy()) / 2.0
+
+    distance = f"tick={tick_size:g}" if tick_size else "index distance"
 
     # --- Decimate for rendering ---
     ts_book_d, mid_d = _decimate(ts_book, mid, args.max_points)
     _, obi5_book_d = _decimate(ts_book, obi5_book, args.max_points)
     _, obi10_book_d = _decimate(ts_book, obi10_book, args.max_points)
     ts_delta_d, obi5_delta_d = _decimate(ts_delta, obi5_delta, args.max_points)
-    _, obi10_delta_d = _decimate(ts_delta10, obi10_delta, args.max_points)
+    _, obi10_delta_d = _decimate(ts_delta, obi10_delta, args.max_points)
 
     # --- Plot ---
     fig = make_subplots(
@@ -159,7 +205,7 @@ def main() -> int:
         row_heights=[0.55, 0.45],
         subplot_titles=[
             f"{args.symbol} mid-price ({args.date})",
-            f"OBI (lambda={args.lambda_decay}): blue=book snapshots, orange=delta replay; solid=top5, dashed=top10",
+            f"OBI (lambda={args.lambda_decay}, {distance}): blue=book snapshots, orange=delta replay; solid=top5, dashed=top10",
         ],
     )
     fig.add_trace(
@@ -11,6 +11,9 @@ each side. Files are written to a per-symbol subdir of `--out-dir`.
 
 Reuses the standard `scripts/visualization/chart_controls.js` post-script
 so middle-click pan/zoom and a/s/d dragmode shortcuts work.
+
+--annotate adds entry-time trip features (e.g. imb:200h volratio:30d:8h)
+to each title, read from the trip feature store (feature_store.py).
 """
 from __future__ import annotations
 
@@ -23,6 +26,10 @@ import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feature_store import DEFAULT_STORE_ROOT, load_features  # noqa: E402
+from trip_features import Feature  # noqa: E402
+
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CHART_CONTROLS_JS = os.path.join(
@@ -92,7 +99,8 @@ def chart_one(row: pd.Series, bars_root: str, out_dir: str,
               hours_before: float, hours_after: float,
               bar_minutes: int,
               ma_windows_h: list[float],
-              post_script: str) -> str | None:
+              post_script: str,
+              annotate: tuple[str, ...] = ()) -> str | None:
     sym = row.symbol
     bars_path = os.path.join(bars_root, f"{sym}.parquet")
     if not os.path.exists(bars_path):
@@ -142,6 +150,7 @@ def chart_one(row: pd.Series, bars_root: str, out_dir: str,
                 + f"net_pnl=${row.net_pnl:+.0f}  "
                 f"mfe={row.mfe:+.0f}bp  mae={row.mae:+.0f}bp  "
                 f"bars_held(1m)={int(row.bars_held)}"
+                + "".join(f"  {c}={row[c]:+.2f}" for c in annotate if pd.notna(row[c]))
                 + (
                     f" ({row.bucket}"
                     + (f", {row.reason}" if "reason" in row.index and pd.notna(row.reason) else "")
@@ -260,6 +269,9 @@ def main() -> int:
                     help="If set (e.g. 'short'), keep only that side.")
     ap.add_argument("--limit", type=int, default=None,
                     help="Optional cap on number of charts (debugging).")
+    ap.add_argument("--annotate", nargs="+", default=[],
+                    help="Trip feature specs to show in each title, e.g. imb:200h.")
+    ap.add_argument("--store-root", default=DEFAULT_STORE_ROOT)
     args = ap.parse_args()
 
     repo = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
@@ -269,6 +281,16 @@ def main() -> int:
     ma_windows_h = [float(s.strip()) for s in args.ma_windows.split(",") if s.strip()]
 
     trips = pd.read_csv(trips_path)
+    annotate = tuple(Feature.parse(spec).column for spec in args.annotate)
+    if annotate:
+        # Attach before filtering: the store's per-file table is keyed on
+        # the whole trips file.
+        store_root = args.store_root if os.path.isabs(args.store_root) \
+            else os.path.join(repo, args.store_root)
+        trips, _ = load_features(trips.assign(_row=np.arange(len(trips))), trips_path,
+                                 [Feature.parse(spec) for spec in args.annotate],
+                                 bars_root, store_root)
+        trips = trips.sort_values("_row").drop(columns=["_row"])
     if args.filter_bucket and "bucket" in trips.columns:
         trips = trips[trips.bucket == args.filter_bucket]
     if args.filter_side and "side" in trips.columns:
@@ -288,7 +310,7 @@ def main() -> int:
     for i, row in enumerate(trips.itertuples(index=False), start=1):
         out = chart_one(pd.Series(row._asdict()), bars_root, out_dir,
                         args.hours_before, args.hours_after,
-                        args.bar_minutes, ma_windows_h, post_script)
+                        args.bar_minutes, ma_windows_h, post_script, annotate)
         if out is None:
             n_missing += 1
         else:
@@ -58,12 +58,23 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CHART_CONTROLS_JS = os.path.join(
     os.path.dirname(SCRIPT_DIR), "visualization", "chart_controls.js"
 )
+sys.path.insert(0, os.path.join(os.path.dirname(SCRIPT_DIR), "visualization"))
+from bars import count_imbalance_bars, imbalance_bars, slice_bars  # noqa: E402
 DEFAULT_TAPE_ROOT = "/mnt/d/trading-edge-bulk/crypto/binance/perps"
 DEFAULT_TRIPS = "data/crypto/cumsum_z_persistexit/trips_th15_volratio_30d8h.csv"
 DEFAULT_OUT_DIR = "logs/charts/individual_trades"
 
 US_PER_HOUR = 3_600_000_000
 
+# Chart column name -> bars.py engine column name.
+BAR_COLUMNS = {
+    "dv": "volume", "vwap": "vwap",
+    "open": "open", "high": "high", "low": "low", "close": "close",
+    "start_us": "start_ts", "end_us": "end_ts", "duration_s": "duration_s",
+    "n_trades": "n_trades", "buy_dv": "buy_volume", "sell_dv": "sell_volume",
+    "signed_dv": "signed_volume", "cum_dv": "cum_volume", "bar_sign": "bar_sign",
+}
+
 
 def load_tape_window(tape_root: str, symbol: str,
                      t_lo_us: int, t_hi_us: int) -> pd.DataFrame:
@@ -92,119 +103,23 @@ def load_tape_window(tape_root: str, symbol: str,
     return df
 
 
-def build_imbalance_bars(df: pd.DataFrame, threshold: float) -> list[dict]:
+def build_imbalance_bars(df: pd.DataFrame, threshold: float) -> dict[str, np.ndarray]:
     """Equal-imbalance bars from raw trades. Trades that would push
     |θ| past `threshold` split: a fractional fills the closing bar
     exactly to ±threshold (with sign matching the running θ at the
     moment of crossing); the remainder of the trade rolls into the
     next bar at the same price/sign/timestamp. After close, the
     residual imbalance carries:  θ_new = θ_old - sign(θ_old)·threshold.
+
+    Built by the shared engine (scripts/visualization/bars.py) and
+    returned as a struct-of-arrays dict with the same columns as
+    `chart_volume_bars.build_dollar_bars` plus bar_sign.
     """
-    if len(df) == 0 or threshold <= 0:
-        return []
     p = df.price.to_numpy(dtype=np.float64)
-    q = df.quantity.to_numpy(dtype=np.float64)
-    t = df.timestamp_us.to_numpy(dtype=np.int64)
-    s = df.sign.to_numpy(dtype=np.float64)
-    dv = p * q
-
-    bars = []
-    cur = _empty()
-    theta = 0.0  # running signed-imbalance counter (carries between bars)
-
-    for i in range(len(df)):
-        remaining_dv = dv[i]
-        price_i = p[i]
-        sign_i = s[i]
-        ts_i = int(t[i])
-        while remaining_dv > 0:
-            # If theta is already at/past threshold (shouldn't happen with
-            # carry), close immediately. Otherwise, find how much of this
-            # trade can be added before |theta| would cross threshold.
-            theta_after_full = theta + sign_i * remaining_dv
-            if abs(theta_after_full) < threshold:
-                # Whole trade fits without closing the bar.
-                _add(cur, price_i, remaining_dv, ts_i, sign_i)
-                theta = theta_after_full
-                remaining_dv = 0.0
-            else:
-                # Partial fill: solve for x such that
-                #     |theta + sign_i * x| = threshold,
-                # with x ∈ (0, remaining_dv].
-                target = threshold if sign_i > 0 else -threshold
-                # If the trade direction matches the side that's about to
-                # be hit, the equation is theta + sign_i*x = target. If
-                # theta is on the opposite side, the bar closes on the
-                # OTHER side first only if |theta| was already very large
-                # — with carry it's bounded by `threshold`, so the close
-                # is always on the side matching sign_i.
-                x = (target - theta) / sign_i
-                # Numerical safety.
-                if x <= 0:
-                    # theta already at/past threshold in sign_i direction.
-                    x = 0.0
-                if x > remaining_dv:
-                    x = remaining_dv
-                if x > 0:
-                    _add(cur, price_i, x, ts_i, sign_i)
-                    theta += sign_i * x
-                    remaining_dv -= x
-                # Close the bar; theta should be ±threshold here.
-                bar_sign = 1 if theta > 0 else -1
-                cur["bar_sign"] = bar_sign
-                bars.append(_finalize(cur))
-                cur = _empty()
-                # Carry the overshoot. With our split logic, theta is
-                # exactly ±threshold so the carry is 0, but keep the
-                # general formula for robustness against fp drift.
-                theta = theta - bar_sign * threshold
-    if cur["dv"] > 0:
-        cur["bar_sign"] = 1 if theta > 0 else (-1 if theta < 0 else 1)
-        bars.append(_finalize(cur))
-    cum = 0.0
-    for b in bars:
-        cum += b["dv"]
-        b["cum_dv"] = cum
-    return bars
-
-
-def _empty():
-    return {"prices": [], "dvs": [], "ts": [], "signs": [],
-            "dv": 0.0, "bar_sign": 0}
-
-
-def _add(b, price, dv, ts, sign):
-    b["prices"].append(price)
-    b["dvs"].append(dv)
-    b["ts"].append(ts)
-    b["signs"].append(sign)
-    b["dv"] += dv
-
-
-def _finalize(bar):
-    prices = np.asarray(bar["prices"])
-    dvs = np.asarray(bar["dvs"])
-    signs = np.asarray(bar["signs"])
-    total = dvs.sum()
-    vwap = float((prices * dvs).sum() / total)
-    buy_dv = float(dvs[signs > 0].sum())
-    sell_dv = float(dvs[signs < 0].sum())
-    return {
-        "dv": float(total),
-        "vwap": vwap,
-        "open": float(prices[0]),
-        "high": float(prices.max()),
-        "low": float(prices.min()),
-        "close": float(prices[-1]),
-        "start_us": int(bar["ts"][0]),
-        "end_us": int(bar["ts"][-1]),
-        "duration_s": (bar["ts"][-1] - bar["ts"][0]) / 1e6,
-        "n_trades": len(prices),
-        "buy_dv": buy_dv,
-        "sell_dv": sell_dv,
-        "signed_dv": buy_dv - sell_dv,
-        "bar_sign": int(bar["bar_sign"]),
-    }
+    b = imbalance_bars(p, p * df.quantity.to_numpy(dtype=np.float64),
+                       df.timestamp_us.to_numpy(dtype=np.int64),
+                       df.sign.to_numpy(), threshold, ts_per_second=1e6)
+    return {new: b[old] for new, old in BAR_COLUMNS.items()}
 
 
 def auto_threshold(df: pd.DataFrame, min_bars: int) -> float:
@@ -212,10 +127,12 @@ def auto_threshold(df: pd.DataFrame, min_bars: int) -> float:
     resulting bar count is >= min_bars. We use a doubling/halving
     search over a power-of-2 ladder anchored on the median trade
     $vol of the loaded data — fast, deterministic, no hidden tuning.
+    Each probe only runs the bar-close kernel, not the aggregation.
     """
     if len(df) == 0:
         return 1.0
-    dv = (df.price.to_numpy() * df.quantity.to_numpy())
+    dv = df.price.to_numpy(dtype=np.float64) * df.quantity.to_numpy(dtype=np.float64)
+    sign = df.sign.to_numpy(dtype=np.float64)
     # Start somewhere reasonable: the upper-quartile signed cumsum
     # range over short rolling windows is a good ballpark, but a
     # simpler heuristic is to start at total_dv / min_bars and then
@@ -228,8 +145,7 @@ def auto_threshold(df: pd.DataFrame, min_bars: int) -> float:
     cand = max(1.0, 2 ** round(np.log2(max(cand, 1.0))))
     # Halve until we exceed min_bars (or we hit a floor).
     for _ in range(20):
-        bars = build_imbalance_bars(df, cand)
-        if len(bars) >= min_bars:
+        if count_imbalance_bars(dv, sign, cand) >= min_bars:
             return cand
         cand /= 2.0
         if cand < 1.0:
@@ -237,24 +153,18 @@ def auto_threshold(df: pd.DataFrame, min_bars: int) -> float:
     return cand
 
 
-def time_anchored_imbalance_ma(bars: list[dict], window_us: int) -> np.ndarray:
-    n = len(bars)
-    out = np.zeros(n, dtype=np.float64)
-    end_us = np.array([b["end_us"] for b in bars], dtype=np.int64)
-    buy = np.array([b["buy_dv"] for b in bars], dtype=np.float64)
-    sell = np.array([b["sell_dv"] for b in bars], dtype=np.float64)
-    cum_buy = np.concatenate([[0.0], np.cumsum(buy)])
-    cum_sell = np.concatenate([[0.0], np.cumsum(sell)])
-    j = 0
-    for i in range(n):
-        cutoff = end_us[i] - window_us
-        while j < n and end_us[j] <= cutoff:
-            j += 1
-        sb = cum_buy[i + 1] - cum_buy[j]
-        ss = cum_sell[i + 1] - cum_sell[j]
-        denom = sb + ss
-        out[i] = (sb - ss) / denom if denom > 0 else 0.0
-    return out
+def time_anchored_imbalance_ma(bars: dict[str, np.ndarray],
+                               window_us: int) -> np.ndarray:
+    end_us = bars["end_us"]
+    cum_buy = np.concatenate([[0.0], np.cumsum(bars["buy_dv"])])
+    cum_sell = np.concatenate([[0.0], np.cumsum(bars["sell_dv"])])
+    j = np.searchsorted(end_us, end_us - window_us, side="right")
+    i1 = np.arange(1, len(end_us) + 1)
+    sb = cum_buy[i1] - cum_buy[j]
+    ss = cum_sell[i1] - cum_sell[j]
+    denom = sb + ss
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denom > 0, (sb - ss) / denom, 0.0)
 
 
 def lookup_trip(trips_path: str, symbol: str, entry_us: int,
@@ -288,12 +198,17 @@ def parse_entry_us(entry_str: str) -> int:
 MA_LINE_COLORS = ["#1f77b4", "#9467bd", "#ff7f0e", "#2ca02c", "#d62728"]
 
 
-def plot(bars_full: list[dict], display_lo_us: int,
+def _fmt_dts(us: np.ndarray) -> np.ndarray:
+    return (pd.to_datetime(us, unit="us", utc=True)
+            .strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object))
+
+
+def plot(bars_full: dict[str, np.ndarray], display_lo_us: int,
          symbol: str, entry_us: int, trip: Optional[pd.Series],
          threshold: float, hours_before: float, hours_after: float,
          ma_windows_h: list[float],
          out_path: str, post_script: str) -> None:
-    if not bars_full:
+    if len(bars_full["dv"]) == 0:
         raise RuntimeError("no bars in window")
 
     # MAs run over the full fetched range so trailing windows are warmed
@@ -303,55 +218,51 @@ def plot(bars_full: list[dict], display_lo_us: int,
         imb_full.append(
             (w_h, time_anchored_imbalance_ma(bars_full, int(w_h * US_PER_HOUR))))
 
-    end_us_full = np.array([b["end_us"] for b in bars_full], dtype=np.int64)
-    first_idx = int(np.searchsorted(end_us_full, display_lo_us, side="left"))
-    bars = bars_full[first_idx:]
-    if not bars:
+    first_idx = int(np.searchsorted(bars_full["end_us"], display_lo_us, side="left"))
+    bars = slice_bars(bars_full, first_idx)
+    n = len(bars["dv"])
+    if n == 0:
         raise RuntimeError("display window contains no bars")
     imb_arrays = [(w, arr[first_idx:]) for (w, arr) in imb_full]
 
     # Re-base cum_dv to start at 0 within the display slice.
-    cum_dv_raw = np.array([b["cum_dv"] for b in bars])
-    base_cum = cum_dv_raw[0] - bars[0]["dv"]
-    cum_dv = cum_dv_raw - base_cum
-    vwap = np.array([b["vwap"] for b in bars])
-    durations = np.array([b["duration_s"] for b in bars])
-    buy_dv = np.array([b["buy_dv"] for b in bars])
-    sell_dv = np.array([b["sell_dv"] for b in bars])
-    total_dv = np.array([b["dv"] for b in bars])
-    bar_sign = np.array([b["bar_sign"] for b in bars])
-    end_us = np.array([b["end_us"] for b in bars], dtype=np.int64)
+    base_cum = bars["cum_dv"][0] - bars["dv"][0]
+    cum_dv = bars["cum_dv"] - base_cum
+    vwap = bars["vwap"]
+    durations = bars["duration_s"]
+    buy_dv = bars["buy_dv"]
+    sell_dv = bars["sell_dv"]
+    total_dv = bars["dv"]
+    bar_sign = bars["bar_sign"]
+    end_us = bars["end_us"]
     bar_colors = np.where(bar_sign > 0, "#26a69a", "#ef5350")
     widths = total_dv * 0.8
 
     # Per-bar tooltip metadata, attached to all primary traces so any
     # pane shows the same rich context. Imbalance bars carry an extra
     # bar_sign field (buy / sell).
-    def _fmt_dt(us: int) -> str:
-        return datetime.fromtimestamp(us / 1e6, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    customdata = [
-        [
-            i,                                  # 0  bar index
-            b["cum_dv"],                        # 1  cum $vol
-            b["dv"],                            # 2  bar $vol
-            b["vwap"],                          # 3  vwap
-            b["open"],                          # 4  open
-            b["high"],                          # 5  high
-            b["low"],                           # 6  low
-            b["close"],                         # 7  close
-            b["buy_dv"],                        # 8  buy $vol
-            b["sell_dv"],                       # 9  sell $vol
-            b["signed_dv"],                     # 10 signed $vol
-            (100.0 * b["signed_dv"] / b["dv"]) if b["dv"] > 0 else 0.0,
-                                                # 11 imbalance %
-            b["n_trades"],                      # 12 n trades
-            b["duration_s"],                    # 13 duration s
-            _fmt_dt(b["start_us"]),             # 14 start dt
-            _fmt_dt(b["end_us"]),               # 15 end dt
-            "buy" if b["bar_sign"] > 0 else "sell",  # 16 bar sign label
-        ]
-        for i, b in enumerate(bars)
-    ]
+    signed_dv = bars["signed_dv"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        imb_pct = np.where(total_dv > 0, 100.0 * signed_dv / total_dv, 0.0)
+    customdata = np.column_stack([
+        np.arange(n),                           # 0  bar index
+        bars["cum_dv"],                         # 1  cum $vol
+        total_dv,                               # 2  bar $vol
+        vwap,                                   # 3  vwap
+        bars["open"],                           # 4  open
+        bars["high"],                           # 5  high
+        bars["low"],                            # 6  low
+        bars["close"],                          # 7  close
+        buy_dv,                                 # 8  buy $vol
+        sell_dv,                                # 9  sell $vol
+        signed_dv,                              # 10 signed $vol
+        imb_pct,                                # 11 imbalance %
+        bars["n_trades"],                       # 12 n trades
+        durations,                              # 13 duration s
+        _fmt_dts(bars["start_us"]),             # 14 start dt
+        _fmt_dts(end_us),                       # 15 end dt
+        np.where(bar_sign > 0, "buy", "sell").astype(object),  # 16 bar sign label
+    ]).astype(object)
     bar_hover = (
         "<b>bar #%{customdata[0]} (%{customdata[16]})</b>  "
         "cum_dv $%{customdata[1]:,.0f}<br>"
@@ -370,10 +281,9 @@ def plot(bars_full: list[dict], display_lo_us: int,
 
     def cum_at(us: int) -> Optional[float]:
         idx = np.searchsorted(end_us, us, side="left")
-        if idx >= len(bars):
+        if idx >= n:
             return None
-        b = bars[idx]
-        return (b["cum_dv"] - b["dv"]) - base_cum
+        return (bars["cum_dv"][idx] - bars["dv"][idx]) - base_cum
 
     entry_x = cum_at(entry_us)
     exit_x = cum_at(int(trip.exit_us)) if trip is not None else None
@@ -386,7 +296,7 @@ def plot(bars_full: list[dict], display_lo_us: int,
                        f"bars_held(1m)={int(trip.bars_held)}")
     title = (f"{symbol} — entry {entry_dt:%Y-%m-%d %H:%M} UTC  "
              f"(imbalance bars, T=${threshold:,.0f}, "
-             f"±{hours_before:.0f}/{hours_after:.0f}h, n={len(bars)})"
+             f"±{hours_before:.0f}/{hours_after:.0f}h, n={n})"
              + title_extra)
 
     fig = make_subplots(
@@ -566,14 +476,14 @@ def main() -> int:
         print(f"  threshold = ${threshold:,.0f}")
 
     bars_full = build_imbalance_bars(df, threshold)
-    end_us_full = np.array([b["end_us"] for b in bars_full], dtype=np.int64)
-    first_idx = int(np.searchsorted(end_us_full, display_lo, side="left"))
-    bars_display = bars_full[first_idx:]
-    n_buy = sum(1 for b in bars_display if b["bar_sign"] > 0)
-    n_sell = len(bars_display) - n_buy
-    total_dv = sum(b["dv"] for b in bars_display)
-    print(f"  built {len(bars_full):,} bars total, "
-          f"{len(bars_display):,} in display "
+    first_idx = int(np.searchsorted(bars_full["end_us"], display_lo, side="left"))
+    bars_display = slice_bars(bars_full, first_idx)
+    n_display = len(bars_display["dv"])
+    n_buy = int((bars_display["bar_sign"] > 0).sum())
+    n_sell = n_display - n_buy
+    total_dv = float(bars_display["dv"].sum())
+    print(f"  built {len(bars_full['dv']):,} bars total, "
+          f"{n_display:,} in display "
           f"({n_buy:,} buy / {n_sell:,} sell)  "
           f"total displayed ${total_dv:,.0f}")
 
@@ -54,12 +54,23 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CHART_CONTROLS_JS = os.path.join(
     os.path.dirname(SCRIPT_DIR), "visualization", "chart_controls.js"
 )
+sys.path.insert(0, os.path.join(os.path.dirname(SCRIPT_DIR), "visualization"))
+from bars import dollar_bars, slice_bars  # noqa: E402
 DEFAULT_TAPE_ROOT = "/mnt/d/trading-edge-bulk/crypto/binance/perps"
 DEFAULT_TRIPS = "data/crypto/cumsum_z_persistexit/trips_th15_volratio_30d8h.csv"
 DEFAULT_OUT_DIR = "logs/charts/individual_trades"
 
 US_PER_HOUR = 3_600_000_000
 
+# Chart column name -> bars.py engine column name.
+BAR_COLUMNS = {
+    "dv": "volume", "vwap": "vwap",
+    "open": "open", "high": "high", "low": "low", "close": "close",
+    "start_us": "start_ts", "end_us": "end_ts", "duration_s": "duration_s",
+    "n_trades": "n_trades", "buy_dv": "buy_volume", "sell_dv": "sell_volume",
+    "signed_dv": "signed_volume", "cum_dv": "cum_volume",
+}
+
 
 def load_tape_window(tape_root: str, symbol: str,
                      t_lo_us: int, t_hi_us: int) -> pd.DataFrame:
@@ -89,104 +100,37 @@ def load_tape_window(tape_root: str, symbol: str,
     return df
 
 
-def build_dollar_bars(df: pd.DataFrame, dollar_per_bar: float) -> list[dict]:
+def build_dollar_bars(df: pd.DataFrame, dollar_per_bar: float) -> dict[str, np.ndarray]:
     """Equal-$volume bars from raw trades. Trades that overflow the bar
     threshold split: the partial fills the current bar, the remainder
-    rolls into the next bar at the same price/sign/timestamp."""
-    if len(df) == 0:
-        return []
-    p = df.price.to_numpy(dtype=np.float64)
-    q = df.quantity.to_numpy(dtype=np.float64)
-    t = df.timestamp_us.to_numpy(dtype=np.int64)
-    s = df.sign.to_numpy(dtype=np.float64)
-    dv = p * q  # dollar volume per trade
-
-    bars = []
-    cur = _empty()
-    for i in range(len(df)):
-        remaining_dv = dv[i]
-        price_i = p[i]
-        sign_i = s[i]
-        ts_i = int(t[i])
-        while remaining_dv > 0:
-            space = dollar_per_bar - cur["dv"]
-            if remaining_dv <= space:
-                _add(cur, price_i, remaining_dv, ts_i, sign_i)
-                remaining_dv = 0.0
-            else:
-                if space > 0:
-                    _add(cur, price_i, space, ts_i, sign_i)
-                    remaining_dv -= space
-                bars.append(_finalize(cur))
-                cur = _empty()
-    if cur["dv"] > 0:
-        bars.append(_finalize(cur))
-    cum = 0.0
-    for b in bars:
-        cum += b["dv"]
-        b["cum_dv"] = cum
-    return bars
-
-
-def _empty():
-    return {"prices": [], "dvs": [], "ts": [], "signs": [], "dv": 0.0}
-
-
-def _add(b, price, dv, ts, sign):
-    b["prices"].append(price)
-    b["dvs"].append(dv)
-    b["ts"].append(ts)
-    b["signs"].append(sign)
-    b["dv"] += dv
-
-
-def _finalize(bar):
-    prices = np.asarray(bar["prices"])
-    dvs = np.asarray(bar["dvs"])
-    signs = np.asarray(bar["signs"])
-    total = dvs.sum()
-    vwap = float((prices * dvs).sum() / total)
-    buy_dv = float(dvs[signs > 0].sum())
-    sell_dv = float(dvs[signs < 0].sum())
-    return {
-        "dv": float(total),
-        "vwap": vwap,
-        "open": float(prices[0]),
-        "high": float(prices.max()),
-        "low": float(prices.min()),
-        "close": float(prices[-1]),
-        "start_us": int(bar["ts"][0]),
-        "end_us": int(bar["ts"][-1]),
-        "duration_s": (bar["ts"][-1] - bar["ts"][0]) / 1e6,
-        "n_trades": len(prices),
-        "buy_dv": buy_dv,
-        "sell_dv": sell_dv,
-        "signed_dv": buy_dv - sell_dv,
-    }
-
-
-def time_anchored_imbalance_ma(bars: list[dict], window_us: int) -> np.ndarray:
+    rolls into the next bar at the same price/sign/timestamp.
+
+    Built by the shared engine (scripts/visualization/bars.py) and
+    returned as a struct-of-arrays dict, one entry per bar in each
+    column: dv, vwap, open, high, low, close, start_us, end_us,
+    duration_s, n_trades, buy_dv, sell_dv, signed_dv, cum_dv.
+    """
+    b = dollar_bars(df.price.to_numpy(), df.quantity.to_numpy(),
+                    df.timestamp_us.to_numpy(dtype=np.int64), dollar_per_bar,
+                    side=df.sign.to_numpy(), ts_per_second=1e6)
+    return {new: b[old] for new, old in BAR_COLUMNS.items()}
+
+
+def time_anchored_imbalance_ma(bars: dict[str, np.ndarray],
+                               window_us: int) -> np.ndarray:
     """For each bar, compute (sum_buy - sum_sell)/(sum_buy + sum_sell)
     over all bars whose end_us falls in (current.end_us - window_us,
-    current.end_us]. Two-pointer sweep, O(n)."""
-    n = len(bars)
-    out = np.zeros(n, dtype=np.float64)
-    end_us = np.array([b["end_us"] for b in bars], dtype=np.int64)
-    buy = np.array([b["buy_dv"] for b in bars], dtype=np.float64)
-    sell = np.array([b["sell_dv"] for b in bars], dtype=np.float64)
-    cum_buy = np.concatenate([[0.0], np.cumsum(buy)])
-    cum_sell = np.concatenate([[0.0], np.cumsum(sell)])
-
-    j = 0
-    for i in range(n):
-        cutoff = end_us[i] - window_us
-        while j < n and end_us[j] <= cutoff:
-            j += 1
-        sb = cum_buy[i + 1] - cum_buy[j]
-        ss = cum_sell[i + 1] - cum_sell[j]
-        denom = sb + ss
-        out[i] = (sb - ss) / denom if denom > 0 else 0.0
-    return out
+    current.end_us]. Prefix sums + one searchsorted, O(n log n)."""
+    end_us = bars["end_us"]
+    cum_buy = np.concatenate([[0.0], np.cumsum(bars["buy_dv"])])
+    cum_sell = np.concatenate([[0.0], np.cumsum(bars["sell_dv"])])
+    j = np.searchsorted(end_us, end_us - window_us, side="right")
+    i1 = np.arange(1, len(end_us) + 1)
+    sb = cum_buy[i1] - cum_buy[j]
+    ss = cum_sell[i1] - cum_sell[j]
+    denom = sb + ss
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denom > 0, (sb - ss) / denom, 0.0)
 
 
 def lookup_trip(trips_path: str, symbol: str,
@@ -225,12 +169,17 @@ def parse_entry_us(entry_str: str) -> int:
 MA_LINE_COLORS = ["#1f77b4", "#9467bd", "#ff7f0e", "#2ca02c", "#d62728"]
 
 
-def plot(bars_full: list[dict], display_lo_us: int,
+def _fmt_dts(us: np.ndarray) -> np.ndarray:
+    return (pd.to_datetime(us, unit="us", utc=True)
+            .strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object))
+
+
+def plot(bars_full: dict[str, np.ndarray], display_lo_us: int,
          symbol: str, entry_us: int, trip: Optional[pd.Series],
          dollar_per_bar: float, hours_before: float, hours_after: float,
          ma_windows_h: list[float],
          out_path: str, post_script: str) -> None:
-    if not bars_full:
+    if len(bars_full["dv"]) == 0:
         raise RuntimeError("no bars in window")
 
     # MAs run over the full fetched range so trailing windows are warmed
@@ -242,55 +191,52 @@ def plot(bars_full: list[dict], display_lo_us: int,
 
     # Slice display window. Bar k is "in window" if its end_us crosses
     # display_lo_us (so the bar straddling the boundary is included).
-    end_us_full = np.array([b["end_us"] for b in bars_full], dtype=np.int64)
-    first_idx = int(np.searchsorted(end_us_full, display_lo_us, side="left"))
-    bars = bars_full[first_idx:]
-    if not bars:
+    first_idx = int(np.searchsorted(bars_full["end_us"], display_lo_us, side="left"))
+    bars = slice_bars(bars_full, first_idx)
+    n = len(bars["dv"])
+    if n == 0:
         raise RuntimeError("display window contains no bars")
     imb_arrays = [(w, arr[first_idx:]) for (w, arr) in imb_full]
 
     # Re-base cum_dv to start at 0 within the display slice (so the
     # x-axis is a reasonable range). The pane labels still call this
     # 'cumulative $volume' which is true for the displayed slice.
-    cum_dv_raw = np.array([b["cum_dv"] for b in bars])
-    base_cum = cum_dv_raw[0] - bars[0]["dv"]
-    cum_dv = cum_dv_raw - base_cum
-    vwap = np.array([b["vwap"] for b in bars])
-    durations = np.array([b["duration_s"] for b in bars])
-    signed_dv = np.array([b["signed_dv"] for b in bars])
-    buy_dv = np.array([b["buy_dv"] for b in bars])
-    sell_dv = np.array([b["sell_dv"] for b in bars])
-    end_us = np.array([b["end_us"] for b in bars], dtype=np.int64)
+    base_cum = bars["cum_dv"][0] - bars["dv"][0]
+    cum_dv = bars["cum_dv"] - base_cum
+    vwap = bars["vwap"]
+    durations = bars["duration_s"]
+    signed_dv = bars["signed_dv"]
+    buy_dv = bars["buy_dv"]
+    sell_dv = bars["sell_dv"]
+    end_us = bars["end_us"]
 
     # Bar widths for the price/signed/vol bars: 80% of the bar's $ volume.
-    widths = np.array([b["dv"] for b in bars]) * 0.8
+    widths = bars["dv"] * 0.8
 
     # Per-bar tooltip metadata, attached to all primary traces so any
     # pane shows the same rich context.
-    def _fmt_dt(us: int) -> str:
-        return datetime.fromtimestamp(us / 1e6, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    customdata = [
-        [
-            i,                                  # 0  bar index
-            b["cum_dv"],                        # 1  cum $vol
-            b["dv"],                            # 2  bar $vol
-            b["vwap"],                          # 3  vwap
-            b["open"],                          # 4  open
-            b["high"],                          # 5  high
-            b["low"],                           # 6  low
-            b["close"],                         # 7  close
-            b["buy_dv"],                        # 8  buy $vol
-            b["sell_dv"],                       # 9  sell $vol
-            b["signed_dv"],                     # 10 signed $vol
-            (100.0 * b["signed_dv"] / b["dv"]) if b["dv"] > 0 else 0.0,
-                                                # 11 imbalance %
-            b["n_trades"],                      # 12 n trades
-            b["duration_s"],                    # 13 duration s
-            _fmt_dt(b["start_us"]),             # 14 start dt
-            _fmt_dt(b["end_us"]),               # 15 end dt
-        ]
-        for i, b in enumerate(bars)
-    ]
+    dv = bars["dv"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        imb_pct = np.where(dv > 0, 100.0 * signed_dv / dv, 0.0)
+    customdata = np.column_stack([
+        np.arange(n),                           # 0  bar index
+        bars["cum_dv"],                         # 1  cum $vol
+        dv,                                     # 2  bar $vol
+        vwap,                                   # 3  vwap
+        bars["open"],                           # 4  open
+        bars["high"],                           # 5  high
+        bars["low"],                            # 6  low
+        bars["close"],                          # 7  close
+        buy_dv,                                 # 8  buy $vol
+        sell_dv,                                # 9  sell $vol
+        signed_dv,                              # 10 signed $vol
+        imb_pct,                                # 11 imbalance %
+        bars["n_trades"],                       # 12 n trades
+        durations,                              # 13 duration s
+        _fmt_dts(bars["start_us"]),             # 14 start dt
+        _fmt_dts(end_us),                       # 15 end dt
+    ]).astype(object)
+
     bar_hover = (
         "<b>bar #%{customdata[0]}</b>  cum_dv $%{customdata[1]:,.0f}<br>"
         "<b>%{customdata[14]}</b> → %{customdata[15]}<br>"
@@ -312,10 +258,9 @@ def plot(bars_full: list[dict], display_lo_us: int,
     # Returns rebased cum_dv (matches the x-axis values plotted above).
     def cum_at(us: int) -> Optional[float]:
         idx = np.searchsorted(end_us, us, side="left")
-        if idx >= len(bars):
+        if idx >= n:
             return None
-        b = bars[idx]
-        return (b["cum_dv"] - b["dv"]) - base_cum
+        return (bars["cum_dv"][idx] - bars["dv"][idx]) - base_cum
 
     entry_x = cum_at(entry_us)
     if trip is not None:
@@ -501,13 +446,13 @@ def main() -> int:
         return 1
 
     bars_full = build_dollar_bars(df, args.dollar_per_bar)
-    total_dv = sum(b["dv"] for b in bars_full)
+    total_dv = float(bars_full["dv"].sum())
     # Slice to the display window AFTER the MAs are computed so pre-roll
     # bars (used only to warm the trailing MAs) don't appear on the chart.
     # Note: the cum_dv x-axis is recomputed within the displayed slice so
     # bars start at 0 on the left edge of the chart, while MAs reflect
     # accumulated history outside the display.
-    print(f"  built {len(bars_full):,} bars at ${args.dollar_per_bar:,.0f}/bar  "
+    print(f"  built {len(bars_full['dv']):,} bars at ${args.dollar_per_bar:,.0f}/bar  "
           f"(total ${total_dv:,.0f})")
 
     trip = lookup_trip(trips_path, args.symbol, entry_us)
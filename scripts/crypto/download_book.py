@@ -4,6 +4,14 @@ Wraps lakeapi.load_data, slicing the requested date range into single-day
 windows and writing each to a parquet on /mnt/d. Atomic .tmp + os.replace so
 power loss or interrupt can resume without corruption. Skip-if-exists.
 
+Every (table, exchange, symbol, day) is one job. Jobs run on a bounded thread
+pool (--workers); each worker keeps its own boto3 session / S3 filesystem for
+all the jobs it runs, and a shared token bucket caps total bandwidth
+(--max-mbps). Transient failures are retried with exponential backoff. Job
+outcomes are appended to a JSON-lines manifest under the output root, so a
+killed run resumes where it stopped and days Lake does not have (miss /
+empty) are not re-requested (--retry-missing to override).
+
 book schema (passed through from Lake, with light reshaping):
   timestamp_us       int64    -- origin_time as microseconds since epoch
   received_time_us   int64    -- received_time as microseconds since epoch
@@ -38,18 +46,30 @@ Usage (paid bucket, book_delta_v2 — raw S3, bypasses lakeapi):
     python scripts/crypto/download_book.py --paid --table book_delta_v2 \\
         --symbol BTC-USDT-PERP --exchange BINANCE_FUTURES \\
         --start-date 2026-01-31 --end-date 2026-01-31
+
+Usage (paid bucket, whole universe from lake_universe.py, two tables):
+    python scripts/crypto/download_book.py --paid \\
+        --universe data/crypto/lake_book_universe.json --table book book_delta_v2 \\
+        --start-date 2024-05-01 --end-date 2026-04-30 --workers 16 --max-mbps 400
 """
 
 from __future__ import annotations
 
 import argparse
 import datetime as dt
+import json
 import os
+import queue
+import random
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
 
 import boto3
 import lakeapi
+import numpy as np
 import pandas as pd
 import pyarrow as pa
 import pyarrow.fs as pafs
@@ -60,6 +80,12 @@ import pyarrow.parquet as pq
 # prefix, which is empty). We fetch directly from the bucket.
 DELTA_V2_BUCKET = "qnt.data"
 DELTA_V2_PREFIX = "market-data/cryptofeed/book_delta_v2"
+DELTA_V2_REGION = "eu-west-1"
+
+# Manifest statuses for days Lake has nothing for; not re-requested unless
+# --retry-missing. 'ok' jobs are skipped by the output file itself and
+# 'fail' jobs always rerun.
+MISSING_STATUSES = {"miss", "empty"}
 
 
 def _to_us(series: pd.Series) -> pd.Series:
@@ -104,59 +130,243 @@ def _delta_v2_s3_key(exchange: str, symbol: str, date: dt.date) -> str:
     )
 
 
+DELTA_V2_OUT_SCHEMA = pa.schema([
+    pa.field("timestamp_us", pa.int64()),
+    pa.field("received_time_us", pa.int64()),
+    pa.field("sequence_number", pa.int64()),
+    pa.field("side_is_bid", pa.bool_()),
+    pa.field("price", pa.float64()),
+    pa.field("size", pa.float64()),
+])
+DELTA_V2_SRC_COLUMNS = ["timestamp", "receipt_timestamp", "sequence_number",
+                        "side_is_bid", "price", "size"]
+
+# Default per-download memory budget for the row-group pipeline, and the
+# row-group size used with rechunk.
+DELTA_V2_MEMORY_BUDGET = 1 << 30
+DELTA_V2_ROW_GROUP_ROWS = 1_000_000
+
+# Batches in flight: up to 2 queued per hand-off plus one held by each of
+# the reader, converter and writer.
+_PIPELINE_QUEUE = 2
+_PIPELINE_SLOTS = 2 * _PIPELINE_QUEUE + 3
+
+_DONE = object()
+
+
+def _convert_delta_v2(tbl: pa.Table) -> pa.Table:
+    """Raw book_delta_v2 columns -> DELTA_V2_OUT_SCHEMA."""
+    # ns -> us via int64 floor div on the already-int64 columns.
+    ts_us = pa.compute.divide(tbl["timestamp"], 1000)
+    rcv_us = pa.compute.divide(tbl["receipt_timestamp"], 1000)
+    return pa.Table.from_arrays(
+        [
+            ts_us.cast(pa.int64()),
+            rcv_us.cast(pa.int64()),
+            tbl["sequence_number"].cast(pa.int64()),
+            tbl["side_is_bid"].cast(pa.bool_()),
+            tbl["price"].cast(pa.float64()),
+            tbl["size"].cast(pa.float64()),
+        ],
+        schema=DELTA_V2_OUT_SCHEMA,
+    )
+
+
+def _row_group_batches(md: pq.FileMetaData, memory_budget: int) -> list[list[int]]:
+    """Split the file's row groups into consecutive read batches sized so
+    that _PIPELINE_SLOTS decoded batches fit in `memory_budget` bytes."""
+    n = md.num_row_groups
+    if n == 0:
+        return []
+    avg = max(1, sum(md.row_group(i).total_byte_size for i in range(n)) // n)
+    per = max(1, memory_budget // _PIPELINE_SLOTS // avg)
+    return [list(range(lo, min(lo + per, n))) for lo in range(0, n, per)]
+
+
+def _timestamp_watermarks(md: pq.FileMetaData, batches: list[list[int]]) -> list[int] | None:
+    """For each batch, the smallest source timestamp (ns) of any later
+    batch, from the row-group statistics; None if the file has no stats.
+    Rows older than a batch's watermark cannot be preceded by later rows."""
+    col = md.schema.names.index("timestamp")
+    mins = []
+    for i in range(md.num_row_groups):
+        st = md.row_group(i).column(col).statistics
+        if st is None or not st.has_min_max:
+            return None
+        mins.append(st.min)
+    out, later = [], None
+    for batch in reversed(batches):
+        out.append(later)
+        m = min(mins[i] for i in batch)
+        later = m if later is None else min(later, m)
+    return out[::-1]
+
+
+class _SortedRechunker:
+    """Writer stage for --rechunk: re-emit the stream as uniform
+    `row_group_rows` row groups sorted by timestamp_us.
+
+    Rows stay buffered until the source's row-group statistics say nothing
+    later can sort before them (`release(watermark_us)`), then go out in
+    stable timestamp order. Near-sorted sources keep the buffer to about one
+    batch plus one output row group.
+    """
+
+    def __init__(self, writer: pq.ParquetWriter, row_group_rows: int):
+        self.writer = writer
+        self.rows = row_group_rows
+        self.pending: list[pa.Table] = []   # unsorted, not yet releasable
+        self.ready: list[pa.Table] = []     # sorted, waiting for a full row group
+        self.n_ready = 0
+
+    def add(self, tbl: pa.Table, watermark_us: int | None) -> None:
+        self.pending.append(tbl)
+        if watermark_us is not None:
+            self._release(watermark_us)
+
+    def _release(self, watermark_us: int | None) -> None:
+        buf = pa.concat_tables(self.pending)
+        buf = buf.take(pa.compute.sort_indices(buf, [("timestamp_us", "ascending")]))
+        if watermark_us is None:
+            cut = buf.num_rows
+        else:
+            cut = int(np.searchsorted(buf["timestamp_us"].to_numpy(), watermark_us, side="left"))
+        self.pending = [buf.slice(cut)] if cut < buf.num_rows else []
+        if cut:
+            self.ready.append(buf.slice(0, cut))
+            self.n_ready += cut
+        while self.n_ready >= self.rows:
+            self._write(self.rows)
+
+    def _write(self, n: int) -> None:
+        out = pa.concat_tables(self.ready)
+        self.writer.write_table(out.slice(0, n), row_group_size=n)
+        rest = out.slice(n)
+        self.ready = [rest] if rest.num_rows else []
+        self.n_ready = rest.num_rows
+
+    def close(self) -> None:
+        if self.pending:
+            self._release(None)
+        if self.n_ready:
+            self._write(self.n_ready)
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> None:
+    """Blocking put that gives up once `stop` is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _drain(q: queue.Queue, stop: threading.Event):
+    """Yield items from `q` until _DONE or `stop`; re-raise a handed-on
+    exception."""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _pipeline_stage(fn, items, out_q: queue.Queue, stop: threading.Event) -> None:
+    """Run `fn` over `items`, handing results to the bounded `out_q`, then
+    _DONE. An exception is handed on in place of a result."""
+    try:
+        for item in items:
+            if stop.is_set():
+                return
+            _put(out_q, fn(item), stop)
+        _put(out_q, _DONE, stop)
+    except BaseException as e:  # re-raised by the consumer
+        _put(out_q, e, stop)
+
+
 def _download_delta_v2(
-    fs: pafs.S3FileSystem, exchange: str, symbol: str, date: dt.date, out_path: str
+    fs: pafs.S3FileSystem, exchange: str, symbol: str, date: dt.date, out_path: str,
+    limiter: "_RateLimiter | None" = None,
+    memory_budget: int = DELTA_V2_MEMORY_BUDGET,
+    rechunk_rows: int | None = None,
 ) -> int:
     """Stream the day's book_delta_v2 parquet from S3, normalise the schema,
-    and write atomically. Streams row-group at a time to keep peak RSS bounded
-    (a full day decompresses to ~5 GB, which OOMs a 16 GB box).
-    Returns row count."""
+    and write atomically. Returns row count.
+
+    A full day decompresses to ~5 GB, which OOMs a 16 GB box, so the file is
+    streamed in batches of row groups through a three-stage pipeline: a
+    reader thread fetches and decodes batches ahead (charging each batch's
+    compressed size to `limiter`), a converter thread normalises them, and
+    this thread drains them into the ParquetWriter. Network, decode and zstd
+    encode overlap; batches are sized so the decoded data in flight stays
+    within `memory_budget` bytes.
+
+    With `rechunk_rows`, output is re-chunked into uniform row groups of that
+    many rows sorted by timestamp_us (see _SortedRechunker); otherwise each
+    batch is written as it comes. Sorting relies on the source's row-group
+    timestamp statistics to release rows early; a file without them is
+    buffered whole before it is written.
+    """
     key = f"{DELTA_V2_BUCKET}/{_delta_v2_s3_key(exchange, symbol, date)}"
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     tmp = out_path + ".tmp"
     if os.path.exists(tmp):
         os.remove(tmp)
 
-    out_schema = pa.schema([
-        pa.field("timestamp_us", pa.int64()),
-        pa.field("received_time_us", pa.int64()),
-        pa.field("sequence_number", pa.int64()),
-        pa.field("side_is_bid", pa.bool_()),
-        pa.field("price", pa.float64()),
-        pa.field("size", pa.float64()),
-    ])
-
     n_rows = 0
-    # The on-disk parquet has thousands of tiny row groups (~10 k rows each).
-    # Read in batches of N row groups so each batch is sizable enough to
-    # amortise per-batch overhead but small enough to fit in RAM.
     with fs.open_input_file(key) as src:
         pf = pq.ParquetFile(src)
-        with pq.ParquetWriter(tmp, out_schema, compression="zstd", compression_level=3) as writer:
-            BATCH = 64
-            for start in range(0, pf.num_row_groups, BATCH):
-                stop = min(start + BATCH, pf.num_row_groups)
-                tbl = pf.read_row_groups(
-                    list(range(start, stop)),
-                    columns=["timestamp", "receipt_timestamp", "sequence_number",
-                             "side_is_bid", "price", "size"],
-                )
-                # ns -> us via int64 floor div on the already-int64 columns.
-                ts_us = pa.compute.divide(tbl["timestamp"], 1000)
-                rcv_us = pa.compute.divide(tbl["receipt_timestamp"], 1000)
-                out_tbl = pa.Table.from_arrays(
-                    [
-                        ts_us.cast(pa.int64()),
-                        rcv_us.cast(pa.int64()),
-                        tbl["sequence_number"].cast(pa.int64()),
-                        tbl["side_is_bid"].cast(pa.bool_()),
-                        tbl["price"].cast(pa.float64()),
-                        tbl["size"].cast(pa.float64()),
-                    ],
-                    schema=out_schema,
-                )
-                writer.write_table(out_tbl)
-                n_rows += out_tbl.num_rows
+        # The on-disk parquet has thousands of tiny row groups (~10 k rows
+        # each); batching them amortises per-read overhead.
+        batches = _row_group_batches(pf.metadata, memory_budget)
+        watermarks = _timestamp_watermarks(pf.metadata, batches) if rechunk_rows else None
+
+        def read(i):
+            if limiter is not None:
+                limiter.consume(sum(pf.metadata.row_group(g).total_compressed_size
+                                    for g in batches[i]))
+            return i, pf.read_row_groups(batches[i], columns=DELTA_V2_SRC_COLUMNS)
+
+        def convert(item):
+            i, tbl = item
+            return i, _convert_delta_v2(tbl)
+
+        stop = threading.Event()
+        raw_q: queue.Queue = queue.Queue(maxsize=_PIPELINE_QUEUE)
+        out_q: queue.Queue = queue.Queue(maxsize=_PIPELINE_QUEUE)
+        threads = [
+            threading.Thread(target=_pipeline_stage, daemon=True,
+                             args=(read, range(len(batches)), raw_q, stop)),
+            threading.Thread(target=_pipeline_stage, daemon=True,
+                             args=(convert, _drain(raw_q, stop), out_q, stop)),
+        ]
+        for t in threads:
+            t.start()
+        try:
+            with pq.ParquetWriter(tmp, DELTA_V2_OUT_SCHEMA,
+                                  compression="zstd", compression_level=3) as writer:
+                rechunker = _SortedRechunker(writer, rechunk_rows) if rechunk_rows else None
+                for i, out_tbl in _drain(out_q, stop):
+                    if rechunker is None:
+                        writer.write_table(out_tbl)
+                    else:
+                        wm = watermarks[i] if watermarks is not None else None
+                        rechunker.add(out_tbl, None if wm is None else wm // 1000)
+                    n_rows += out_tbl.num_rows
+                if rechunker is not None:
+                    rechunker.close()
+        finally:
+            # Stages poll `stop`, so on an error here they exit within a
+            # queue timeout (after any read already in flight).
+            stop.set()
+            for t in threads:
+                t.join()
 
     os.replace(tmp, out_path)
     return n_rows
@@ -169,18 +379,199 @@ def _date_range(start: dt.date, end: dt.date):
         d = d + dt.timedelta(days=1)
 
 
+class Job(NamedTuple):
+    table: str
+    exchange: str
+    symbol: str
+    date: dt.date
+
+    @property
+    def key(self) -> str:
+        return f"{self.table}/{self.exchange}/{self.symbol}/{self.date.isoformat()}"
+
+
+class _RateLimiter:
+    """Token bucket shared by all workers. `consume(n)` books n bytes against
+    the cap and sleeps until the bucket has paid them back, allowing
+    `burst_s` seconds of backlog before anyone waits. rate=None disables it."""
+
+    def __init__(self, bytes_per_s: float | None, burst_s: float = 1.0):
+        self.rate = bytes_per_s
+        self.burst_s = burst_s
+        self._free_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n_bytes: int) -> None:
+        if not self.rate or n_bytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._free_at = max(self._free_at, now) + n_bytes / self.rate
+            wait = self._free_at - now - self.burst_s
+        if wait > 0:
+            time.sleep(wait)
+
+
+class JobManifest:
+    """Append-only JSON-lines log of job outcomes, one object per attempt
+    outcome; the last line for a job wins. A torn last line (killed
+    mid-write) is ignored on load."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records[rec["key"]] = rec
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(path, "a")
+        self._lock = threading.Lock()
+
+    def status(self, job: Job) -> str | None:
+        rec = self.records.get(job.key)
+        return rec["status"] if rec else None
+
+    def record(self, job: Job, status: str, **fields) -> None:
+        rec = {"key": job.key, "status": status, **fields,
+               "at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")}
+        with self._lock:
+            self.records[job.key] = rec
+            self._f.write(json.dumps(rec) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _EmptyDay(Exception):
+    """lakeapi returned no rows for the day."""
+
+
+class _Connections(threading.local):
+    """Per-worker boto3 session and S3 filesystem, created on the worker's
+    first job and reused for every later one (boto3 sessions are not
+    thread-safe, so they are never shared)."""
+
+    def __init__(self, paid: bool, aws_profile: str):
+        self.paid = paid
+        self.aws_profile = aws_profile
+        self._session = None
+        self._fs = None
+
+    @property
+    def session(self):
+        if self.paid and self._session is None:
+            self._session = boto3.Session(profile_name=self.aws_profile)
+        return self._session
+
+    @property
+    def delta_fs(self) -> pafs.S3FileSystem:
+        if self._fs is None:
+            creds = self.session.get_credentials().get_frozen_credentials()
+            self._fs = pafs.S3FileSystem(
+                access_key=creds.access_key,
+                secret_key=creds.secret_key,
+                session_token=creds.token,
+                region=DELTA_V2_REGION,
+            )
+        return self._fs
+
+
+def _remove_tmp(out_path: str) -> None:
+    try:
+        if os.path.exists(out_path + ".tmp"):
+            os.remove(out_path + ".tmp")
+    except OSError:
+        pass
+
+
+def _fetch_day(job: Job, out_path: str, conns: _Connections, limiter: _RateLimiter,
+               use_cache: bool, delta_kwargs: dict) -> int:
+    """Download one job's day to `out_path`. Returns row count; raises
+    FileNotFoundError / _EmptyDay when Lake has nothing for the day.
+    `delta_kwargs` go to _download_delta_v2."""
+    if job.table == "book_delta_v2":
+        return _download_delta_v2(conns.delta_fs, job.exchange, job.symbol, job.date,
+                                  out_path, limiter, **delta_kwargs)
+
+    # lakeapi treats end as exclusive midnight, so request [d, d+1).
+    df = lakeapi.load_data(
+        table=job.table,
+        start=dt.datetime.combine(job.date, dt.time.min),
+        end=dt.datetime.combine(job.date + dt.timedelta(days=1), dt.time.min),
+        symbols=[job.symbol],
+        exchanges=[job.exchange],
+        cached=use_cache,
+        boto3_session=conns.session,
+    )
+    if df is None or len(df) == 0:
+        raise _EmptyDay()
+    _write_day_parquet(df, out_path)
+    # lakeapi downloads internally, so charge the written size: same order
+    # as the compressed bytes fetched.
+    limiter.consume(os.path.getsize(out_path))
+    return len(df)
+
+
+def _run_job(job: Job, out_path: str, conns: _Connections, limiter: _RateLimiter,
+             retries: int, backoff_s: float, use_cache: bool, delta_kwargs: dict) -> dict:
+    """Run one job with retry + exponential backoff (with jitter) on
+    transient errors. Returns the manifest fields, including 'status'."""
+    attempt = 0
+    while True:
+        attempt += 1
+        t0 = time.time()
+        try:
+            n_rows = _fetch_day(job, out_path, conns, limiter, use_cache, delta_kwargs)
+        except FileNotFoundError as e:
+            _remove_tmp(out_path)
+            return {"status": "miss", "attempts": attempt, "error": str(e)}
+        except _EmptyDay:
+            _remove_tmp(out_path)
+            return {"status": "empty", "attempts": attempt}
+        except Exception as e:
+            _remove_tmp(out_path)
+            if attempt > retries:
+                return {"status": "fail", "attempts": attempt,
+                        "error": f"{type(e).__name__}: {e}"}
+            time.sleep(backoff_s * 2 ** (attempt - 1) * (0.5 + random.random()))
+            continue
+        return {"status": "ok", "attempts": attempt, "rows": n_rows,
+                "bytes": os.path.getsize(out_path), "seconds": round(time.time() - t0, 1)}
+
+
+def _universe_targets(path: str, top: int | None) -> list[tuple[str, str]]:
+    """(exchange, lake symbol) pairs from a lake_universe.py manifest, which is
+    already sorted by day count, optionally cut to the first `top`."""
+    with open(path) as f:
+        entries = json.load(f)
+    if top:
+        entries = entries[:top]
+    return [(e["exchange"], e["symbol_lake"]) for e in entries]
+
+
 def main() -> int:
     p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-    p.add_argument("--symbol", required=True,
-                   help="Crypto Lake symbol, hyphenated (e.g. BTC-USDT, BTCUSDT-PERP).")
+    p.add_argument("--symbol", nargs="+", default=[],
+                   help="Crypto Lake symbol(s), hyphenated (e.g. BTC-USDT, BTCUSDT-PERP).")
+    p.add_argument("--universe",
+                   help="lake_universe.py JSON; adds every (exchange, symbol) it lists.")
+    p.add_argument("--top", type=int, default=None,
+                   help="With --universe, keep only the first N symbols (most days first).")
     p.add_argument("--exchange", default="BINANCE_FUTURES",
-                   help="Exchange tag. Default BINANCE_FUTURES. Sample mode requires BINANCE for book.")
+                   help="Exchange tag for --symbol. Default BINANCE_FUTURES. Sample mode requires BINANCE for book.")
     p.add_argument("--start-date", required=True, help="Inclusive YYYY-MM-DD.")
     p.add_argument("--end-date", required=True, help="Inclusive YYYY-MM-DD.")
-    p.add_argument("--table", default="book",
+    p.add_argument("--table", nargs="+", default=["book"],
                    choices=["book", "book_delta", "book_delta_v2", "book_1m", "trades", "level_1",
                             "candles", "funding", "open_interest", "liquidations"],
-                   help="Lake table. Default: book. 'book_delta_v2' uses raw S3 (bypasses lakeapi).")
+                   help="Lake table(s). Default: book. 'book_delta_v2' uses raw S3 (bypasses lakeapi).")
     p.add_argument("--output-dir", default="/mnt/d/trading-edge-bulk/crypto/lake",
                    help="Output root. Files land at {root}/{table}/{exchange}/{symbol}/{date}.parquet.")
     p.add_argument("--paid", action="store_true",
@@ -189,28 +580,47 @@ def main() -> int:
                    help="Named AWS profile to use in --paid mode. Default: 'crypto-lake'.")
     p.add_argument("--use-cache", action="store_true",
                    help="Let lakeapi use its .lake_cache directory. Default off — we cache as parquet ourselves.")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Concurrent downloads (one S3 connection set each). Default 1.")
+    p.add_argument("--max-mbps", type=float, default=None,
+                   help="Global bandwidth cap across workers, MB/s of compressed data. Default: none.")
+    p.add_argument("--retries", type=int, default=3,
+                   help="Retries per job on transient errors, with exponential backoff. Default 3.")
+    p.add_argument("--backoff", type=float, default=2.0,
+                   help="Initial retry backoff in seconds (doubles per attempt). Default 2.")
+    p.add_argument("--manifest", default=None,
+                   help="Job manifest (JSON lines). Default: {output-dir}/.download_book.jsonl.")
+    p.add_argument("--retry-missing", action="store_true",
+                   help="Re-request days the manifest records as missing or empty.")
+    p.add_argument("--memory-budget-mb", type=int, default=DELTA_V2_MEMORY_BUDGET >> 20,
+                   help="book_delta_v2: decoded data in flight per download, MB. "
+                        f"Default {DELTA_V2_MEMORY_BUDGET >> 20}.")
+    p.add_argument("--rechunk", action="store_true",
+                   help="book_delta_v2: rewrite into uniform row groups sorted by timestamp_us.")
+    p.add_argument("--row-group-rows", type=int, default=DELTA_V2_ROW_GROUP_ROWS,
+                   help=f"Rows per row group with --rechunk. Default {DELTA_V2_ROW_GROUP_ROWS:,}.")
     args = p.parse_args()
 
-    boto_session = None
-    delta_fs = None
+    targets = [(args.exchange, s) for s in args.symbol]
+    if args.universe:
+        targets += _universe_targets(args.universe, args.top)
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        print("give --symbol and/or --universe", file=sys.stderr)
+        return 2
+    if args.workers < 1:
+        print(f"--workers must be >= 1, got {args.workers}", file=sys.stderr)
+        return 2
+
     if not args.paid:
-        if args.table == "book_delta_v2":
+        if "book_delta_v2" in args.table:
             print("--table book_delta_v2 requires --paid (no sample-bucket equivalent)",
                   file=sys.stderr)
             return 2
         lakeapi.use_sample_data(anonymous_access=True)
         print("Mode: free sample bucket (anonymous access)", file=sys.stderr)
     else:
-        boto_session = boto3.Session(profile_name=args.aws_profile)
         print(f"Mode: paid bucket (boto3 profile={args.aws_profile!r})", file=sys.stderr)
-        if args.table == "book_delta_v2":
-            creds = boto_session.get_credentials().get_frozen_credentials()
-            delta_fs = pafs.S3FileSystem(
-                access_key=creds.access_key,
-                secret_key=creds.secret_key,
-                session_token=creds.token,
-                region="eu-west-1",
-            )
 
     start = dt.date.fromisoformat(args.start_date)
     end = dt.date.fromisoformat(args.end_date)
@@ -218,83 +628,69 @@ def main() -> int:
         print(f"start ({start}) > end ({end})", file=sys.stderr)
         return 2
 
-    output_root = os.path.join(args.output_dir, args.table)
+    manifest = JobManifest(args.manifest or os.path.join(args.output_dir, ".download_book.jsonl"))
+    skip_statuses = set() if args.retry_missing else MISSING_STATUSES
+
+    n_done = n_skip = n_miss = n_fail = 0
+    pending: list[tuple[Job, str]] = []
+    for table in args.table:
+        output_root = os.path.join(args.output_dir, table)
+        for exchange, symbol in targets:
+            for d in _date_range(start, end):
+                job = Job(table, exchange, symbol, d)
+                out_path = _output_path(output_root, exchange, symbol, d)
+                if os.path.exists(out_path) or manifest.status(job) in skip_statuses:
+                    n_skip += 1
+                    continue
+                pending.append((job, out_path))
+    print(f"{len(pending):,} jobs to run ({n_skip:,} already done) over "
+          f"{len(targets)} symbol(s) x {len(args.table)} table(s), {args.workers} worker(s)",
+          file=sys.stderr)
 
-    n_done = n_skip = n_fail = 0
+    delta_kwargs = {"memory_budget": args.memory_budget_mb << 20,
+                    "rechunk_rows": args.row_group_rows if args.rechunk else None}
+    conns = _Connections(args.paid, args.aws_profile)
+    limiter = _RateLimiter(args.max_mbps * 1e6 if args.max_mbps else None)
     sw = time.time()
-    for d in _date_range(start, end):
-        out_path = _output_path(output_root, args.exchange, args.symbol, d)
-        if os.path.exists(out_path):
-            n_skip += 1
-            print(f"  skip {args.symbol} {d}: already on disk", file=sys.stderr)
-            continue
-
-        if args.table == "book_delta_v2":
-            try:
-                n_rows = _download_delta_v2(
-                    delta_fs, args.exchange, args.symbol, d, out_path
-                )
-            except FileNotFoundError as e:
-                n_fail += 1
-                print(f"  miss {args.symbol} {d}: {e}", file=sys.stderr)
-                continue
-            except Exception as e:
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = {
+            pool.submit(_run_job, job, out_path, conns, limiter,
+                        args.retries, args.backoff, args.use_cache, delta_kwargs): job
+            for job, out_path in pending
+        }
+        for fut in as_completed(futures):
+            job = futures[fut]
+            res = fut.result()
+            status = res.pop("status")
+            manifest.record(job, status, **res)
+            tag = f"{job.table} {job.symbol} {job.date}"
+            if status == "ok":
+                n_done += 1
+                print(f"  OK   {tag}: {res['rows']:,} rows, {res['bytes'] / 1e6:.1f} MB",
+                      file=sys.stderr)
+            elif status == "fail":
                 n_fail += 1
-                try:
-                    if os.path.exists(out_path + ".tmp"):
-                        os.remove(out_path + ".tmp")
-                except OSError:
-                    pass
-                print(f"  FAIL {args.symbol} {d}: {type(e).__name__}: {e}",
+                print(f"  FAIL {tag}: {res['error']} (after {res['attempts']} attempts)",
                       file=sys.stderr)
-                continue
-            sz_mb = os.path.getsize(out_path) / 1e6
-            n_done += 1
-            print(f"  OK   {args.symbol} {d}: {n_rows:,} rows, {sz_mb:.1f} MB",
-                  file=sys.stderr)
-            continue
-
-        # lakeapi treats end as exclusive midnight, so request [d, d+1).
-        try:
-            df = lakeapi.load_data(
-                table=args.table,
-                start=dt.datetime.combine(d, dt.time.min),
-                end=dt.datetime.combine(d + dt.timedelta(days=1), dt.time.min),
-                symbols=[args.symbol],
-                exchanges=[args.exchange],
-                cached=args.use_cache,
-                boto3_session=boto_session,
-            )
-        except Exception as e:
-            n_fail += 1
-            print(f"  FAIL {args.symbol} {d}: {type(e).__name__}: {e}", file=sys.stderr)
-            continue
-
-        if df is None or len(df) == 0:
-            n_fail += 1
-            print(f"  empty {args.symbol} {d}", file=sys.stderr)
-            continue
-
-        try:
-            _write_day_parquet(df, out_path)
-            n_done += 1
-            sz_mb = os.path.getsize(out_path) / 1e6
-            print(f"  OK   {args.symbol} {d}: {len(df):,} rows, {sz_mb:.1f} MB",
-                  file=sys.stderr)
-        except Exception as e:
-            n_fail += 1
-            try:
-                if os.path.exists(out_path + ".tmp"):
-                    os.remove(out_path + ".tmp")
-            except OSError:
-                pass
-            print(f"  FAIL write {args.symbol} {d}: {type(e).__name__}: {e}",
-                  file=sys.stderr)
+            else:
+                n_miss += 1
+                print(f"  {status} {tag}", file=sys.stderr)
+    except KeyboardInterrupt:
+        # Queued jobs are dropped; in-flight ones finish (their files make
+        # them skip next time) and any torn .tmp is removed on the next
+        # attempt at that day.
+        print("Interrupted; finishing in-flight jobs. Rerun to resume.", file=sys.stderr)
+        pool.shutdown(wait=False, cancel_futures=True)
+        manifest.close()
+        return 130
+    pool.shutdown()
+    manifest.close()
 
     elapsed = time.time() - sw
     print("", file=sys.stderr)
-    print(f"Done in {elapsed:.0f}s. downloaded={n_done} skipped={n_skip} failed={n_fail}",
-          file=sys.stderr)
+    print(f"Done in {elapsed:.0f}s. downloaded={n_done} skipped={n_skip} "
+          f"missing={n_miss} failed={n_fail}", file=sys.stderr)
     return 0 if n_fail == 0 else 1
 
 
@@ -0,0 +1,312 @@
+"""Cached entry-time trip features, computed once per trip and definition.
+
+Every stratify run used to recompute its features from the bars, even when
+only the bucket cutpoints changed. The store keeps what trip_features.py
+computes, at two levels:
+
+    {store_root}/
+      shards/{column}.v{FEATURE_VERSION}.{bars_tag}.parquet
+          trip_key + the feature's columns, one row per distinct entry
+          (symbol, entry_us, entry_price) and bar parquet version ever
+          computed, across all trips files. This is the incremental cache:
+          a trip whose key is in the shard is never recomputed.
+      tables/{digest}.parquet, tables/{digest}.json
+          the feature columns for one trips file, row-aligned with it, and
+          a manifest naming the shard key each column came from. `digest`
+          is the sha256 of the file's bytes, so an edited or regenerated
+          file gets a new table while its unchanged trips still hit the
+          shards.
+
+A shard is named by the feature's spec, FEATURE_VERSION and `bars_tag`, a
+hash of the bars root. A trip_key covers the trip and the size and mtime of
+its symbol's bar parquet (the stat the .cumsum index is checked against),
+and the manifest records that stat per symbol. So a changed definition, a
+different bars root or a rewritten parquet never reuses old values: the
+next load recomputes the rows of every symbol whose parquet changed,
+appeared or went away. Trips whose symbol has no bar parquet are not
+cached; the manifest lists those symbols.
+
+Usage:
+    # Precompute features for a trips file (later runs read them back)
+    python scripts/crypto/feature_store.py \\
+        --trips data/crypto/cumsum_z_persistexit/backtest_results_trips_1m_th15_ls.csv \\
+        --features vwma:60d zscore:60d volratio:30d:8h imb:24h
+
+    from feature_store import load_features
+    df, missing = load_features(trips, trips_path, features, bars_root)
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bar_cumsum import source_stat  # noqa: E402
+from symbol_pool import add_pool_args, run_symbols  # noqa: E402
+from trip_features import (  # noqa: E402
+    FEATURE_VERSION, Feature, feature_columns, symbol_features, write_table)
+
+DEFAULT_STORE_ROOT = "data/crypto/feature_store"
+DEFAULT_BARS_ROOT = "data/crypto/perps_bars/1m"
+
+# The trip fields a feature value depends on.
+TRIP_KEY_COLUMNS = ("symbol", "entry_us", "entry_price")
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:20]
+
+
+def bars_tag(bars_root: str) -> str:
+    return hashlib.sha256(os.path.realpath(bars_root).encode()).hexdigest()[:8]
+
+
+def feature_key(f: Feature, bars_root: str) -> str:
+    return f"{f.column}.v{FEATURE_VERSION}.{bars_tag(bars_root)}"
+
+
+def bar_stamps(bars_root: str, symbols) -> dict[str, str | None]:
+    """"{bytes}:{mtime_ns}" of each symbol's bar parquet, None when it has
+    none."""
+    out = {}
+    for sym in symbols:
+        try:
+            st = source_stat(os.path.join(bars_root, f"{sym}.parquet"))
+        except OSError:
+            out[sym] = None
+        else:
+            out[sym] = f"{st['bytes']}:{st['mtime_ns']}"
+    return out
+
+
+def trip_keys(trips: pd.DataFrame, stamps: dict[str, str | None]) -> np.ndarray:
+    """uint64 key per trip over the TRIP_KEY_COLUMNS it has plus its
+    symbol's bar stamp."""
+    cols = [c for c in TRIP_KEY_COLUMNS if c in trips.columns]
+    keyed = trips[cols].assign(_bars=trips["symbol"].map(stamps).fillna(""))
+    return pd.util.hash_pandas_object(keyed, index=False).to_numpy()
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _read_shard(path: str) -> pd.DataFrame | None:
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path).set_index("trip_key")
+
+
+def _read_table(tables_dir: str, digest: str, n_rows: int) -> tuple[dict, pd.DataFrame]:
+    """(manifest, table) for a trips digest; an empty pair when absent or
+    not matching the trips file's row count."""
+    meta_path = os.path.join(tables_dir, f"{digest}.json")
+    empty = {"rows": n_rows, "features": {}, "missing_symbols": []}
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        table = pd.read_parquet(os.path.join(tables_dir, f"{digest}.parquet"))
+    except (OSError, ValueError):
+        return empty, pd.DataFrame(index=range(n_rows))
+    if meta.get("rows") != n_rows or len(table) != n_rows:
+        return empty, pd.DataFrame(index=range(n_rows))
+    return meta, table
+
+
+def _compute(trips: pd.DataFrame, need: dict[Feature, np.ndarray], bars_root: str,
+             workers: int | None, threads_per_worker: int | None) -> tuple[list, set]:
+    """Run trip_features on the rows each feature still needs. Returns the
+    computed per-symbol frames and the symbols without a bar parquet."""
+    features = list(need)
+    # One job per (symbol, set of features the rows need), so a trip only
+    # gets the features it is missing.
+    pattern = np.zeros(len(trips), dtype=np.int64)
+    for bit, f in enumerate(features):
+        pattern |= need[f].astype(np.int64) << bit
+    todo = trips[pattern > 0]
+    jobs = []
+    for (sym, bits), sub in todo.groupby([todo["symbol"], pattern[pattern > 0]], sort=False):
+        jobs.append((sym, sub, bars_root, [f for i, f in enumerate(features) if bits >> i & 1]))
+    results = run_symbols(symbol_features, jobs, workers, threads_per_worker,
+                          label="symbols computed")
+    missing = {job[0] for job, r in zip(jobs, results) if r is None}
+    counts = ", ".join(f"{f.column} x{int(need[f].sum()):,}" for f in features if need[f].any())
+    print(f"  feature store: computed {counts}", file=sys.stderr)
+    return [r for r in results if r is not None], missing
+
+
+def load_features(trips: pd.DataFrame, trips_path: str, features, bars_root: str,
+                  store_root: str | None = DEFAULT_STORE_ROOT, workers: int | None = None,
+                  threads_per_worker: int | None = None,
+                  rebuild: bool = False) -> tuple[pd.DataFrame, set]:
+    """Trips with feature_columns(features) attached, reading what the
+    store has and computing (then storing) only the rest.
+
+    Returns (df, missing_symbols). Like the per-symbol loops this replaces,
+    df drops trips whose symbol has no bar parquet and lists trips grouped
+    by symbol in first-appearance order. store_root=None computes
+    everything and stores nothing; rebuild=True recomputes the requested
+    features for these trips and overwrites their stored values.
+    """
+    trips = trips.reset_index(drop=True)
+    features = list(dict.fromkeys(features))
+    n = len(trips)
+
+    if store_root is None:
+        pieces, missing = _compute(trips, {f: np.ones(n, dtype=bool) for f in features},
+                                   bars_root, workers, threads_per_worker)
+        df = pd.concat(pieces) if pieces else trips.iloc[:0].assign(
+            **{c: np.nan for c in feature_columns(features)})
+        return _grouped(df.sort_index(), trips), missing
+
+    shards_dir = os.path.join(store_root, "shards")
+    tables_dir = os.path.join(store_root, "tables")
+    os.makedirs(shards_dir, exist_ok=True)
+    os.makedirs(tables_dir, exist_ok=True)
+
+    digest = file_digest(trips_path)
+    meta, table = _read_table(tables_dir, digest, n)
+    keys = {f: feature_key(f, bars_root) for f in features}
+    stamps = bar_stamps(bars_root, trips["symbol"].unique())
+    # Symbols whose bar parquet was rewritten, appeared or went away since
+    # the table was written.
+    changed = {s for s, st in stamps.items() if meta.get("bars", {}).get(s) != st}
+    changed_rows = trips["symbol"].isin(changed).to_numpy()
+    stale = [f for f in features
+             if rebuild or meta["features"].get(f.column) != keys[f]
+             or any(c not in table.columns for c in feature_columns([f]))]
+
+    refresh = features if changed else stale
+    missing = set(meta["missing_symbols"]) - changed
+    if refresh:
+        tkey = trip_keys(trips, stamps)
+        shards, need = {}, {}
+        for f in refresh:
+            shards[f] = _read_shard(os.path.join(shards_dir, f"{keys[f]}.parquet"))
+            cached = np.zeros(n, dtype=bool) if rebuild or shards[f] is None \
+                else np.isin(tkey, shards[f].index)
+            need[f] = ~cached if f in stale else ~cached & changed_rows
+
+        if any(m.any() for m in need.values()):
+            pieces, missing_now = _compute(trips, need, bars_root, workers, threads_per_worker)
+            missing |= missing_now
+            for f in refresh:
+                cols = feature_columns([f])
+                done = [p for p in pieces if cols[0] in p.columns]
+                if not done:
+                    continue
+                part = pd.concat(done)
+                part = pd.DataFrame(part[cols].to_numpy(), columns=cols,
+                                    index=pd.Index(tkey[part.index.to_numpy()], name="trip_key"))
+                if shards[f] is not None:
+                    part = pd.concat([shards[f], part])
+                shards[f] = part[~part.index.duplicated(keep="last")]
+                _write_parquet(shards[f].reset_index(),
+                               os.path.join(shards_dir, f"{keys[f]}.parquet"))
+
+        for f in refresh:
+            cols = feature_columns([f])
+            if shards[f] is None:
+                vals = pd.DataFrame(np.nan, index=range(n), columns=cols)
+            else:
+                vals = shards[f].reindex(tkey)[cols].reset_index(drop=True)
+            table = table.drop(columns=[c for c in cols if c in table.columns]).join(vals)
+            meta["features"][f.column] = keys[f]
+        meta.update(source=os.path.abspath(trips_path), rows=n,
+                    missing_symbols=sorted(missing), bars=stamps)
+        _write_parquet(table, os.path.join(tables_dir, f"{digest}.parquet"))
+        meta_path = os.path.join(tables_dir, f"{digest}.json")
+        with open(meta_path + ".tmp", "w") as fh:
+            json.dump(meta, fh, indent=1)
+        os.replace(meta_path + ".tmp", meta_path)
+    else:
+        print(f"  feature store: every requested feature cached for {n:,} trips",
+              file=sys.stderr)
+
+    df = pd.concat([trips, table[feature_columns(features)]], axis=1)
+    df = df[~df["symbol"].isin(missing).to_numpy()]
+    return _grouped(df, trips), missing
+
+
+def with_feature(trips: pd.DataFrame, trips_path: str, feature: Feature, name: str,
+                 bars_root: str, store_root: str | None = DEFAULT_STORE_ROOT) -> pd.DataFrame:
+    """trips in their own order plus `feature` as column `name`, dropping
+    trips without a value. For scripts that want one feature under a
+    fixed column name (e.g. the volume ratio as `ratio`)."""
+    df, _ = load_features(trips.reset_index(drop=True).assign(_row=np.arange(len(trips))),
+                          trips_path, [feature], bars_root, store_root)
+    df = df.sort_values("_row").drop(columns=["_row"])
+    extras = [c for c in feature_columns([feature]) if c != feature.column]
+    df = df.drop(columns=extras).rename(columns={feature.column: name})
+    return df.dropna(subset=[name]).reset_index(drop=True)
+
+
+def _grouped(df: pd.DataFrame, trips: pd.DataFrame) -> pd.DataFrame:
+    """Rows grouped by symbol in first-appearance order, input order within
+    a symbol: the order concatenating per-symbol results used to give."""
+    order = pd.factorize(trips["symbol"])[0][df.index.to_numpy()]
+    return df.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+
+
+def add_store_args(ap):
+    """--store-root / --no-store / --rebuild-features, shared by the scripts
+    that read trip features."""
+    ap.add_argument("--store-root", default=DEFAULT_STORE_ROOT,
+                    help=f"Trip feature store. Default: {DEFAULT_STORE_ROOT}")
+    ap.add_argument("--no-store", action="store_true",
+                    help="Compute features from the bars without reading or writing the store.")
+    ap.add_argument("--rebuild-features", action="store_true",
+                    help="Recompute the requested features and overwrite their stored values.")
+
+
+def store_root_arg(args, repo_root: str) -> str | None:
+    if args.no_store:
+        return None
+    return args.store_root if os.path.isabs(args.store_root) \
+        else os.path.join(repo_root, args.store_root)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--trips", required=True, help="Trips CSV.")
+    ap.add_argument("--features", nargs="+", required=True,
+                    help="Feature specs, e.g. vwma:60d volratio:30d:8h imb:24h.")
+    ap.add_argument("--bars-root", default=DEFAULT_BARS_ROOT,
+                    help=f"1m bar-parquet root. Default: {DEFAULT_BARS_ROOT}")
+    ap.add_argument("--out", help="Also write the wide trips + features table (.parquet or .csv).")
+    add_store_args(ap)
+    add_pool_args(ap)
+    args = ap.parse_args()
+
+    repo_root = os.path.abspath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    trips_path = args.trips if os.path.isabs(args.trips) else os.path.join(repo_root, args.trips)
+    bars_root = args.bars_root if os.path.isabs(args.bars_root) else os.path.join(repo_root, args.bars_root)
+    features = [Feature.parse(s) for s in args.features]
+
+    trips = pd.read_csv(trips_path)
+    df, missing = load_features(trips, trips_path, features, bars_root,
+                                store_root_arg(args, repo_root), args.workers,
+                                args.threads_per_worker, rebuild=args.rebuild_features)
+    print(f"trips={len(trips)} with_features={len(df)} missing_symbols={len(missing)}")
+    if args.out:
+        write_table(df, args.out)
+        print(f"Wrote {len(df):,} trips x {len(features)} features to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,8 +7,15 @@
   - mfe-bucket P&L: what fraction of net P&L sits in trades that
     eventually reached MFE > 200bp? if the edge is mostly the long
     tail, a tighter wait-for-mfe rule could matter.
+
+Like inspect_high_rvol_shorts.py, a trips CSV without `ratio` gets the
+30d/8h volume ratio from the trip feature store.
 """
-import os, pandas as pd
+import argparse, os, sys, pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feature_store import DEFAULT_BARS_ROOT, DEFAULT_STORE_ROOT, with_feature  # noqa: E402
+from trip_features import Feature  # noqa: E402
 
 DEFAULT = "data/crypto/cumsum_z_persistexit/trips_th15_volratio_30d8h.csv"
 
@@ -70,8 +77,18 @@ def show_mfe_bucket(df, label):
     print()
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trips", default=DEFAULT)
+    ap.add_argument("--bars-root", default=DEFAULT_BARS_ROOT)
+    ap.add_argument("--store-root", default=DEFAULT_STORE_ROOT)
+    args = ap.parse_args()
+
     repo = os.path.abspath(os.path.join(os.path.dirname(__file__),"..",".."))
-    df = pd.read_csv(os.path.join(repo, DEFAULT))
+    trips_path = os.path.join(repo, args.trips)
+    df = pd.read_csv(trips_path)
+    if "ratio" not in df.columns:
+        df = with_feature(df, trips_path, Feature("volratio", "30d", "8h"), "ratio",
+                          os.path.join(repo, args.bars_root), os.path.join(repo, args.store_root))
     short = df[df.side=="short"]
     b5_10  = short[(short.ratio>=5)  & (short.ratio<10)]
     b10p   = short[short.ratio>=10]
@@ -13,14 +13,23 @@ Asks the questions:
 
 Plus exports a "to-chart" CSV listing the trades worth visual review
 (top 25 losers + top 25 winners) so we can chart them next.
+
+--trips may also be a plain trips CSV without a `ratio` column; the
+--lookback-days/--recent-hours volume ratio is then read from the trip
+feature store (feature_store.py), computed from the bars on first use.
 """
 
 import argparse
 import os
+import sys
 
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feature_store import DEFAULT_BARS_ROOT, DEFAULT_STORE_ROOT, with_feature  # noqa: E402
+from trip_features import Feature  # noqa: E402
+
 
 DEFAULT_TRIPS = "data/crypto/cumsum_z_persistexit/trips_th15_volratio_30d8h.csv"
 
@@ -122,6 +131,12 @@ def main():
     ap.add_argument("--trips", default=DEFAULT_TRIPS)
     ap.add_argument("--out-dir", default="data/crypto/inspect_rvol")
     ap.add_argument("--top-n", type=int, default=20)
+    ap.add_argument("--bars-root", default=DEFAULT_BARS_ROOT)
+    ap.add_argument("--store-root", default=DEFAULT_STORE_ROOT)
+    ap.add_argument("--lookback-days", type=int, default=30,
+                    help="Volume-ratio baseline when --trips has no ratio column.")
+    ap.add_argument("--recent-hours", type=int, default=8,
+                    help="Volume-ratio recent window when --trips has no ratio column.")
     args = ap.parse_args()
 
     repo = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -130,6 +145,10 @@ def main():
     os.makedirs(out_dir, exist_ok=True)
 
     df = pd.read_csv(trips_path)
+    if "ratio" not in df.columns:
+        feature = Feature("volratio", f"{args.lookback_days}d", f"{args.recent_hours}h")
+        df = with_feature(df, trips_path, feature, "ratio",
+                          os.path.join(repo, args.bars_root), os.path.join(repo, args.store_root))
     df["entry_dt"] = pd.to_datetime(df.entry_us, unit="us", utc=True).dt.strftime("%Y-%m-%d %H:%M")
     df["exit_dt"]  = pd.to_datetime(df.exit_us,  unit="us", utc=True).dt.strftime("%Y-%m-%d %H:%M")
 
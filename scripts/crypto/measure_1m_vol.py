@@ -16,10 +16,15 @@ decimal and bps-per-minute units for readability.
 """
 
 import argparse
-import duckdb
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from symbol_pool import add_pool_args, run_symbols, worker_duckdb  # noqa: E402
+
 
 DEFAULT_BASKET = [
     # Tier-A liquidity (long-only side traded at v0's $28.8M ADV gate)
@@ -33,7 +38,7 @@ DEFAULT_BASKET = [
 
 def measure_symbol(bars_root: str, symbol: str, window_bars: int) -> pd.DataFrame:
     path = f"{bars_root}/1m/{symbol}.parquet"
-    con = duckdb.connect()
+    con = worker_duckdb()
     # Read ordered close prices, compute log-return, then rolling sample std
     # via a window function. DuckDB's stddev_samp is sample std (N-1 divisor),
     # which matches StdMa.SampleStd in the engine.
@@ -65,6 +70,14 @@ def measure_symbol(bars_root: str, symbol: str, window_bars: int) -> pd.DataFram
     return df
 
 
+def measure_task(bars_root: str, symbol: str, window_bars: int):
+    """Pool task: (stds, None) on success, (None, error message) on failure."""
+    try:
+        return measure_symbol(bars_root, symbol, window_bars)["std_w"].values, None
+    except Exception as e:
+        return None, str(e)
+
+
 def main():
     ap = argparse.ArgumentParser(description=__doc__,
                                  formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -75,6 +88,7 @@ def main():
                     help="Rolling window in 1m bars. Default 10080 = 7 days.")
     ap.add_argument("--symbols", nargs="+", default=DEFAULT_BASKET,
                     help="Symbols to measure")
+    add_pool_args(ap)
     args = ap.parse_args()
 
     print(f"Rolling-std window: {args.window_bars:,} 1m bars "
@@ -85,17 +99,16 @@ def main():
           f"{'med':>10} {'p75':>10} {'p90':>10} {'p95':>10} {'p99':>10}")
     print("-" * 110)
 
+    jobs = [(args.bars_root, sym, args.window_bars) for sym in args.symbols]
+    results = run_symbols(measure_task, jobs, args.workers, args.threads_per_worker)
     all_stds = []
-    for sym in args.symbols:
-        try:
-            df = measure_symbol(args.bars_root, sym, args.window_bars)
-        except Exception as e:
-            print(f"{sym:<14} FAILED: {e}")
+    for sym, (s, err) in zip(args.symbols, results):
+        if err is not None:
+            print(f"{sym:<14} FAILED: {err}")
             continue
-        if len(df) == 0:
+        if len(s) == 0:
             print(f"{sym:<14} (no data)")
             continue
-        s = df["std_w"].values
         all_stds.append(s)
         ps = np.percentile(s, [10, 25, 50, 75, 90, 95, 99])
         print(f"{sym:<14} {len(s):>10,} "
@@ -10,9 +10,31 @@ Output is in [-1, +1]. +1 means all weighted size is on the bid (buy pressure),
 far from the inside, on the assumption that deep liquidity rarely fills.
 
 Two reconstruction paths are supported:
-  - obi_from_book:        consume Crypto Lake `book` snapshots (already 20-deep)
+  - obi_from_book:        consume Crypto Lake `book` snapshots (already 20-deep),
+                          from the parquet or its memory-mapped `.bookbin`
   - obi_from_delta:       seed from a snapshot, replay book_delta_v2 events,
                           resample at a fixed cadence
+Each has a `_sweep` variant that computes a whole (depth, lambda) grid from
+one stacked size matrix or one replay.
+
+Distance is measured in one of two ways:
+  - index (default):      level i is taken to sit i ticks from the inside,
+                          so weights are a constant vector per (depth, lambda)
+  - true distance:        pass `tick_size` and the weights are computed from
+                          the sampled prices, |price_i - mid| / tick_size,
+                          over the whole (rows, depth) price matrix at once.
+                          Needed when the spread is wider than one tick or
+                          the book has gaps (alts, thin books). `TICK_SIZES`
+                          and `tick_size_for` give the per-symbol tick.
+
+`replay_deltas` (per sample) and `replay_delta_blocks` (per block of samples)
+expose the replayed top-N book itself, for features other than OBI.
+
+The delta replay keeps each side of the book as a dense size array over the
+day's distinct prices (`LadderBook`), so an update is one array store and a
+top-N read walks down from the best level instead of sorting the book. The
+replay kernel is JIT-compiled with numba when available, which is what makes
+10 ms cadence practical; without numba a NumPy per-sample fallback is used.
 
 Both return a (timestamps_us, obi_series) pair so the chart can overlay them
 on the same time axis.
@@ -22,85 +44,487 @@ from __future__ import annotations
 import numpy as np
 import pandas as pd
 
+from book_bin import BookBin
+
+try:
+    from numba import njit
+except ImportError:  # pure-NumPy fallback in _replay_block_numpy
+    njit = None
+
+# Samples per replay block. Top-N buffers are (REPLAY_BLOCK, depth) per side,
+# so memory stays bounded however long the day or fine the cadence.
+REPLAY_BLOCK = 65_536
+
+
+# Price increment per Crypto Lake symbol (Binance USDM perps). Symbols not
+# listed here fall back to `infer_tick_size` on the day's prices.
+TICK_SIZES: dict[str, float] = {
+    "BTC-USDT-PERP": 0.1,
+    "ETH-USDT-PERP": 0.01,
+    "BNB-USDT-PERP": 0.01,
+    "SOL-USDT-PERP": 0.01,
+    "LTC-USDT-PERP": 0.01,
+    "AVAX-USDT-PERP": 0.001,
+    "LINK-USDT-PERP": 0.001,
+    "XRP-USDT-PERP": 0.0001,
+    "ADA-USDT-PERP": 0.0001,
+    "DOGE-USDT-PERP": 0.00001,
+}
+
+
+def infer_tick_size(prices) -> float:
+    """Smallest gap between distinct finite prices, rounded off float noise.
+
+    A day of BTC book prices touches every tick near the inside many times
+    over, so the minimum gap is the exchange tick for any liquid symbol.
+    """
+    px = np.unique(np.asarray(prices, dtype=np.float64).ravel())
+    px = px[np.isfinite(px)]
+    gaps = np.diff(px)
+    # Prices parsed from different decimal strings can differ by a few ulps.
+    gaps = gaps[gaps > 1e-9 * np.abs(px).max(initial=0.0)]
+    if len(gaps) == 0:
+        raise ValueError("need at least two distinct prices to infer the tick size")
+    return float(f"{gaps.min():.6g}")
+
+
+def tick_size_for(symbol: str, prices=None) -> float:
+    """Tick size for `symbol` from `TICK_SIZES`, else inferred from `prices`."""
+    if symbol in TICK_SIZES:
+        return TICK_SIZES[symbol]
+    if prices is None:
+        raise KeyError(f"no tick size for {symbol!r}; add it to TICK_SIZES or pass prices")
+    return infer_tick_size(prices)
+
 
 def _exponential_weights(depth: int, lambda_decay: float) -> np.ndarray:
     """Pre-computed weights w_i = exp(-lambda * i) for i in 0..depth-1.
 
-    We use the level *index* as the distance proxy rather than the actual
+    This is the index-distance mode: the level *index* stands in for
     |price - mid| / tick_size. On BTC perps the inside spread is essentially
-    always 1 tick and the levels we care about (top-5, top-10) are densely
-    populated, so level i sits at ~i ticks from inside on the same side.
-    Computing weights from indexes is exact under that assumption and avoids
-    a per-row distance recompute.
+    always 1 tick and the top-5/top-10 levels are densely populated, so
+    level i sits ~i ticks from the inside and the weights need no prices.
+    When the spread is wider or the book has gaps, pass `tick_size` to the
+    OBI functions for the true-distance weights (`_distance_queues`).
     """
     return np.exp(-lambda_decay * np.arange(depth, dtype=np.float64))
 
 
 def obi_from_book(
-    book_df: pd.DataFrame, depth: int, lambda_decay: float
+    book_df: pd.DataFrame | BookBin, depth: int, lambda_decay: float,
+    tick_size: float | None = None,
 ) -> tuple[np.ndarray, np.ndarray]:
     """Compute OBI series from Crypto Lake `book` snapshots.
 
     Each row of `book_df` carries the top-20 levels per side as
     `bid_{i}_price`, `bid_{i}_size`, `ask_{i}_price`, `ask_{i}_size` for
     i in 0..19. We consume the first `depth` levels and apply exponential
-    distance weights to size (price columns are not needed under the
-    index-distance approximation, see `_exponential_weights`).
+    distance weights to size. With `tick_size=None` the distance is the
+    level index and price columns are not read (see `_exponential_weights`);
+    otherwise it is |price - mid| / tick_size per row. `book_df` may also be
+    a `book_bin.BookBin`, whose level matrices are used in place.
 
     Returns (timestamps_us, obi) as parallel int64/float64 arrays.
     """
     if depth < 1 or depth > 20:
         raise ValueError(f"depth must be in 1..20, got {depth}")
 
+    if tick_size is not None:
+        t, _, obi = obi_sweep_from_book(book_df, [depth], [lambda_decay], tick_size)
+        return t, obi[:, 0]
     w = _exponential_weights(depth, lambda_decay)
-    bid_sizes = np.stack(
-        [book_df[f"bid_{i}_size"].to_numpy(dtype=np.float64) for i in range(depth)],
-        axis=1,
-    )
-    ask_sizes = np.stack(
-        [book_df[f"ask_{i}_size"].to_numpy(dtype=np.float64) for i in range(depth)],
+    qb = _stack_sizes(book_df, "bid", depth) @ w
+    qa = _stack_sizes(book_df, "ask", depth) @ w
+    return _book_timestamps(book_df), _obi(qb, qa)
+
+
+def _book_timestamps(book_df: pd.DataFrame | BookBin) -> np.ndarray:
+    if isinstance(book_df, BookBin):
+        return np.asarray(book_df.timestamp_us, dtype=np.int64)
+    return book_df["timestamp_us"].to_numpy(dtype=np.int64)
+
+
+def _stack_sizes(book_df: pd.DataFrame | BookBin, side: str, depth: int) -> np.ndarray:
+    """(rows, depth) size matrix for one side of `book` snapshots; NaNs
+    (missing levels) treated as zero size. A BookBin already holds the
+    matrix (float32, 0 for missing), so nothing is stacked."""
+    if isinstance(book_df, BookBin):
+        return book_df.size(side, depth)
+    return np.nan_to_num(_stack_levels(book_df, side, "size", depth), copy=False)
+
+
+def _stack_levels(book_df: pd.DataFrame | BookBin, side: str, field: str,
+                  depth: int) -> np.ndarray:
+    """(rows, depth) matrix of `{side}_{i}_{field}` columns, i < depth."""
+    if isinstance(book_df, BookBin):
+        return book_df.price(side, depth) if field == "price" else book_df.size(side, depth)
+    return np.stack(
+        [book_df[f"{side}_{i}_{field}"].to_numpy(dtype=np.float64) for i in range(depth)],
         axis=1,
     )
-    # NaNs (missing levels) treated as zero size.
-    np.nan_to_num(bid_sizes, copy=False)
-    np.nan_to_num(ask_sizes, copy=False)
 
-    qb = bid_sizes @ w
-    qa = ask_sizes @ w
+
+def _obi(qb: np.ndarray, qa: np.ndarray) -> np.ndarray:
+    """(qb - qa) / (qb + qa), 0 where the weighted book is empty."""
     denom = qb + qa
-    # Guard against the rare empty-book row.
-    obi = np.where(denom > 0, (qb - qa) / np.maximum(denom, 1e-12), 0.0)
+    obi = qb - qa
+    # Guard against the rare empty-book row. In place: sweeps make these
+    # (rows, P) arrays large.
+    ok = denom > 0
+    np.divide(obi, denom, out=obi, where=ok)
+    obi[~ok] = 0.0
+    return obi
+
+
+def _weight_matrix(depths, lambdas) -> tuple[np.ndarray, np.ndarray]:
+    """Weights for a (depth, lambda) grid.
+
+    Returns (params, W): params is (P, 2) with one (depth, lambda) row per
+    grid point, depth-major; W is (max_depth, P) with column p holding
+    exp(-lambda_p * i) for i < depth_p and 0 below. A (rows, max_depth) size
+    matrix times W gives every weighted queue in one matmul.
+    """
+    depths = np.atleast_1d(np.asarray(depths, dtype=np.int64))
+    lambdas = np.atleast_1d(np.asarray(lambdas, dtype=np.float64))
+    if depths.size == 0 or lambdas.size == 0:
+        raise ValueError("depths and lambdas must be non-empty")
+    if depths.min() < 1:
+        raise ValueError(f"depths must be >= 1, got {depths.tolist()}")
+    d = np.repeat(depths, len(lambdas))
+    lam = np.tile(lambdas, len(depths))
+    i = np.arange(depths.max(), dtype=np.float64)[:, None]
+    W = np.where(i < d[None, :], np.exp(-lam[None, :] * i), 0.0)
+    return np.column_stack([d, lam]), W
+
+
+def _distance_ticks(bid_px: np.ndarray, ask_px: np.ndarray,
+                    tick_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """|price - mid| / tick_size for (rows, depth) bid and ask price matrices,
+    mid taken from each row's level 0.
+
+    Missing levels (NaN price) get distance 0; their size is 0, so they add
+    nothing. A row with one side empty has no mid: every distance on it is 0
+    and the OBI comes out +1 / -1, as in index mode.
+    """
+    if not tick_size > 0:
+        raise ValueError(f"tick_size must be > 0, got {tick_size}")
+    mid = ((bid_px[:, 0] + ask_px[:, 0]) * 0.5)[:, None]
+    db = np.subtract(mid, bid_px)
+    da = np.subtract(ask_px, mid)
+    for d in (db, da):
+        np.abs(d, out=d)
+        d *= 1.0 / tick_size
+        np.nan_to_num(d, copy=False, nan=0.0)
+    return db, da
+
+
+def _distance_queues(dist: np.ndarray, sizes: np.ndarray, params: np.ndarray,
+                     n_lambdas: int) -> np.ndarray:
+    """Weighted queues for every (depth, lambda) in `params` with true-distance
+    weights: out[:, p] = sum_{i < depth_p} exp(-lambda_p * dist_i) * size_i.
+
+    `params` is the depth-major grid from `_weight_matrix` over `n_lambdas`
+    lambdas. The weighted sizes for every lambda are built as one
+    (n_lambdas, rows, max_depth) stack and the depth cut-offs are a single
+    batched matmul against a 0/1 mask, so only the exp scales with the
+    number of lambdas.
+    """
+    lams = params[:n_lambdas, 1]
+    depths = params[::n_lambdas, 0]
+    q = dist[None, :, :] * -lams[:, None, None]
+    np.exp(q, out=q)
+    q *= sizes[None, :, :]
+    mask = np.arange(dist.shape[1])[:, None] < depths[None, :]
+    per = q @ mask.astype(np.float64)  # (n_lambdas, rows, n_depths)
+    return per.transpose(1, 2, 0).reshape(dist.shape[0], len(params))
+
+
+def _sweep_obi(bid_px, bid_sz, ask_px, ask_sz, params, W, n_lambdas: int,
+               tick_size: float | None) -> np.ndarray:
+    """OBI for every grid point: index weights (one matmul per side) when
+    `tick_size` is None, else true-distance weights from the prices."""
+    if tick_size is None:
+        return _obi(bid_sz @ W, ask_sz @ W)
+    db, da = _distance_ticks(bid_px, ask_px, tick_size)
+    return _obi(_distance_queues(db, bid_sz, params, n_lambdas),
+                _distance_queues(da, ask_sz, params, n_lambdas))
+
+
+def obi_sweep_from_book(
+    book_df: pd.DataFrame | BookBin, depths, lambdas, tick_size: float | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`obi_from_book` for every (depth, lambda) pair in depths x lambdas.
+
+    The size columns are stacked once at the largest depth and weighted with
+    one matmul per side, so a 10x10 sweep costs about one series. With
+    `tick_size` the price columns are stacked too and weighted by true
+    distance (one exp per distinct lambda).
+
+    Returns (timestamps_us, params, obi): params is (P, 2) rows of
+    (depth, lambda), depth-major; obi is (rows, P), column p for params[p].
+    """
+    params, W = _weight_matrix(depths, lambdas)
+    depth = W.shape[0]
+    if depth > 20:
+        raise ValueError(f"depths must be in 1..20, got {params[:, 0].astype(int).tolist()}")
+    bid_sz = _stack_sizes(book_df, "bid", depth)
+    ask_sz = _stack_sizes(book_df, "ask", depth)
+    bid_px = ask_px = None
+    if tick_size is not None:
+        bid_px = _stack_levels(book_df, "bid", "price", depth)
+        ask_px = _stack_levels(book_df, "ask", "price", depth)
+    obi = _sweep_obi(bid_px, bid_sz, ask_px, ask_sz, params, W, len(np.atleast_1d(lambdas)), tick_size)
+    return _book_timestamps(book_df), params, obi
+
+
+# -----------------------------------------------------------------------------
+# Live book replay
+# -----------------------------------------------------------------------------
+
+class LadderBook:
+    """Price-level book on a fixed, sorted price grid.
+
+    `prices` holds every distinct price the replay can touch (seed levels
+    plus all delta prices); `bid[j]` / `ask[j]` is the resting size at
+    `prices[j]`, 0 when the level is empty. `best` tracks the best bid and
+    ask level indexes (-1 / len(prices) when a side is empty); it is kept
+    exact on inserts and repaired lazily on the next top-N read.
+    """
+
+    def __init__(self, prices: np.ndarray):
+        self.prices = np.asarray(prices, dtype=np.float64)
+        n = len(self.prices)
+        self.bid = np.zeros(n, dtype=np.float64)
+        self.ask = np.zeros(n, dtype=np.float64)
+        self.best = np.array([-1, n], dtype=np.int64)
+
+    @classmethod
+    def from_seed(cls, seed_book_row: pd.Series, delta_prices: np.ndarray) -> "LadderBook":
+        """Grid over the seed snapshot's and the deltas' prices, seeded with
+        the snapshot's non-empty levels."""
+        seed_bp, seed_bs, seed_ap, seed_as = [], [], [], []
+        for i in range(20):
+            bp = float(seed_book_row.get(f"bid_{i}_price", float("nan")))
+            bs = float(seed_book_row.get(f"bid_{i}_size", 0.0))
+            if not np.isnan(bp) and bs > 0:
+                seed_bp.append(bp)
+                seed_bs.append(bs)
+            ap = float(seed_book_row.get(f"ask_{i}_price", float("nan")))
+            as_ = float(seed_book_row.get(f"ask_{i}_size", 0.0))
+            if not np.isnan(ap) and as_ > 0:
+                seed_ap.append(ap)
+                seed_as.append(as_)
+        book = cls(np.unique(np.concatenate([seed_bp, seed_ap, delta_prices])))
+        if seed_bp:
+            lvl = book.level_of(np.asarray(seed_bp))
+            book.bid[lvl] = seed_bs
+            book.best[0] = lvl.max()
+        if seed_ap:
+            lvl = book.level_of(np.asarray(seed_ap))
+            book.ask[lvl] = seed_as
+            book.best[1] = lvl.min()
+        return book
+
+    def level_of(self, prices: np.ndarray) -> np.ndarray:
+        """Grid index of each price (prices must be on the grid)."""
+        return np.searchsorted(self.prices, prices).astype(np.int64)
+
+
+def _replay_block_loop(bid, ask, best, is_bid, level, size, i, ev_end,
+                       bid_lvl, bid_sz, ask_lvl, ask_sz):
+    """Reference scalar kernel (JIT-compiled when numba is available).
+
+    For each sample k, apply events [i, ev_end[k]) to the ladder, then write
+    the top-N level indexes/sizes per side into row k of the out arrays
+    (-1 / 0 past the last non-empty level). Returns the next event index.
+    """
+    n_lvl = bid.shape[0]
+    depth = bid_lvl.shape[1]
+    for k in range(ev_end.shape[0]):
+        while i < ev_end[k]:
+            j = level[i]
+            s = size[i]
+            if is_bid[i]:
+                bid[j] = s
+                if s != 0.0 and j > best[0]:
+                    best[0] = j
+            else:
+                ask[j] = s
+                if s != 0.0 and j < best[1]:
+                    best[1] = j
+            i += 1
 
-    return book_df["timestamp_us"].to_numpy(dtype=np.int64), obi
+        # Bids: walk down from the best level, skipping emptied ones.
+        j = best[0]
+        m = 0
+        while j >= 0 and m < depth:
+            if bid[j] != 0.0:
+                if m == 0:
+                    best[0] = j
+                bid_lvl[k, m] = j
+                bid_sz[k, m] = bid[j]
+                m += 1
+            j -= 1
+        if m == 0:
+            best[0] = -1
+        while m < depth:
+            bid_lvl[k, m] = -1
+            bid_sz[k, m] = 0.0
+            m += 1
+
+        # Asks: walk up from the best level.
+        j = best[1]
+        m = 0
+        while j < n_lvl and m < depth:
+            if ask[j] != 0.0:
+                if m == 0:
+                    best[1] = j
+                ask_lvl[k, m] = j
+                ask_sz[k, m] = ask[j]
+                m += 1
+            j += 1
+        if m == 0:
+            best[1] = n_lvl
+        while m < depth:
+            ask_lvl[k, m] = -1
+            ask_sz[k, m] = 0.0
+            m += 1
+    return i
+
+
+def _replay_block_numpy(bid, ask, best, is_bid, level, size, i, ev_end,
+                        bid_lvl, bid_sz, ask_lvl, ask_sz):
+    """Pure-NumPy fallback for `_replay_block_loop`: apply each sample's
+    batch of deltas with array stores (last write per level wins), then read
+    the top-N from the non-empty levels. `best` is not used."""
+    depth = bid_lvl.shape[1]
+    bid_lvl.fill(-1)
+    ask_lvl.fill(-1)
+    bid_sz.fill(0.0)
+    ask_sz.fill(0.0)
+    for k in range(len(ev_end)):
+        hi = int(ev_end[k])
+        if hi > i:
+            for book, sel in ((bid, is_bid[i:hi]), (ask, ~is_bid[i:hi])):
+                lvl = level[i:hi][sel]
+                sz = size[i:hi][sel]
+                # Keep only the last write to each level in this batch.
+                _, first_rev = np.unique(lvl[::-1], return_index=True)
+                last = len(lvl) - 1 - first_rev
+                book[lvl[last]] = sz[last]
+            i = hi
+        top_b = np.flatnonzero(bid)[::-1][:depth]
+        top_a = np.flatnonzero(ask)[:depth]
+        bid_lvl[k, :len(top_b)] = top_b
+        bid_sz[k, :len(top_b)] = bid[top_b]
+        ask_lvl[k, :len(top_a)] = top_a
+        ask_sz[k, :len(top_a)] = ask[top_a]
+    return i
+
+
+if njit is not None:
+    _replay_block = njit(cache=True, nogil=True)(_replay_block_loop)
+else:
+    _replay_block = _replay_block_numpy
+
+
+def _sample_grid(ts: np.ndarray, seed_t_us: int, t_end_us: int,
+                 sample_cadence_us: int) -> tuple[np.ndarray, np.ndarray]:
+    """Sample times and, per sample, the end of the event prefix it sees.
+
+    Samples fall at seed + k * cadence (k >= 1) up to t_end_us, and stop
+    once no event remains in [previous sample, t_end_us] -- the same cut-off
+    the original per-event loop had. A sample sees every event strictly
+    before its own time.
+    """
+    in_window = ts[ts <= t_end_us]
+    if len(in_window) == 0 or sample_cadence_us <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    last_t = int(in_window[-1])
+    n = min((t_end_us - seed_t_us) // sample_cadence_us,
+            (last_t - seed_t_us) // sample_cadence_us + 1)
+    sample_t = seed_t_us + sample_cadence_us * np.arange(1, max(n, 0) + 1, dtype=np.int64)
+    return sample_t, np.searchsorted(ts, sample_t, side="left").astype(np.int64)
+
+
+def replay_delta_blocks(
+    seed_book_row: pd.Series, delta_df: pd.DataFrame, depth: int,
+    sample_cadence_us: int, t_end_us: int, block: int = REPLAY_BLOCK,
+):
+    """Block form of `replay_deltas` for vectorized consumers.
+
+    Yields (sample_t, bid_px, bid_sz, ask_px, ask_sz) per block of up to
+    `block` samples; the four book arrays are (rows, depth), best level
+    first, with NaN price / 0 size past the last non-empty level. All five
+    are views into buffers allocated once and overwritten by the next block:
+    copy anything that must outlive the iteration.
+    """
+    if depth < 1:
+        raise ValueError(f"depth must be >= 1, got {depth}")
+    seed_t_us = int(seed_book_row["timestamp_us"])
+    delta_df = delta_df[delta_df["timestamp_us"] >= seed_t_us]
+    ts = delta_df["timestamp_us"].to_numpy(dtype=np.int64)
+    is_bid = delta_df["side_is_bid"].to_numpy(dtype=bool)
+    price = delta_df["price"].to_numpy(dtype=np.float64)
+    size = delta_df["size"].to_numpy(dtype=np.float64)
+
+    book = LadderBook.from_seed(seed_book_row, price)
+    level = book.level_of(price)
+    sample_t, ev_end = _sample_grid(ts, seed_t_us, t_end_us, sample_cadence_us)
+
+    rows = min(block, len(sample_t))
+    bid_lvl = np.empty((rows, depth), dtype=np.int64)
+    ask_lvl = np.empty((rows, depth), dtype=np.int64)
+    bid_sz = np.empty((rows, depth), dtype=np.float64)
+    ask_sz = np.empty((rows, depth), dtype=np.float64)
+    bid_px = np.empty((rows, depth), dtype=np.float64)
+    ask_px = np.empty((rows, depth), dtype=np.float64)
+    t_buf = np.empty(rows, dtype=np.int64)
+    # Level -1 (empty) reads the trailing NaN.
+    grid = np.append(book.prices, np.nan)
+    i = 0
+    for lo in range(0, len(sample_t), block):
+        r = min(block, len(sample_t) - lo)
+        i = _replay_block(book.bid, book.ask, book.best, is_bid, level, size, i,
+                          ev_end[lo:lo + r], bid_lvl[:r], bid_sz[:r], ask_lvl[:r], ask_sz[:r])
+        np.take(grid, bid_lvl[:r], out=bid_px[:r])
+        np.take(grid, ask_lvl[:r], out=ask_px[:r])
+        t_buf[:r] = sample_t[lo:lo + r]
+        yield t_buf[:r], bid_px[:r], bid_sz[:r], ask_px[:r], ask_sz[:r]
 
 
 def replay_deltas(
     seed_book_row: pd.Series, delta_df: pd.DataFrame, t_end_us: int,
-    sample_cadence_us: int,
-) -> tuple[np.ndarray, dict, dict]:
+    sample_cadence_us: int, depth: int = 20,
+):
     """Replay book_delta_v2 events on top of a seed snapshot. Yield the live
     book state sampled at fixed cadence.
 
     Args:
         seed_book_row: a single row from `book` parquet — the snapshot at t_seed.
-        delta_df: book_delta_v2 frame, ordered by timestamp_us, restricted to
-            rows with timestamp_us >= seed_t_us.
+        delta_df: book_delta_v2 frame, ordered by timestamp_us. Rows before
+            the seed's timestamp_us are ignored.
         t_end_us: stop replay at this timestamp.
         sample_cadence_us: resample every this many microseconds (e.g. 100_000
             for 100 ms).
-
-    Returns:
-        (sample_times_us, bid_levels_at_each_sample, ask_levels_at_each_sample)
-        where bid_levels and ask_levels are lists of dicts (price -> size) at
-        each sample time. We use sorted dicts (Python 3.7+ preserves insertion
-        order; we keep them sorted manually after each batch of mutations).
-
-    We do NOT keep an in-memory copy of every level state per sample; instead
-    we yield via a generator pattern at the OBI computation layer to avoid
-    quadratic memory. See `obi_from_delta` which is the proper public API.
+        depth: top-N levels per side to report.
+
+    Yields:
+        (t_us, bid_px, bid_sz, ask_px, ask_sz) per sample: t_us is an int,
+        the rest are length-`depth` float64 views (best level first, NaN
+        price / 0 size past the last non-empty level). The views point into
+        preallocated buffers that later samples overwrite, so memory stays
+        bounded over a whole day; copy a row to keep it.
+
+    Sample times and the event prefix each sample sees are the same as in
+    `obi_from_delta`. Consumers that can work on whole blocks at once (OBI,
+    microprice over many samples) should use `replay_delta_blocks`.
     """
-    raise NotImplementedError("call obi_from_delta directly; this helper is"
-                              " unused and kept only as a doc placeholder")
+    for t, bid_px, bid_sz, ask_px, ask_sz in replay_delta_blocks(
+        seed_book_row, delta_df, depth, sample_cadence_us, t_end_us
+    ):
+        for k in range(len(t)):
+            yield int(t[k]), bid_px[k], bid_sz[k], ask_px[k], ask_sz[k]
 
 
 def obi_from_delta(
@@ -110,6 +534,7 @@ def obi_from_delta(
     lambda_decay: float,
     sample_cadence_us: int,
     t_end_us: int,
+    tick_size: float | None = None,
 ) -> tuple[np.ndarray, np.ndarray]:
     """Replay book_delta_v2 events on top of a seed snapshot, sample the live
     book at fixed cadence, and compute OBI on each sample.
@@ -122,75 +547,46 @@ def obi_from_delta(
             `timestamp_us`, `side_is_bid`, `price`, `size`. Filtered to
             `timestamp_us >= seed.timestamp_us` and ordered by timestamp_us.
         depth: top-N levels to use for OBI.
-        lambda_decay: exponential weight decay (per level index).
+        lambda_decay: exponential weight decay (per level index, or per
+            tick of distance from mid when `tick_size` is given).
         sample_cadence_us: resample every this many microseconds.
         t_end_us: stop replay at this timestamp (typically end of day).
+        tick_size: price increment for true-distance weights; None keeps
+            the index-distance weights.
 
     Returns (sample_times_us, obi) parallel int64/float64 arrays.
     """
-    if depth < 1:
-        raise ValueError(f"depth must be >= 1, got {depth}")
-
-    w = _exponential_weights(depth, lambda_decay)
-
-    # Seed the live book from the snapshot row.
-    bid_book: dict[float, float] = {}
-    ask_book: dict[float, float] = {}
-    seed_t_us = int(seed_book_row["timestamp_us"])
-    for i in range(20):
-        bp = float(seed_book_row.get(f"bid_{i}_price", float("nan")))
-        bs = float(seed_book_row.get(f"bid_{i}_size", 0.0))
-        if not np.isnan(bp) and bs > 0:
-            bid_book[bp] = bs
-        ap = float(seed_book_row.get(f"ask_{i}_price", float("nan")))
-        as_ = float(seed_book_row.get(f"ask_{i}_size", 0.0))
-        if not np.isnan(ap) and as_ > 0:
-            ask_book[ap] = as_
-
-    # Restrict deltas to t >= seed.
-    delta_df = delta_df[delta_df["timestamp_us"] >= seed_t_us]
-
-    ts_arr = delta_df["timestamp_us"].to_numpy(dtype=np.int64)
-    side_arr = delta_df["side_is_bid"].to_numpy(dtype=bool)
-    price_arr = delta_df["price"].to_numpy(dtype=np.float64)
-    size_arr = delta_df["size"].to_numpy(dtype=np.float64)
-    n = len(ts_arr)
+    t, _, obi = obi_sweep_from_delta(
+        seed_book_row, delta_df, [depth], [lambda_decay], sample_cadence_us, t_end_us,
+        tick_size,
+    )
+    return t, obi[:, 0]
 
-    sample_times: list[int] = []
-    obi_vals: list[float] = []
 
-    next_sample_t = seed_t_us + sample_cadence_us
-    i = 0
-    while i < n and ts_arr[i] <= t_end_us:
-        t = int(ts_arr[i])
-        # Apply all events before the next sample boundary.
-        while i < n and ts_arr[i] < next_sample_t:
-            p = float(price_arr[i])
-            s = float(size_arr[i])
-            if side_arr[i]:
-                if s == 0.0:
-                    bid_book.pop(p, None)
-                else:
-                    bid_book[p] = s
-            else:
-                if s == 0.0:
-                    ask_book.pop(p, None)
-                else:
-                    ask_book[p] = s
-            i += 1
+def obi_sweep_from_delta(
+    seed_book_row: pd.Series,
+    delta_df: pd.DataFrame,
+    depths,
+    lambdas,
+    sample_cadence_us: int,
+    t_end_us: int,
+    tick_size: float | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`obi_from_delta` for every (depth, lambda) pair in depths x lambdas,
+    from a single replay at the largest depth.
 
-        # Snapshot the live book at next_sample_t.
-        if next_sample_t > t_end_us:
-            break
-        # Top-N bids: highest prices first.
-        top_bids = sorted(bid_book.items(), key=lambda kv: -kv[0])[:depth]
-        top_asks = sorted(ask_book.items(), key=lambda kv: kv[0])[:depth]
-        qb = sum(w[k] * top_bids[k][1] for k in range(len(top_bids)))
-        qa = sum(w[k] * top_asks[k][1] for k in range(len(top_asks)))
-        denom = qb + qa
-        obi = (qb - qa) / denom if denom > 0 else 0.0
-        sample_times.append(next_sample_t)
-        obi_vals.append(obi)
-        next_sample_t += sample_cadence_us
-
-    return np.asarray(sample_times, dtype=np.int64), np.asarray(obi_vals, dtype=np.float64)
+    Returns (sample_times_us, params, obi) shaped as in `obi_sweep_from_book`.
+    """
+    params, W = _weight_matrix(depths, lambdas)
+    n_lambdas = len(np.atleast_1d(lambdas))
+    times: list[np.ndarray] = []
+    obis: list[np.ndarray] = []
+    for t, bid_px, bid_sz, ask_px, ask_sz in replay_delta_blocks(
+        seed_book_row, delta_df, W.shape[0], sample_cadence_us, t_end_us
+    ):
+        times.append(t.copy())
+        obis.append(_sweep_obi(bid_px, bid_sz, ask_px, ask_sz, params, W, n_lambdas, tick_size))
+
+    if not times:
+        return np.empty(0, dtype=np.int64), params, np.empty((0, len(params)), dtype=np.float64)
+    return np.concatenate(times), params, np.concatenate(obis)
@@ -0,0 +1,95 @@
+"""Vectorized bucketing and per-bucket PF stats for the stratify reports.
+
+The stratify scripts all print the same table: trips split into buckets of
+some entry feature, then trades / win% / PF / net / avg per bucket and a
+TOTAL row. They used to assign buckets with a Python scan per trip
+(`bucket_idx` via DataFrame.apply) and filter the frame once per bucket.
+Here buckets come from one np.searchsorted (or a single argsort for
+equal-count buckets) and every bucket's stats from one grouped
+aggregation, so a report is O(n log n) at worst with no per-trip Python.
+
+    from pf_table import bucket_index, pf_stats, pf_totals, fmt_pf
+    b = bucket_index(sub["ratio"].to_numpy(), CUTPOINTS)
+    stats = pf_stats(b, sub["net_pnl"].to_numpy(), len(CUTPOINTS) + 1)
+    for i, row in stats.iterrows():       # one row per non-empty bucket
+        print(BUCKET_LABELS[i], row.trades, row.win_pct, fmt_pf(row.pf), ...)
+
+PF is gross wins / gross losses. A bucket with wins and no losses has PF
+inf; pf_totals keeps the scripts' TOTAL-row convention of 0 instead.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+STAT_COLUMNS = ("trades", "wins", "win_pct", "pf", "net_pnl", "avg_pnl")
+
+
+def bucket_index(values: np.ndarray, cutpoints) -> np.ndarray:
+    """Bucket per value for ascending cutpoints: 0 below cutpoints[0], i for
+    cutpoints[i-1] <= v < cutpoints[i], len(cutpoints) at or above the last
+    (NaN too)."""
+    return np.searchsorted(np.asarray(cutpoints, dtype=np.float64),
+                           np.asarray(values, dtype=np.float64), side="right")
+
+
+def ntile_index(values: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Equal-count buckets 0..n_buckets-1 by rank (NTILE), ties in input
+    order."""
+    values = np.asarray(values)
+    out = np.empty(len(values), dtype=np.int64)
+    out[np.argsort(values, kind="stable")] = np.arange(len(values)) * n_buckets // max(len(values), 1)
+    return out
+
+
+def _pf(gross_win, gross_loss, no_loss):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(gross_loss > 0, gross_win / gross_loss,
+                        np.where(gross_win > 0, no_loss, 0.0))
+
+
+def pf_stats(bucket: np.ndarray, pnl: np.ndarray, n_buckets: int | None = None,
+             extra: dict[str, tuple[np.ndarray, str]] | None = None) -> pd.DataFrame:
+    """Per-bucket stats in one grouped aggregation.
+
+    Returns a frame indexed by bucket (ascending, empty buckets omitted,
+    and buckets >= n_buckets dropped when given) with STAT_COLUMNS plus
+    one column per `extra` entry {name: (values, agg)}, e.g.
+    {"med_lookback": (lookback_days, "median")}.
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    frame = {"bucket": np.asarray(bucket), "pnl": pnl, "win": pnl > 0,
+             "gross_win": np.where(pnl > 0, pnl, 0.0),
+             "gross_loss": np.where(pnl < 0, -pnl, 0.0)}
+    aggs = {"trades": ("pnl", "size"), "wins": ("win", "sum"),
+            "gross_win": ("gross_win", "sum"), "gross_loss": ("gross_loss", "sum"),
+            "net_pnl": ("pnl", "sum")}
+    for name, (values, how) in (extra or {}).items():
+        frame[f"_{name}"] = np.asarray(values)
+        aggs[name] = (f"_{name}", how)
+    g = pd.DataFrame(frame).groupby("bucket", sort=True).agg(**aggs)
+    if n_buckets is not None:
+        g = g[(g.index >= 0) & (g.index < n_buckets)]
+    g["win_pct"] = 100.0 * g["wins"] / g["trades"]
+    g["pf"] = _pf(g["gross_win"].to_numpy(), g["gross_loss"].to_numpy(), np.inf)
+    g["avg_pnl"] = g["net_pnl"] / g["trades"]
+    return g[list(STAT_COLUMNS) + list(extra or {})]
+
+
+def pf_totals(pnl: np.ndarray) -> pd.Series:
+    """The TOTAL row over all trips (PF 0 when there are no losses)."""
+    pnl = np.asarray(pnl, dtype=np.float64)
+    gross_win, gross_loss = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+    n = len(pnl)
+    return pd.Series({
+        "trades": n, "wins": int((pnl > 0).sum()),
+        "win_pct": 100.0 * (pnl > 0).sum() / n if n else 0.0,
+        "pf": float(_pf(gross_win, gross_loss, 0.0)),
+        "net_pnl": pnl.sum(), "avg_pnl": pnl.mean() if n else np.nan,
+    })
+
+
+def fmt_pf(pf: float) -> str:
+    """PF in the tables' 6-wide column, `inf` spelled out."""
+    return f"{pf:>6.2f}" if pf != float("inf") else "   inf"
@@ -14,17 +14,45 @@ each axis empirically across the trade population, bins each trade into a
     2. Trade-count table
     3. Net-pnl table
     4. The cutoff values themselves (so the user knows what the bins mean)
+
+--rvol-feature bins the rvol axis by a trip feature instead of the
+engine's ratio_at_entry (e.g. volratio:30d:8h), read from the trip
+feature store (feature_store.py) and computed from the bars on first use.
 """
 
+import argparse
+import os
 import sys
-from pathlib import Path
 
 import duckdb
+import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feature_store import DEFAULT_BARS_ROOT, DEFAULT_STORE_ROOT, with_feature  # noqa: E402
+from pf_table import pf_stats  # noqa: E402
+from trip_features import Feature  # noqa: E402
+
+
+def quintile_index(values: np.ndarray, cuts: list) -> np.ndarray:
+    """Quintile 0..4 per value for the six cutoffs, binned like
+    pd.cut(values, cuts, include_lowest=True): (c[i], c[i+1]], the first
+    bin also closed at the minimum. -1 for NaN."""
+    q = np.clip(np.searchsorted(cuts[1:-1], values, side="left"), 0, 4)
+    return np.where(np.isnan(values), -1, q)
 
-def quintile_breakdown(trips_csv: str) -> None:
+
+def quintile_breakdown(trips_csv: str, rvol_feature: str | None = None,
+                       bars_root: str = DEFAULT_BARS_ROOT,
+                       store_root: str = DEFAULT_STORE_ROOT) -> None:
     con = duckdb.connect()
+    source = f"read_csv_auto('{trips_csv}', HEADER=TRUE)"
+    if rvol_feature:
+        raw = pd.read_csv(trips_csv).drop(columns=["ratio_at_entry"], errors="ignore")
+        raw = with_feature(raw, trips_csv, Feature.parse(rvol_feature), "ratio_at_entry",
+                           bars_root, store_root)
+        con.register("raw_trips", raw)
+        source = "raw_trips"
     # abs(price_rise_at_entry) so the long engine (which writes negative
     # values for declines) bins by magnitude alongside the short engine.
     trips = con.execute(
@@ -33,7 +61,7 @@ def quintile_breakdown(trips_csv: str) -> None:
             ratio_at_entry           AS rvol,
             abs(price_rise_at_entry) AS pr,
             net_pnl
-        FROM read_csv_auto('{trips_csv}', HEADER=TRUE)
+        FROM {source}
         WHERE side IN ('short', 'long')
         """
     ).df()
@@ -47,12 +75,10 @@ def quintile_breakdown(trips_csv: str) -> None:
     rvol_cuts = trips["rvol"].quantile([0.0, 0.2, 0.4, 0.6, 0.8, 1.0]).tolist()
     pr_cuts   = trips["pr"  ].quantile([0.0, 0.2, 0.4, 0.6, 0.8, 1.0]).tolist()
 
-    # Bucket via pd.cut with include_lowest so the min boundary is inclusive.
-    # Labels 0..4 — Q1 is the lowest quintile.
-    rvol_q = pd.cut(trips["rvol"], bins=rvol_cuts, labels=False, include_lowest=True)
-    pr_q   = pd.cut(trips["pr"  ], bins=pr_cuts  , labels=False, include_lowest=True)
-    trips["rvol_q"] = rvol_q
-    trips["pr_q"]   = pr_q
+    # Labels 0..4 — Q1 is the lowest quintile; -1 for a missing value.
+    trips["rvol_q"] = quintile_index(trips["rvol"].to_numpy(), rvol_cuts)
+    trips["pr_q"]   = quintile_index(trips["pr"].to_numpy(), pr_cuts)
+    pnl = trips["net_pnl"].to_numpy()
 
     def fmt_table(values, fmt: str, fill: str = "    .   ") -> str:
         # values: dict-of-dicts {pr_q -> {rvol_q -> v}} effectively a pivot.
@@ -68,17 +94,12 @@ def quintile_breakdown(trips_csv: str) -> None:
             lines.append(" ".join(row))
         return "\n".join(lines)
 
-    # PF table.
-    pf_map = {}
-    cnt_map = {}
-    pnl_map = {}
-    for (rv, pr), grp in trips.groupby(["rvol_q", "pr_q"]):
-        gross_w = grp.loc[grp["net_pnl"] > 0, "net_pnl"].sum()
-        gross_l = -grp.loc[grp["net_pnl"] < 0, "net_pnl"].sum()
-        pf = (gross_w / gross_l) if gross_l > 0 else float("inf") if gross_w > 0 else 0.0
-        pf_map[(int(rv), int(pr))]  = pf
-        cnt_map[(int(rv), int(pr))] = int(len(grp))
-        pnl_map[(int(rv), int(pr))] = float(grp["net_pnl"].sum())
+    # Every cell's stats in one grouped aggregation over rvol_q * 5 + pr_q.
+    rv_q, pr_q = trips["rvol_q"].to_numpy(), trips["pr_q"].to_numpy()
+    cells = pf_stats(np.where((rv_q >= 0) & (pr_q >= 0), rv_q * 5 + pr_q, -1), pnl, 25)
+    pf_map  = {divmod(int(k), 5): float(r.pf) for k, r in cells.iterrows()}
+    cnt_map = {divmod(int(k), 5): int(r.trades) for k, r in cells.iterrows()}
+    pnl_map = {divmod(int(k), 5): float(r.net_pnl) for k, r in cells.iterrows()}
 
     print(f"Loose-gate ExtremeRvol trip CSV: {trips_csv}")
     print(f"Trade count: {n}")
@@ -100,33 +121,28 @@ def quintile_breakdown(trips_csv: str) -> None:
     print()
 
     # Marginal totals for sanity.
-    print("=== Marginal PF by rvol quintile (pooled across pr) ===")
-    for rv in range(5):
-        sub = trips[trips["rvol_q"] == rv]
-        if len(sub) == 0:
-            print(f"  rvolQ{rv+1}: no trades")
-            continue
-        gross_w = sub.loc[sub["net_pnl"] > 0, "net_pnl"].sum()
-        gross_l = -sub.loc[sub["net_pnl"] < 0, "net_pnl"].sum()
-        pf = (gross_w / gross_l) if gross_l > 0 else float("inf") if gross_w > 0 else 0.0
-        net = sub["net_pnl"].sum()
-        print(f"  rvolQ{rv+1}: PF={pf:5.2f}  trips={len(sub):5d}  netPnL=${net:9.0f}")
-
-    print()
-    print("=== Marginal PF by price-rise quintile (pooled across rvol) ===")
-    for pr in range(5):
-        sub = trips[trips["pr_q"] == pr]
-        if len(sub) == 0:
-            print(f"  prQ{pr+1}: no trades")
-            continue
-        gross_w = sub.loc[sub["net_pnl"] > 0, "net_pnl"].sum()
-        gross_l = -sub.loc[sub["net_pnl"] < 0, "net_pnl"].sum()
-        pf = (gross_w / gross_l) if gross_l > 0 else float("inf") if gross_w > 0 else 0.0
-        net = sub["net_pnl"].sum()
-        print(f"  prQ{pr+1}: PF={pf:5.2f}  trips={len(sub):5d}  netPnL=${net:9.0f}")
+    for title, other, col, name in (("rvol", "pr", "rvol_q", "rvolQ"),
+                                    ("price-rise", "rvol", "pr_q", "prQ")):
+        print(f"=== Marginal PF by {title} quintile (pooled across {other}) ===")
+        marg = pf_stats(trips[col].to_numpy(), pnl, 5)
+        for q in range(5):
+            if q not in marg.index:
+                print(f"  {name}{q+1}: no trades")
+                continue
+            r = marg.loc[q]
+            print(f"  {name}{q+1}: PF={r.pf:5.2f}  trips={int(r.trades):5d}  netPnL=${r.net_pnl:9.0f}")
+        if col == "rvol_q":
+            print()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        sys.exit("usage: quintile_bin_extreme_rvol.py <trips.csv>")
-    quintile_breakdown(sys.argv[1])
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("trips_csv")
+    ap.add_argument("--rvol-feature",
+                    help="Trip feature spec for the rvol axis, e.g. volratio:30d:8h. "
+                         "Default: the CSV's ratio_at_entry.")
+    ap.add_argument("--bars-root", default=DEFAULT_BARS_ROOT)
+    ap.add_argument("--store-root", default=DEFAULT_STORE_ROOT)
+    args = ap.parse_args()
+    quintile_breakdown(args.trips_csv, args.rvol_feature, args.bars_root, args.store_root)
@@ -0,0 +1,126 @@
+"""Run per-symbol work across a process pool, merging in input order.
+
+The stratify scripts loop `for sym, sub in by_symbol.items()` doing
+independent work per symbol. `run_symbols` spreads those calls over worker
+processes and hands the results back in the order the jobs were given, so
+a parallel run prints and writes exactly what the serial loop did.
+
+Each worker gets a thread budget (the cores divided among the workers).
+The usual BLAS/OpenMP/Polars environment variables are set in the parent
+while the pool starts, so they are in place before a worker loads those
+libraries; libraries the parent had already loaded come over with the
+fork, so the worker also applies the budget to their BLAS/OpenMP pools
+through threadpoolctl when it is installed (Polars sizes its pool once,
+at import). The DuckDB connection returned by `worker_duckdb()` is opened
+once per worker process with the budget and reused for every symbol it
+handles.
+
+Usage from a sibling script:
+
+    from symbol_pool import add_pool_args, run_symbols
+    jobs = [(sym, sub, bars_root) for sym, sub in by_symbol.items()]
+    results = run_symbols(per_symbol_task, jobs, workers=args.workers)
+
+`per_symbol_task` must be a module-level function (workers import it by
+name). With workers=1 everything runs in the calling process.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Sequence
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # optional: env vars only
+    threadpool_limits = None
+
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+               "NUMEXPR_NUM_THREADS", "POLARS_MAX_THREADS")
+
+_threads: int | None = None
+_duckdb = None
+
+
+@contextmanager
+def _thread_env(threads: int):
+    """Set the thread env vars for workers started inside the block, and
+    restore the parent's afterwards."""
+    saved = {name: os.environ.get(name) for name in _THREAD_ENV}
+    os.environ.update({name: str(threads) for name in _THREAD_ENV})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _init_worker(threads: int):
+    global _threads
+    _threads = threads
+    if threadpool_limits is not None:
+        threadpool_limits(threads)
+
+
+def worker_duckdb():
+    """This process's DuckDB connection, limited to the worker's thread
+    budget. Opened on first use; in the parent it is an ordinary
+    connection with DuckDB's default thread count."""
+    global _duckdb
+    if _duckdb is None:
+        import duckdb
+        _duckdb = duckdb.connect()
+        if _threads is not None:
+            _duckdb.execute(f"SET threads TO {_threads}")
+    return _duckdb
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def run_symbols(fn: Callable, jobs: Sequence[tuple], workers: int | None = None,
+                threads_per_worker: int | None = None, progress_every: int = 50,
+                label: str = "processed") -> list:
+    """[fn(*job) for job in jobs], computed on `workers` processes.
+
+    Results come back in job order whatever order the workers finish in.
+    Progress goes to stderr every `progress_every` completions. An
+    exception in any job is re-raised here.
+    """
+    workers = min(workers or default_workers(), max(len(jobs), 1))
+    n = len(jobs)
+    if workers <= 1:
+        out = []
+        for i, job in enumerate(jobs, start=1):
+            out.append(fn(*job))
+            if i % progress_every == 0 or i == n:
+                print(f"  [{i:>4d}/{n}] {label}", file=sys.stderr)
+        return out
+
+    threads = threads_per_worker or max(1, default_workers() // workers)
+    out = [None] * n
+    # Workers fork on the first submits, so the env stays set for the run.
+    with _thread_env(threads), ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = {pool.submit(fn, *job): i for i, job in enumerate(jobs)}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            out[futures[fut]] = fut.result()
+            if done % progress_every == 0 or done == n:
+                print(f"  [{done:>4d}/{n}] {label}", file=sys.stderr)
+    return out
+
+
+def add_pool_args(ap):
+    """--workers / --threads-per-worker, shared by the per-symbol scripts."""
+    ap.add_argument("--workers", type=int, default=None,
+                    help=f"Worker processes for per-symbol work. Default: all cores "
+                         f"({default_workers()}); 1 runs serially.")
+    ap.add_argument("--threads-per-worker", type=int, default=None,
+                    help="Thread budget per worker. Default: cores / workers.")
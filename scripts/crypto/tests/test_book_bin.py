@@ -0,0 +1,127 @@
+"""BookBin round-trips to the parquet it was converted from.
+
+Prices are parsed from decimal strings, as the recorder's are, so a
+decoded price has to be the same float bit for bit: the delta replay keys
+its ladder by price, and an off-by-an-ulp seed level never gets deleted.
+The staleness checks cover BookBin.for_parquet against a rewritten parquet.
+
+    python -m pytest -q scripts/crypto/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import book_bin  # noqa: E402
+from book_bin import BookBin  # noqa: E402
+from obi import obi_sweep_from_delta  # noqa: E402
+
+TICK = 0.1
+LEVELS = 20
+T0 = 1_769_817_600_000_000
+
+
+def _px(ticks):
+    """Price of an integer tick count, as a parser reads it from text."""
+    return float(f"{ticks // 10}.{ticks % 10}")
+
+
+def _book(seed, rows=40):
+    rng = np.random.default_rng(seed)
+    mid = 870_000 + np.cumsum(rng.integers(-3, 4, rows))
+    out = {
+        "timestamp_us": T0 + 100_000 * np.arange(rows, dtype=np.int64),
+        "received_time_us": T0 + 100_000 * np.arange(rows, dtype=np.int64) + 500,
+        "sequence_number": np.arange(rows, dtype=np.int64),
+    }
+    for side, sign in (("bid", -1), ("ask", 1)):
+        depth = rng.integers(LEVELS - 4, LEVELS + 1, rows)  # some empty tails
+        for j in range(LEVELS):
+            ticks = mid + sign * (1 + j)
+            empty = j >= depth
+            out[f"{side}_{j}_price"] = [np.nan if e else _px(int(t)) for t, e in zip(ticks, empty)]
+            out[f"{side}_{j}_size"] = np.where(empty, np.nan, np.round(rng.exponential(1.0, rows), 3))
+    return pd.DataFrame(out)
+
+
+def _deltas(book, seed, n=400):
+    """Updates and deletes on the same price grid, starting at the first
+    snapshot, that delete each seed level at least once."""
+    rng = np.random.default_rng(seed)
+    seed_row = book.iloc[0]
+    rows = []
+    for k, side in enumerate(("bid", "ask")):
+        for j in range(LEVELS):
+            p = seed_row[f"{side}_{j}_price"]
+            if not np.isnan(p):
+                rows.append((T0 + 1_000 * (1 + j + k * LEVELS), side == "bid", p, 0.0))
+    ts = T0 + np.sort(rng.integers(50_000, 3_000_000, n))
+    mid = 870_000
+    for t in ts:
+        is_bid = bool(rng.random() < 0.5)
+        ticks = mid + (-1 if is_bid else 1) * int(rng.integers(1, 30))
+        size = 0.0 if rng.random() < 0.2 else round(float(rng.exponential(1.0)), 3)
+        rows.append((int(t), is_bid, _px(ticks), size))
+    return pd.DataFrame(rows, columns=["timestamp_us", "side_is_bid", "price", "size"])
+
+
+@pytest.fixture(params=range(3))
+def converted(request, tmp_path):
+    book = _book(request.param)
+    path = str(tmp_path / "2026-01-31.parquet")
+    book.to_parquet(path, row_group_size=16)
+    book_bin.convert(path, TICK)
+    return request.param, book, path
+
+
+def test_row_round_trips(converted):
+    _, book, path = converted
+    bb = BookBin.open(book_bin.bookbin_path(path))
+    assert len(bb) == len(book)
+    for i in range(len(book)):
+        want = book.iloc[i].to_dict()
+        got = bb.row(i)
+        assert got.keys() == want.keys()
+        for key, v in want.items():
+            assert got[key] == v or (np.isnan(got[key]) and np.isnan(v)), (i, key, got[key], v)
+
+
+def test_price_matches_parquet(converted):
+    _, book, path = converted
+    bb = BookBin.open(book_bin.bookbin_path(path))
+    for side in ("bid", "ask"):
+        want = book[[f"{side}_{j}_price" for j in range(LEVELS)]].to_numpy()
+        np.testing.assert_array_equal(bb.price(side), want)
+
+
+def test_replay_seed_from_bookbin_matches_parquet(converted):
+    seed, book, path = converted
+    bb = BookBin.open(book_bin.bookbin_path(path))
+    deltas = _deltas(book, seed)
+    t_end = int(deltas["timestamp_us"].iloc[-1])
+    for tick_size in (None, TICK):
+        runs = [obi_sweep_from_delta(row, deltas, depths=[5, 10], lambdas=[0.0, 0.5],
+                                     sample_cadence_us=10_000, t_end_us=t_end, tick_size=tick_size)
+                for row in (book.iloc[0], bb.row(0))]
+        (t_pq, _, obi_pq), (t_bb, _, obi_bb) = runs
+        np.testing.assert_array_equal(t_bb, t_pq)
+        np.testing.assert_array_equal(obi_bb, obi_pq)
+
+
+def test_for_parquet_rejects_stale(converted):
+    _, book, path = converted
+    assert BookBin.for_parquet(path) is not None
+    book.iloc[:-1].to_parquet(path, row_group_size=16)
+    assert BookBin.for_parquet(path) is None
+    book_bin.convert(path, TICK)
+    bb = BookBin.for_parquet(path)
+    assert bb is not None and len(bb) == len(book) - 1
+
+
+def test_for_parquet_missing(tmp_path):
+    assert BookBin.for_parquet(str(tmp_path / "2026-01-31.parquet")) is None
@@ -0,0 +1,167 @@
+"""Parity of chart_volume_bars.build_dollar_bars and
+chart_imbalance_bars.build_imbalance_bars with the per-trade loops they
+replaced.
+
+The legacy_* functions are the pre-migration loops (bar logic only).
+Tapes have fractional quantities, where a cumsum-based split drifts
+across bar edges. Bar count, n_trades, timestamps, OHLC and bar_sign
+must match exactly; $ stats to 1e-9.
+
+    python -m pytest -q scripts/crypto/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart_imbalance_bars  # noqa: E402
+import chart_volume_bars  # noqa: E402
+
+EXACT = ("open", "high", "low", "close", "start_us", "end_us", "n_trades")
+CLOSE = ("dv", "vwap", "duration_s", "buy_dv", "sell_dv", "signed_dv", "cum_dv")
+
+
+def _tape(seed, n=2000):
+    """Ticks on a 0.5 grid and lots on a 0.01 grid with a few trades per
+    bar, so the running $ sum often lands within an ulp of the edge.
+    Returns (df, integer $ threshold)."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "price": np.round(2.0 * (100.0 + np.cumsum(rng.normal(0.0, 0.2, n)))) / 2.0,
+        "quantity": np.round(rng.exponential(0.05, n), 2),  # includes some zeros
+        "timestamp_us": 1_700_000_000_000_000 + np.cumsum(rng.integers(0, 5000, n)),
+        "sign": np.where(rng.random(n) < 0.5, -1.0, 1.0),
+    })
+    return df, round(float((df.price * df.quantity).mean()) * rng.uniform(4, 16))
+
+
+def _empty():
+    return {"prices": [], "dvs": [], "ts": [], "signs": [], "dv": 0.0, "bar_sign": 0}
+
+
+def _add(b, price, dv, ts, sign):
+    b["prices"].append(price)
+    b["dvs"].append(dv)
+    b["ts"].append(ts)
+    b["signs"].append(sign)
+    b["dv"] += dv
+
+
+def _finalize(bar):
+    prices = np.asarray(bar["prices"])
+    dvs = np.asarray(bar["dvs"])
+    signs = np.asarray(bar["signs"])
+    total = dvs.sum()
+    buy_dv = float(dvs[signs > 0].sum())
+    sell_dv = float(dvs[signs < 0].sum())
+    return {
+        "dv": float(total),
+        "vwap": float((prices * dvs).sum() / total),
+        "open": float(prices[0]),
+        "high": float(prices.max()),
+        "low": float(prices.min()),
+        "close": float(prices[-1]),
+        "start_us": int(bar["ts"][0]),
+        "end_us": int(bar["ts"][-1]),
+        "duration_s": (bar["ts"][-1] - bar["ts"][0]) / 1e6,
+        "n_trades": len(prices),
+        "buy_dv": buy_dv,
+        "sell_dv": sell_dv,
+        "signed_dv": buy_dv - sell_dv,
+        "bar_sign": int(bar["bar_sign"]),
+    }
+
+
+def _columns(df):
+    return (df.price.to_numpy(dtype=np.float64), df.quantity.to_numpy(dtype=np.float64),
+            df.timestamp_us.to_numpy(dtype=np.int64), df.sign.to_numpy(dtype=np.float64))
+
+
+def legacy_dollar_bars(df, dollar_per_bar):
+    p, q, t, s = _columns(df)
+    dv = p * q
+    bars = []
+    cur = _empty()
+    for i in range(len(df)):
+        remaining_dv = dv[i]
+        while remaining_dv > 0:
+            space = dollar_per_bar - cur["dv"]
+            if remaining_dv <= space:
+                _add(cur, p[i], remaining_dv, int(t[i]), s[i])
+                remaining_dv = 0.0
+            else:
+                if space > 0:
+                    _add(cur, p[i], space, int(t[i]), s[i])
+                    remaining_dv -= space
+                bars.append(_finalize(cur))
+                cur = _empty()
+    if cur["dv"] > 0:
+        bars.append(_finalize(cur))
+    return bars
+
+
+def legacy_imbalance_bars(df, threshold):
+    p, q, t, s = _columns(df)
+    dv = p * q
+    bars = []
+    cur = _empty()
+    theta = 0.0
+    for i in range(len(df)):
+        remaining_dv = dv[i]
+        sign_i = s[i]
+        while remaining_dv > 0:
+            theta_after_full = theta + sign_i * remaining_dv
+            if abs(theta_after_full) < threshold:
+                _add(cur, p[i], remaining_dv, int(t[i]), sign_i)
+                theta = theta_after_full
+                remaining_dv = 0.0
+            else:
+                target = threshold if sign_i > 0 else -threshold
+                x = (target - theta) / sign_i
+                if x <= 0:
+                    x = 0.0
+                if x > remaining_dv:
+                    x = remaining_dv
+                if x > 0:
+                    _add(cur, p[i], x, int(t[i]), sign_i)
+                    theta += sign_i * x
+                    remaining_dv -= x
+                bar_sign = 1 if theta > 0 else -1
+                cur["bar_sign"] = bar_sign
+                bars.append(_finalize(cur))
+                cur = _empty()
+                theta = theta - bar_sign * threshold
+    if cur["dv"] > 0:
+        cur["bar_sign"] = 1 if theta > 0 else (-1 if theta < 0 else 1)
+        bars.append(_finalize(cur))
+    return bars
+
+
+def _assert_bars_equal(old, new, exact=EXACT):
+    assert len(new["dv"]) == len(old)
+    cum = np.cumsum([b["dv"] for b in old])
+    for key in exact:
+        np.testing.assert_array_equal(new[key], [b[key] for b in old], err_msg=key)
+    for key in CLOSE:
+        want = cum if key == "cum_dv" else [b[key] for b in old]
+        np.testing.assert_allclose(new[key], want, rtol=1e-9, atol=1e-6, err_msg=key)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_dollar_bars(seed):
+    df, dollar_per_bar = _tape(seed)
+    new = chart_volume_bars.build_dollar_bars(df, dollar_per_bar)
+    _assert_bars_equal(legacy_dollar_bars(df, dollar_per_bar), new)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_imbalance_bars(seed):
+    df, threshold = _tape(seed)
+    new = chart_imbalance_bars.build_imbalance_bars(df, threshold)
+    _assert_bars_equal(legacy_imbalance_bars(df, threshold), new,
+                       exact=EXACT + ("bar_sign",))
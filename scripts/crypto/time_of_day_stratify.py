@@ -15,10 +15,15 @@ Use:
 
 import argparse
 import os
+import sys
 
 import duckdb
+import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pf_table import fmt_pf, pf_stats, pf_totals  # noqa: E402
+
 
 DEFAULT_TRIPS = "data/crypto/cumsum_z_persistexit/backtest_results_trips_1m_th15_ls.csv"
 
@@ -27,7 +32,7 @@ DOW_LABELS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 
 def print_side_table(df: pd.DataFrame, side_str: str, group_col: str,
                      group_labels):
-    sub = df[df["side"] == side_str].copy()
+    sub = df[df["side"] == side_str]
     if len(sub) == 0:
         return
     side_print = "LONG" if side_str == "long" else "SHORT"
@@ -35,35 +40,20 @@ def print_side_table(df: pd.DataFrame, side_str: str, group_col: str,
     print(f"  {group_col:<10s}  {'trades':>7s}  {'win%':>6s}  "
           f"{'PF':>6s}  {'net_pnl$':>11s}  {'avg_pnl$':>9s}")
     print("  " + "-" * 64)
-    grouped = sub.groupby(group_col)
-    for key in group_labels:
-        if key not in grouped.groups:
-            continue
-        b = grouped.get_group(key)
-        wins = (b["net_pnl"] > 0).sum()
-        losses_sum = -b.loc[b["net_pnl"] < 0, "net_pnl"].sum()
-        wins_sum = b.loc[b["net_pnl"] > 0, "net_pnl"].sum()
-        pf = (wins_sum / losses_sum) if losses_sum > 0 \
-             else float("inf") if wins_sum > 0 else 0.0
-        avg_pnl = b["net_pnl"].mean()
-        net_pnl = b["net_pnl"].sum()
-        wr = 100.0 * wins / len(b)
-        pf_s = f"{pf:>6.2f}" if pf != float("inf") else "   inf"
+    # Position in group_labels is the bucket; values not listed fall out.
+    codes = pd.Index(group_labels).get_indexer(sub[group_col])
+    for i, r in pf_stats(codes, sub["net_pnl"].to_numpy(), len(group_labels)).iterrows():
+        key = group_labels[i]
         if isinstance(key, int) and group_col == "hour_utc":
             label = f"{key:02d}:00"
         else:
             label = str(key)
-        print(f"  {label:<10s}  {len(b):>7d}  {wr:>5.1f}%  "
-              f"{pf_s}  {net_pnl:>+11,.0f}  {avg_pnl:>+9,.2f}")
-    total_pnl = sub["net_pnl"].sum()
-    total_wins = (sub["net_pnl"] > 0).sum()
-    wins_sum = sub.loc[sub["net_pnl"] > 0, "net_pnl"].sum()
-    losses_sum = -sub.loc[sub["net_pnl"] < 0, "net_pnl"].sum()
-    pf = (wins_sum / losses_sum) if losses_sum > 0 else 0.0
-    wr = 100.0 * total_wins / len(sub)
+        print(f"  {label:<10s}  {int(r.trades):>7d}  {r.win_pct:>5.1f}%  "
+              f"{fmt_pf(r.pf)}  {r.net_pnl:>+11,.0f}  {r.avg_pnl:>+9,.2f}")
+    t = pf_totals(sub["net_pnl"].to_numpy())
     print("  " + "-" * 64)
-    print(f"  {'TOTAL':<10s}  {len(sub):>7d}  {wr:>5.1f}%  "
-          f"{pf:>6.2f}  {total_pnl:>+11,.0f}  {sub['net_pnl'].mean():>+9,.2f}")
+    print(f"  {'TOTAL':<10s}  {int(t.trades):>7d}  {t.win_pct:>5.1f}%  "
+          f"{t.pf:>6.2f}  {t.net_pnl:>+11,.0f}  {t.avg_pnl:>+9,.2f}")
 
 
 def main():
@@ -85,7 +75,7 @@ def main():
         FROM read_csv_auto('{trips_path}')
     """).fetchdf()
     # DuckDB %w: Sun=0..Sat=6. Remap to Mon=0..Sun=6.
-    df["dow"] = ((df["dow_sun0"] - 1) % 7).map(lambda i: DOW_LABELS[i])
+    df["dow"] = np.array(DOW_LABELS)[(df["dow_sun0"].to_numpy() - 1) % 7]
 
     print(f"Loaded {len(df):,} trips from {args.trips}")
     print()
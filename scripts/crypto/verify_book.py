@@ -1,153 +1,311 @@
-"""Sanity-check a downloaded Crypto Lake book parquet.
+"""Sanity-check downloaded Crypto Lake book parquets.
 
 Runs the verification checklist from the v0 plan:
   1. Schema — confirm timestamp_us + 20×{bid,ask}×{price,size} columns.
-  2. Monotonicity — bid_0_price > bid_1_price > ... and ask_0_price < ask_1_price < ...
-     per row (the level-ordering invariant).
+  2. Monotonicity — bid_0_price > bid_1_price > ... > bid_19_price and
+     ask_0_price < ... < ask_19_price per row (the level-ordering invariant),
+     over all 20 levels. Null trailing levels are allowed.
   3. Spread non-negativity — ask_0_price >= bid_0_price every row.
-  4. Cadence — median, p99, max gap between consecutive snapshots.
+  4. Cadence — median, p95, p99, max gap between consecutive snapshots.
   5. Imbalance shape — for top-1, top-5, top-10 cumulative quantities,
      compute I = (Q_bid - Q_ask) / (Q_bid + Q_ask) and dump quantiles.
 
+Each file is read once, a row group at a time; every check is a NumPy
+reduction over the row group's (rows, 20) price / size matrices, so only
+the timestamps and per-row imbalances are kept for the quantiles. A
+`.bookbin` (book_bin.py) is checked the same way straight from its
+memory-mapped matrices. A directory (or several paths) is verified in
+parallel, one file per worker process, with a one-line result per day and
+an optional summary table.
+
 Usage:
     python scripts/crypto/verify_book.py \\
         --input /mnt/d/trading-edge-bulk/crypto/lake/book/BINANCE/BTC-USDT/2022-10-01.parquet
+
+    # Overnight backfill check: every day of every symbol, 8 processes
+    python scripts/crypto/verify_book.py \\
+        --input /mnt/d/trading-edge-bulk/crypto/lake/book/BINANCE_FUTURES \\
+        --workers 8 --summary logs/verify_book.csv
 """
 
 from __future__ import annotations
 
 import argparse
+import glob
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
-import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from book_bin import BookBin  # noqa: E402
 
-def _check_schema(con: duckdb.DuckDBPyConnection, path: str) -> bool:
-    cols = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{path}') LIMIT 0").fetchall()
-    names = {c[0] for c in cols}
-    required = {"timestamp_us", "received_time_us", "sequence_number"}
-    for side in ("bid", "ask"):
-        for i in range(20):
-            required.add(f"{side}_{i}_price")
-            required.add(f"{side}_{i}_size")
-    missing = required - names
-    extra = names - required
-    print(f"[1/5] schema: {len(names)} columns")
-    if missing:
-        print(f"        MISSING: {sorted(missing)}")
-    if extra:
-        print(f"        extra (informational): {sorted(extra)}")
-    return not missing
-
-
-def _check_level_ordering(con: duckdb.DuckDBPyConnection, path: str) -> bool:
-    """Confirm bid_0 > bid_1 > ... and ask_0 < ask_1 < ... per row.
-    Allow null trailing levels (some symbols may not have 20 levels filled).
+N_LEVELS = 20
+IMBALANCE_TOPS = (1, 5, 10)
+CADENCE_QUANTILES = (0.5, 0.95, 0.99)
+IMBALANCE_QUANTILES = (0.05, 0.5, 0.95)
+# Rows per block when scanning a .bookbin.
+BOOKBIN_CHUNK = 262_144
+
+META_COLUMNS = ("timestamp_us", "received_time_us", "sequence_number")
+LEVEL_COLUMNS = tuple(
+    f"{side}_{i}_{field}"
+    for side in ("bid", "ask") for i in range(N_LEVELS) for field in ("price", "size")
+)
+
+
+def _level_matrix(tbl, side: str, field: str, n_levels: int) -> np.ndarray:
+    """(rows, n_levels) float64 matrix of `{side}_{i}_{field}`; nulls -> NaN."""
+    return np.column_stack([
+        tbl.column(f"{side}_{i}_{field}").to_numpy().astype(np.float64, copy=False)
+        for i in range(n_levels)
+    ])
+
+
+def _ordering_violations(px: np.ndarray, strictly_decreasing: bool) -> tuple[int, np.ndarray]:
+    """Rows breaking strict level order, and violations per adjacent level
+    pair. Comparisons with NaN are False, so null levels never count."""
+    bad = px[:, :-1] <= px[:, 1:] if strictly_decreasing else px[:, :-1] >= px[:, 1:]
+    return int(bad.any(axis=1).sum()), bad.sum(axis=0)
+
+
+def _parquet_blocks(path: str):
+    """(column names, n_levels, blocks) for a book parquet: one block per
+    row group of (timestamps or None, bid_px, ask_px, bid_sz, ask_sz)."""
+    pf = pq.ParquetFile(path)
+    names = set(pf.schema_arrow.names)
+    # Levels present on both sides for both fields, from the top down.
+    n_levels = 0
+    while n_levels < N_LEVELS and all(
+        f"{side}_{n_levels}_{field}" in names for side in ("bid", "ask") for field in ("price", "size")
+    ):
+        n_levels += 1
+    has_ts = "timestamp_us" in names
+    columns = (["timestamp_us"] if has_ts else []) + [
+        f"{side}_{i}_{field}"
+        for side in ("bid", "ask") for i in range(n_levels) for field in ("price", "size")
+    ]
+
+    def blocks():
+        for rg in range(pf.num_row_groups):
+            tbl = pf.read_row_group(rg, columns=columns)
+            yield (tbl.column("timestamp_us").to_numpy() if has_ts else None,
+                   *(_level_matrix(tbl, side, field, n_levels)
+                     for field in ("price", "size") for side in ("bid", "ask")))
+
+    return names, n_levels, blocks()
+
+
+def _bookbin_blocks(path: str, chunk: int = BOOKBIN_CHUNK):
+    """As _parquet_blocks for a .bookbin, in `chunk`-row slices of the
+    memory-mapped matrices. Every column is present by construction."""
+    book = BookBin.open(path)
+    names = set(META_COLUMNS) | {
+        f"{side}_{i}_{field}"
+        for side in ("bid", "ask") for i in range(book.levels) for field in ("price", "size")
+    }
+
+    def blocks():
+        for lo in range(0, len(book), chunk):
+            b = book[lo:lo + chunk]
+            yield (np.asarray(b.timestamp_us), b.price("bid"), b.price("ask"),
+                   b.size("bid"), b.size("ask"))
+
+    return names, book.levels, blocks()
+
+
+def verify_file(path: str) -> dict:
+    """Run every check on one book parquet (or .bookbin) in a single pass.
+
+    Returns a flat dict of results (one summary-table row); 'ok' is the
+    pass/fail verdict (schema, level ordering and spread).
     """
-    bid_violations = con.execute(f"""
-      SELECT COUNT(*) FROM read_parquet('{path}')
-      WHERE
-        (bid_0_price IS NOT NULL AND bid_1_price IS NOT NULL AND bid_0_price <= bid_1_price)
-        OR (bid_1_price IS NOT NULL AND bid_2_price IS NOT NULL AND bid_1_price <= bid_2_price)
-    """).fetchone()[0]
-    ask_violations = con.execute(f"""
-      SELECT COUNT(*) FROM read_parquet('{path}')
-      WHERE
-        (ask_0_price IS NOT NULL AND ask_1_price IS NOT NULL AND ask_0_price >= ask_1_price)
-        OR (ask_1_price IS NOT NULL AND ask_2_price IS NOT NULL AND ask_1_price >= ask_2_price)
-    """).fetchone()[0]
-    print(f"[2/5] level ordering: bid_violations={bid_violations:,}  ask_violations={ask_violations:,}")
-    return bid_violations == 0 and ask_violations == 0
-
-
-def _check_spread(con: duckdb.DuckDBPyConnection, path: str) -> bool:
-    crossed = con.execute(f"""
-      SELECT COUNT(*) FROM read_parquet('{path}')
-      WHERE ask_0_price < bid_0_price
-    """).fetchone()[0]
-    locked = con.execute(f"""
-      SELECT COUNT(*) FROM read_parquet('{path}')
-      WHERE ask_0_price = bid_0_price
-    """).fetchone()[0]
-    total = con.execute(f"SELECT COUNT(*) FROM read_parquet('{path}')").fetchone()[0]
-    print(f"[3/5] spread: total={total:,}  crossed={crossed:,}  locked={locked:,}")
-    return crossed == 0
-
-
-def _check_cadence(con: duckdb.DuckDBPyConnection, path: str) -> None:
-    r = con.execute(f"""
-      WITH t AS (
-        SELECT timestamp_us, LAG(timestamp_us) OVER (ORDER BY timestamp_us) AS prev_ts
-        FROM read_parquet('{path}')
-      )
-      SELECT
-        QUANTILE_CONT(timestamp_us - prev_ts, 0.5) AS p50,
-        QUANTILE_CONT(timestamp_us - prev_ts, 0.95) AS p95,
-        QUANTILE_CONT(timestamp_us - prev_ts, 0.99) AS p99,
-        MAX(timestamp_us - prev_ts) AS max_gap,
-        COUNT(*) AS n_intervals
-      FROM t WHERE prev_ts IS NOT NULL
-    """).fetchone()
-    p50, p95, p99, max_gap, n = r
-    print(f"[4/5] cadence over {n:,} intervals:")
-    print(f"        p50={p50/1000:.1f}ms  p95={p95/1000:.1f}ms  p99={p99/1000:.1f}ms  max={max_gap/1000:.1f}ms")
-
-
-def _check_imbalance(con: duckdb.DuckDBPyConnection, path: str) -> None:
-    """Compute I_top1, I_top5, I_top10 and dump quantiles."""
+    if path.endswith(".bookbin"):
+        names, n_levels, blocks = _bookbin_blocks(path)
+    else:
+        names, n_levels, blocks = _parquet_blocks(path)
+    required = set(META_COLUMNS) | set(LEVEL_COLUMNS)
+    missing = sorted(required - names)
+    extra = sorted(names - required)
+
+    n_rows = crossed = locked = bid_viol = ask_viol = 0
+    bid_pairs = np.zeros(max(n_levels - 1, 0), dtype=np.int64)
+    ask_pairs = np.zeros(max(n_levels - 1, 0), dtype=np.int64)
+    ts_parts: list[np.ndarray] = []
+    tops = [t for t in IMBALANCE_TOPS if t <= n_levels]
+    imb_parts: dict[int, list[np.ndarray]] = {t: [] for t in tops}
+    q_sums = {t: np.zeros(2) for t in tops}
+
+    for ts, bid_px, ask_px, bid_sz, ask_sz in blocks:
+        n_rows += len(bid_px)
+        if ts is not None:
+            ts_parts.append(ts)
+        if n_levels == 0:
+            continue
+
+        rows, pairs = _ordering_violations(bid_px, strictly_decreasing=True)
+        bid_viol += rows
+        bid_pairs += pairs
+        rows, pairs = _ordering_violations(ask_px, strictly_decreasing=False)
+        ask_viol += rows
+        ask_pairs += pairs
+        crossed += int((ask_px[:, 0] < bid_px[:, 0]).sum())
+        locked += int((ask_px[:, 0] == bid_px[:, 0]).sum())
+
+        # Cumulative queue at each depth; missing sizes count as 0.
+        qb = np.cumsum(np.nan_to_num(bid_sz, nan=0.0), axis=1, dtype=np.float64)
+        qa = np.cumsum(np.nan_to_num(ask_sz, nan=0.0), axis=1, dtype=np.float64)
+        for t in tops:
+            b, a = qb[:, t - 1], qa[:, t - 1]
+            keep = (b + a) > 0
+            b, a = b[keep], a[keep]
+            imb_parts[t].append((b - a) / (b + a))
+            q_sums[t] += (b.sum(), a.sum())
+
+    res = {
+        "path": path,
+        "rows": n_rows,
+        "mb": os.path.getsize(path) / 1e6,
+        "n_columns": len(names),
+        "missing": " ".join(missing),
+        "extra": " ".join(extra),
+        "bid_violations": bid_viol,
+        "ask_violations": ask_viol,
+        "bid_pair_violations": bid_pairs.tolist(),
+        "ask_pair_violations": ask_pairs.tolist(),
+        "crossed": crossed,
+        "locked": locked,
+    }
+
+    ts = np.concatenate(ts_parts) if ts_parts else np.empty(0, dtype=np.int64)
+    res["out_of_order"] = int((np.diff(ts) < 0).sum())
+    gaps = np.diff(np.sort(ts))
+    res["n_intervals"] = len(gaps)
+    for q, v in zip(CADENCE_QUANTILES, _quantiles(gaps, CADENCE_QUANTILES)):
+        res[f"gap_p{round(q * 100):02d}_ms"] = v / 1000
+    res["gap_max_ms"] = gaps.max() / 1000 if len(gaps) else np.nan
+
+    for t in IMBALANCE_TOPS:
+        imb = np.concatenate(imb_parts[t]) if imb_parts.get(t) else np.empty(0)
+        for q, v in zip(IMBALANCE_QUANTILES, _quantiles(imb, IMBALANCE_QUANTILES)):
+            res[f"imb{t}_p{round(q * 100):02d}"] = v
+        n = len(imb)
+        res[f"avg_qb{t}"] = q_sums[t][0] / n if n else np.nan
+        res[f"avg_qa{t}"] = q_sums[t][1] / n if n else np.nan
+
+    res["ok"] = not missing and bid_viol == 0 and ask_viol == 0 and crossed == 0
+    return res
+
+
+def _quantiles(x: np.ndarray, qs) -> list[float]:
+    """Linear-interpolated quantiles (DuckDB QUANTILE_CONT); NaN when empty."""
+    if len(x) == 0:
+        return [np.nan] * len(qs)
+    return np.quantile(x, qs).tolist()
+
+
+def _print_report(res: dict) -> None:
+    """The per-check report for a single file."""
+    print(f"Verifying {res['path']}")
+    print(f"  size on disk: {res['mb']:.1f} MB")
+    print()
+    print(f"[1/5] schema: {res['n_columns']} columns")
+    if res["missing"]:
+        print(f"        MISSING: {res['missing'].split()}")
+    if res["extra"]:
+        print(f"        extra (informational): {res['extra'].split()}")
+    print(f"[2/5] level ordering (all levels): bid_violations={res['bid_violations']:,}"
+          f"  ask_violations={res['ask_violations']:,}")
+    for side in ("bid", "ask"):
+        pairs = res[f"{side}_pair_violations"]
+        bad = [f"{i}/{i + 1}={n:,}" for i, n in enumerate(pairs) if n]
+        if bad:
+            print(f"        {side} pairs: {'  '.join(bad)}")
+    print(f"[3/5] spread: total={res['rows']:,}  crossed={res['crossed']:,}  locked={res['locked']:,}")
+    print(f"[4/5] cadence over {res['n_intervals']:,} intervals"
+          f" ({res['out_of_order']:,} out of order in file):")
+    print(f"        p50={res['gap_p50_ms']:.1f}ms  p95={res['gap_p95_ms']:.1f}ms"
+          f"  p99={res['gap_p99_ms']:.1f}ms  max={res['gap_max_ms']:.1f}ms")
     print("[5/5] imbalance distribution:")
-    for top_n in (1, 5, 10):
-        bid_sum = " + ".join(f"COALESCE(bid_{i}_size, 0)" for i in range(top_n))
-        ask_sum = " + ".join(f"COALESCE(ask_{i}_size, 0)" for i in range(top_n))
-        r = con.execute(f"""
-          WITH q AS (
-            SELECT
-              ({bid_sum}) AS qb,
-              ({ask_sum}) AS qa
-            FROM read_parquet('{path}')
-          )
-          SELECT
-            QUANTILE_CONT((qb - qa) / NULLIF(qb + qa, 0), 0.05) AS p05,
-            QUANTILE_CONT((qb - qa) / NULLIF(qb + qa, 0), 0.50) AS p50,
-            QUANTILE_CONT((qb - qa) / NULLIF(qb + qa, 0), 0.95) AS p95,
-            AVG(qb) AS avg_qb,
-            AVG(qa) AS avg_qa
-          FROM q
-          WHERE qb + qa > 0
-        """).fetchone()
-        p05, p50, p95, avg_qb, avg_qa = r
-        print(f"        top-{top_n}: I p05={p05:+.3f}  p50={p50:+.3f}  p95={p95:+.3f}"
-              f"   avg(Q_bid)={avg_qb:.3f}  avg(Q_ask)={avg_qa:.3f}")
+    for t in IMBALANCE_TOPS:
+        print(f"        top-{t}: I p05={res[f'imb{t}_p05']:+.3f}  p50={res[f'imb{t}_p50']:+.3f}"
+              f"  p95={res[f'imb{t}_p95']:+.3f}"
+              f"   avg(Q_bid)={res[f'avg_qb{t}']:.3f}  avg(Q_ask)={res[f'avg_qa{t}']:.3f}")
+    print()
+
+
+def _safe_verify(path: str) -> dict:
+    """verify_file for the worker pool: an unreadable file becomes a failed
+    row instead of aborting the run."""
+    try:
+        return verify_file(path)
+    except Exception as e:
+        return {"path": path, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def _expand_inputs(inputs: list[str]) -> list[str]:
+    """Files as given; directories searched recursively for *.parquet."""
+    paths = []
+    for p in inputs:
+        if os.path.isdir(p):
+            paths.extend(sorted(glob.glob(os.path.join(p, "**", "*.parquet"), recursive=True)))
+        else:
+            paths.append(p)
+    return paths
 
 
 def main() -> int:
     p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-    p.add_argument("--input", required=True, help="Path to a book parquet from download_book.py.")
+    p.add_argument("--input", required=True, nargs="+",
+                   help="Book parquet(s) from download_book.py or .bookbin files, or "
+                        "directories of parquets.")
+    p.add_argument("--workers", type=int, default=os.cpu_count(),
+                   help="Files verified in parallel. Default: CPU count.")
+    p.add_argument("--summary", help="Write one row per file to this CSV.")
     args = p.parse_args()
 
-    if not os.path.exists(args.input):
-        print(f"File not found: {args.input}", file=sys.stderr)
+    for path in args.input:
+        if not os.path.exists(path):
+            print(f"File not found: {path}", file=sys.stderr)
+            return 2
+    paths = _expand_inputs(args.input)
+    if not paths:
+        print("No parquet files found", file=sys.stderr)
         return 2
 
-    print(f"Verifying {args.input}")
-    print(f"  size on disk: {os.path.getsize(args.input)/1e6:.1f} MB")
-    print()
+    if len(paths) == 1:
+        results = [_safe_verify(paths[0])]
+        if "error" not in results[0]:
+            _print_report(results[0])
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for res in pool.map(_safe_verify, paths, chunksize=4):
+                results.append(res)
+                if "error" in res:
+                    print(f"  ERROR {res['path']}: {res['error']}")
+                    continue
+                print(f"  {'PASS' if res['ok'] else 'FAIL'} {res['path']}: {res['rows']:,} rows"
+                      f"  bid/ask viol={res['bid_violations']:,}/{res['ask_violations']:,}"
+                      f"  crossed={res['crossed']:,}  gap p99={res['gap_p99_ms']:.1f}ms")
 
-    con = duckdb.connect()
-    ok_schema = _check_schema(con, args.input)
-    ok_levels = _check_level_ordering(con, args.input)
-    ok_spread = _check_spread(con, args.input)
-    _check_cadence(con, args.input)
-    _check_imbalance(con, args.input)
+    if args.summary:
+        os.makedirs(os.path.dirname(args.summary) or ".", exist_ok=True)
+        pd.DataFrame(results).to_csv(args.summary, index=False)
+        print(f"Summary written to {args.summary}")
 
-    print()
-    if ok_schema and ok_levels and ok_spread:
-        print("PASS")
+    n_fail = sum(not r["ok"] for r in results)
+    if len(results) == 1 and "error" in results[0]:
+        print(f"ERROR: {results[0]['error']}")
+    if n_fail == 0:
+        print("PASS" if len(results) == 1 else f"PASS ({len(results)} files)")
         return 0
-    else:
-        print("FAIL — see lines above")
-        return 1
+    print("FAIL — see lines above" if len(results) == 1
+          else f"FAIL — {n_fail} of {len(results)} files")
+    return 1
 
 
 if __name__ == "__main__":
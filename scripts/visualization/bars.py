@@ -0,0 +1,595 @@
+"""Shared columnar bar engine for the chart and dataset scripts.
+
+Every volume-style builder in the repo used to walk trades in a Python loop,
+appending trade fragments to per-bar lists. This module replaces those loops
+with one vectorized engine. Trades go in as parallel NumPy arrays
+(price, size, ts, optional side), bars come out as a dict of NumPy arrays,
+one entry per bar in each column.
+
+Split semantics (volume, dollar and imbalance bars) match the old loops:
+  - a trade that overflows the current bar splits into one fragment per
+    bar it touches, all at the trade's own price/side/timestamp;
+  - a trade that exactly fills a bar stays in that bar;
+  - zero-size trades contribute no fragment.
+Split bars are cut by sequential kernels that keep the loops' running
+sums (per-bar volume, θ), so fragment sizes and bar edges are
+bit-identical to theirs (a global cumsum drifts by a few ulps over a day
+and moves trades across edges when sizes are fractional).
+Tick and time bars never split: each trade lands whole in one bar.
+
+Columns returned by every builder:
+    volume, cum_volume     per-bar and running volume (in the size unit)
+    vwap, stddev           volume-weighted mean and stddev of price
+    open, high, low, close
+    start_ts, end_ts       timestamps of the first/last fragment
+    duration_s             (end_ts - start_ts) / ts_per_second
+    n_trades               number of fragments in the bar
+    n_first                trades whose *first* fragment lands in the bar
+                           (VolumeBar.fs TradeCount: spillover bars get 0)
+    complete               False only for a trailing bar that never hit
+                           its threshold
+  with side:
+    buy_volume, sell_volume, signed_volume
+  per extra column:
+    weighted={name: arr}   volume-weighted mean of a per-trade column
+                           (HMM posteriors, sim target mean/sigma)
+    first={name: arr}      value of a per-trade column at the bar's first
+                           fragment (sim labels)
+  imbalance bars add bar_sign; time bars add bucket.
+
+Usage from a sibling script::
+
+    from bars import volume_bars, records
+    b = volume_bars(price, size, ts, 5000, ts_per_second=1e9)
+    rows = records({'vwap': b['vwap'], 'volume': b['volume']})
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # pure-NumPy fallbacks in the *_numpy kernels
+    njit = None
+
+
+Columns = dict[str, np.ndarray]
+
+
+# -----------------------------------------------------------------------------
+# Aggregation core
+# -----------------------------------------------------------------------------
+
+def _aggregate(bar: np.ndarray, trade_idx: np.ndarray, piece_vol: np.ndarray,
+               n_bars: int, price: np.ndarray, ts: np.ndarray,
+               side: Optional[np.ndarray], weighted: Optional[dict],
+               first: Optional[dict], ts_per_second: float) -> Columns:
+    """Per-bar reductions over trade fragments. `bar` must be
+    non-decreasing and cover every id in [0, n_bars)."""
+    piece_p = price[trade_idx]
+    piece_t = ts[trade_idx]
+
+    lo = np.searchsorted(bar, np.arange(n_bars), side="left")
+    hi = np.append(lo[1:], len(bar)) - 1
+    volume = np.bincount(bar, weights=piece_vol, minlength=n_bars)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        vwap = np.bincount(bar, weights=piece_p * piece_vol, minlength=n_bars) / volume
+        dev = piece_p - vwap[bar]
+        var = np.bincount(bar, weights=piece_vol * dev * dev, minlength=n_bars) / volume
+    start_ts = piece_t[lo]
+    end_ts = piece_t[hi]
+
+    # A trade's first fragment is the one whose predecessor is another trade.
+    is_first = np.ones(len(trade_idx), dtype=bool)
+    is_first[1:] = trade_idx[1:] != trade_idx[:-1]
+
+    out = {
+        "volume": volume,
+        "cum_volume": np.cumsum(volume),
+        "vwap": vwap,
+        "stddev": np.sqrt(np.maximum(var, 0.0)),
+        "open": piece_p[lo],
+        "high": np.maximum.reduceat(piece_p, lo),
+        "low": np.minimum.reduceat(piece_p, lo),
+        "close": piece_p[hi],
+        "start_ts": start_ts,
+        "end_ts": end_ts,
+        "duration_s": (end_ts - start_ts) / ts_per_second,
+        "n_trades": hi - lo + 1,
+        "n_first": np.bincount(bar[is_first], minlength=n_bars),
+        "complete": np.ones(n_bars, dtype=bool),
+    }
+    if side is not None:
+        piece_s = side[trade_idx]
+        buy = np.bincount(bar, weights=np.where(piece_s > 0, piece_vol, 0.0),
+                          minlength=n_bars)
+        sell = np.bincount(bar, weights=np.where(piece_s < 0, piece_vol, 0.0),
+                           minlength=n_bars)
+        out["buy_volume"] = buy
+        out["sell_volume"] = sell
+        out["signed_volume"] = buy - sell
+    for name, arr in (weighted or {}).items():
+        arr = np.asarray(arr, dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[name] = np.bincount(bar, weights=arr[trade_idx] * piece_vol,
+                                    minlength=n_bars) / volume
+    for name, arr in (first or {}).items():
+        out[name] = np.asarray(arr)[trade_idx[lo]]
+    return out
+
+
+def _empty(side: Optional[np.ndarray], weighted: Optional[dict],
+           first: Optional[dict], *extra: str) -> Columns:
+    f = np.empty(0, dtype=np.float64)
+    i = np.empty(0, dtype=np.int64)
+    out = {
+        "volume": f, "cum_volume": f, "vwap": f, "stddev": f,
+        "open": f, "high": f, "low": f, "close": f,
+        "start_ts": i, "end_ts": i, "duration_s": f,
+        "n_trades": i, "n_first": i, "complete": np.empty(0, dtype=bool),
+    }
+    if side is not None:
+        out.update(buy_volume=f, sell_volume=f, signed_volume=f)
+    for name in weighted or {}:
+        out[name] = f
+    for name, arr in (first or {}).items():
+        out[name] = np.asarray(arr)[:0]
+    for name in extra:
+        out[name] = i
+    return out
+
+
+def _prepare(price, size, ts, side, weighted, first):
+    """Arrays as float64/int64, with zero-size trades dropped (they never
+    contribute a fragment to a split bar)."""
+    price = np.asarray(price, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    ts = np.asarray(ts)
+    if side is not None:
+        side = np.asarray(side, dtype=np.float64)
+    keep = size > 0
+    if not keep.all():
+        price, size, ts = price[keep], size[keep], ts[keep]
+        if side is not None:
+            side = side[keep]
+        weighted = {k: np.asarray(v)[keep] for k, v in (weighted or {}).items()}
+        first = {k: np.asarray(v)[keep] for k, v in (first or {}).items()}
+    return price, size, ts, side, weighted, first
+
+
+# -----------------------------------------------------------------------------
+# Volume-bar kernel
+# -----------------------------------------------------------------------------
+
+def _volume_fragments_loop(vol: np.ndarray, bar_volume: float,
+                           close_when_full: bool):
+    """Reference scalar kernel (JIT-compiled when numba is available).
+
+    Walks the trades exactly like the original per-trade loop, keeping
+    the same running per-bar sum, but records fragments instead of bar
+    lists. Returns (bar, trade_idx, piece_vol) per fragment, seen_by
+    (the bar open when each trade arrived), the number of closed bars
+    and the running volume of the trailing bar, which is never empty.
+    """
+    n = len(vol)
+    # One fragment per trade, plus the top-up (and at most one fp sliver)
+    # per close.
+    cap = n + 2 * (int(vol.sum() / bar_volume) + 2)
+    bar = np.empty(cap, dtype=np.int64)
+    trade_idx = np.empty(cap, dtype=np.int64)
+    piece_vol = np.empty(cap, dtype=np.float64)
+    seen_by = np.empty(n, dtype=np.int64)
+    nf = 0
+    nb = 0
+    cur = 0.0
+    for i in range(n):
+        seen_by[i] = nb
+        remaining = vol[i]
+        while remaining > 0:
+            if nf == cap:
+                raise RuntimeError("volume bar fragment capacity exceeded")
+            space = bar_volume - cur
+            if remaining <= space:
+                bar[nf] = nb
+                trade_idx[nf] = i
+                piece_vol[nf] = remaining
+                nf += 1
+                cur += remaining
+                remaining = 0.0
+            else:
+                if space > 0:
+                    bar[nf] = nb
+                    trade_idx[nf] = i
+                    piece_vol[nf] = space
+                    nf += 1
+                    cur += space
+                    remaining -= space
+                if cur >= bar_volume or not close_when_full:
+                    nb += 1
+                    cur = 0.0
+    return bar[:nf], trade_idx[:nf], piece_vol[:nf], seen_by, nb, cur
+
+
+def _volume_fragments_numpy(vol: np.ndarray, bar_volume: float,
+                            close_when_full: bool):
+    """Pure-NumPy fallback for `_volume_fragments_loop`.
+
+    Between closes the loop only adds whole trades, so the running sum
+    over a stretch of trades is one np.cumsum seeded with the bar's
+    current volume (cumsum adds left to right, exactly like the loop).
+    The first trade that doesn't fit is found with a window that doubles
+    until it hits, as in `_imbalance_fragments_numpy`, and is split in
+    scalar code.
+    """
+    n = len(vol)
+    bars: list[np.ndarray] = []
+    idxs: list[np.ndarray] = []
+    pieces: list[np.ndarray] = []
+    seen_by = np.empty(n, dtype=np.int64)
+    seen = 0
+    nb = 0
+    cur = 0.0
+    i = 0
+    remaining = float(vol[0])  # what is left of trade i
+    window = 64
+    while i < n:
+        j = -1
+        lo = i
+        while lo < n:
+            hi = min(n, lo + window)
+            v = vol[lo:hi].copy()
+            if lo == i:
+                v[0] = remaining
+            c = np.cumsum(np.concatenate([[cur], v]))  # c[k] before adding v[k]
+            fail = v > bar_volume - c[:-1]
+            k = int(fail.argmax())
+            fits = k if fail[k] else len(v)
+            bars.append(np.full(fits, nb, dtype=np.int64))
+            idxs.append(np.arange(lo, lo + fits))
+            pieces.append(v[:fits])
+            cur = c[fits]
+            last = lo + fits if fail[k] else hi - 1
+            seen_by[seen:last + 1] = nb
+            seen = max(seen, last + 1)
+            if fail[k]:
+                j = lo + k
+                remaining = v[k]
+                break
+            lo = hi
+            window *= 2
+        if j < 0:
+            break
+        window = max(64, 2 * (j - i + 1))
+        space = bar_volume - cur
+        if space > 0:
+            bars.append(np.array([nb], dtype=np.int64))
+            idxs.append(np.array([j]))
+            pieces.append(np.array([space]))
+            cur += space
+            remaining -= space
+        if cur >= bar_volume or not close_when_full:
+            nb += 1
+            cur = 0.0
+        i = j
+    return (np.concatenate(bars), np.concatenate(idxs).astype(np.int64),
+            np.concatenate(pieces), seen_by, nb, cur)
+
+
+if njit is not None:
+    _volume_fragments = njit(cache=True, nogil=True)(_volume_fragments_loop)
+else:
+    _volume_fragments = _volume_fragments_numpy
+
+
+# -----------------------------------------------------------------------------
+# Bar types
+# -----------------------------------------------------------------------------
+
+def volume_bars(price, size, ts, bar_volume: float, *,
+                side=None, weighted: Optional[dict] = None,
+                first: Optional[dict] = None,
+                ts_per_second: float = 1e9,
+                close_on_next: bool = False,
+                close_when_full: bool = False) -> Columns:
+    """Equal-volume bars: bar k closes when cumulative size reaches
+    (k+1)·bar_volume. The trailing bar is returned with complete=False
+    when it falls short.
+
+    The old loops disagreed on one fp detail, kept here as a flag: by
+    default a bar closes as soon as an overflowing trade has topped it
+    up (binance/futures/dollar loops); close_when_full=True closes it
+    only once its running sum is >= bar_volume, so a top-up that rounds
+    a ulp short is followed by a sliver fragment of the same trade
+    (massive/sim loops and VolumeBar.fs).
+
+    close_on_next=True mirrors VolumeBar.fs, where a full bar is only
+    emitted when the next trade arrives: a bar filled exactly by trade j
+    takes trade j+1's timestamp as end_ts and its count in n_first, and a
+    bar filled exactly by the last trade is not complete.
+    """
+    price, size, ts, side, weighted, first = _prepare(price, size, ts, side,
+                                                      weighted, first)
+    if len(size) == 0:
+        return _empty(side, weighted, first)
+    bar, trade_idx, piece_vol, seen_by, n_closed, tail = _volume_fragments(
+        size, float(bar_volume), close_when_full)
+    n_bars = n_closed + 1
+    out = _aggregate(bar, trade_idx, piece_vol, n_bars, price, ts,
+                     side, weighted, first, ts_per_second)
+    out["complete"][-1] = tail >= bar_volume
+    if close_on_next:
+        # A trade arriving at a full bar is seen by the bar it closes.
+        out["n_first"] = np.bincount(seen_by, minlength=n_bars)
+        last_seen = np.searchsorted(seen_by, np.arange(n_bars), side="right") - 1
+        last_piece = trade_idx[np.append(np.searchsorted(bar, np.arange(1, n_bars)),
+                                         len(bar)) - 1]
+        out["end_ts"] = ts[np.maximum(last_piece, last_seen)]
+        out["duration_s"] = (out["end_ts"] - out["start_ts"]) / ts_per_second
+        out["complete"][-1] = False
+    return out
+
+
+def dollar_bars(price, size, ts, bar_dollars: float, **kw) -> Columns:
+    """Equal-$volume bars. The volume columns are in $ (price·size) and
+    vwap is $-weighted."""
+    price = np.asarray(price, dtype=np.float64)
+    return volume_bars(price, price * np.asarray(size, dtype=np.float64), ts,
+                       bar_dollars, **kw)
+
+
+def tick_bars(price, size, ts, trades_per_bar: int, *,
+              side=None, weighted: Optional[dict] = None,
+              first: Optional[dict] = None,
+              ts_per_second: float = 1e9) -> Columns:
+    """Fixed trade-count bars. Trades never split; zero-size prints still
+    count as a tick."""
+    price = np.asarray(price, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    ts = np.asarray(ts)
+    if side is not None:
+        side = np.asarray(side, dtype=np.float64)
+    n = len(size)
+    if n == 0:
+        return _empty(side, weighted, first)
+    idx = np.arange(n)
+    bar = idx // trades_per_bar
+    n_bars = int(bar[-1]) + 1
+    out = _aggregate(bar, idx, size, n_bars, price, ts,
+                     side, weighted, first, ts_per_second)
+    out["complete"][-1] = n % trades_per_bar == 0
+    return out
+
+
+def time_bars(price, size, ts, interval: int, *,
+              side=None, weighted: Optional[dict] = None,
+              first: Optional[dict] = None,
+              ts_per_second: float = 1e9) -> Columns:
+    """Fixed wall-clock bars bucketed by floor(ts / interval), `interval`
+    in ts units. Empty buckets are skipped; the `bucket` column holds the
+    bucket id, so the bar spans [bucket·interval, (bucket+1)·interval)."""
+    price = np.asarray(price, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    ts = np.asarray(ts)
+    if side is not None:
+        side = np.asarray(side, dtype=np.float64)
+    if len(size) == 0:
+        return _empty(side, weighted, first, "bucket")
+    bucket = ts // interval
+    change = np.flatnonzero(bucket[1:] != bucket[:-1]) + 1
+    bar = np.zeros(len(ts), dtype=np.int64)
+    bar[change] = 1
+    bar = np.cumsum(bar)
+    n_bars = len(change) + 1
+    out = _aggregate(bar, np.arange(len(ts)), size, n_bars, price, ts,
+                     side, weighted, first, ts_per_second)
+    out["bucket"] = bucket[np.concatenate([[0], change])]
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Imbalance bars
+# -----------------------------------------------------------------------------
+
+def _imbalance_fragments_loop(vol: np.ndarray, side: np.ndarray, threshold: float):
+    """Reference scalar kernel (JIT-compiled when numba is available).
+
+    Walks the trades exactly like the original per-trade loop, keeping
+    the same running θ, and records fragments instead of bar lists.
+    Returns (bar, trade_idx, piece_vol) per fragment, each bar's sign,
+    and the number of bars closed on ±T (a trailing partial bar, if any,
+    comes after them).
+    """
+    n = len(vol)
+    # Each close moves θ by ~T, so total volume bounds the bar count.
+    cap_bars = int(vol.sum() / threshold * 1.001) + 2
+    cap = n + cap_bars
+    bar = np.empty(cap, dtype=np.int64)
+    trade_idx = np.empty(cap, dtype=np.int64)
+    piece_vol = np.empty(cap, dtype=np.float64)
+    signs = np.empty(cap_bars, dtype=np.int8)
+    nf = 0
+    nb = 0
+    theta = 0.0
+    bar_vol = 0.0
+    for i in range(n):
+        remaining = vol[i]
+        sign_i = side[i]
+        while remaining > 0:
+            if nf == cap or nb == cap_bars:
+                raise RuntimeError("imbalance bar capacity exceeded")
+            theta_after_full = theta + sign_i * remaining
+            if abs(theta_after_full) < threshold:
+                bar[nf] = nb
+                trade_idx[nf] = i
+                piece_vol[nf] = remaining
+                nf += 1
+                theta = theta_after_full
+                bar_vol += remaining
+                remaining = 0.0
+            else:
+                target = threshold if sign_i > 0 else -threshold
+                x = (target - theta) / sign_i
+                if x <= 0:
+                    x = 0.0
+                if x > remaining:
+                    x = remaining
+                if x > 0:
+                    bar[nf] = nb
+                    trade_idx[nf] = i
+                    piece_vol[nf] = x
+                    nf += 1
+                    theta += sign_i * x
+                    bar_vol += x
+                    remaining -= x
+                if bar_vol <= 0:
+                    # Nothing to close (θ drifted onto the threshold);
+                    # drop the drift so the trade makes progress.
+                    theta = 0.0
+                    continue
+                bar_sign = 1 if theta > 0 else -1
+                signs[nb] = bar_sign
+                nb += 1
+                bar_vol = 0.0
+                theta = theta - bar_sign * threshold
+    n_closed = nb
+    if bar_vol > 0:
+        signs[nb] = 1 if theta > 0 else (-1 if theta < 0 else 1)
+        nb += 1
+    return bar[:nf], trade_idx[:nf], piece_vol[:nf], signs[:nb], n_closed
+
+
+def _imbalance_fragments_numpy(vol: np.ndarray, side: np.ndarray, threshold: float):
+    """Pure-NumPy fallback for `_imbalance_fragments_loop`.
+
+    Between closes the loop only adds whole trades, so θ over a stretch
+    of trades is one np.cumsum of side·size seeded with the current θ
+    (cumsum adds left to right, exactly like the loop). The bar closes
+    at the first trade where |θ| would reach T, found with a window that
+    doubles until it hits; that trade is split in scalar code.
+    """
+    n = len(vol)
+    bars: list[np.ndarray] = []
+    idxs: list[np.ndarray] = []
+    pieces: list[np.ndarray] = []
+    signs: list[int] = []
+    theta = 0.0
+    open_bar = False  # the current bar has a fragment
+    i = 0
+    remaining = float(vol[0])  # what is left of trade i
+    window = 64
+    while i < n:
+        j = -1
+        lo = i
+        while lo < n:
+            hi = min(n, lo + window)
+            v = vol[lo:hi].copy()
+            if lo == i:
+                v[0] = remaining
+            c = np.cumsum(np.concatenate([[theta], side[lo:hi] * v]))
+            hit = np.abs(c[1:]) >= threshold
+            k = int(hit.argmax())
+            fits = k if hit[k] else len(v)
+            if fits:
+                bars.append(np.full(fits, len(signs), dtype=np.int64))
+                idxs.append(np.arange(lo, lo + fits))
+                pieces.append(v[:fits])
+                open_bar = True
+            theta = c[fits]
+            if hit[k]:
+                j = lo + k
+                remaining = v[k]
+                break
+            lo = hi
+            window *= 2
+        if j < 0:
+            break
+        window = max(64, 2 * (j - i + 1))
+        sign_j = side[j]
+        target = threshold if sign_j > 0 else -threshold
+        x = min(max((target - theta) / sign_j, 0.0), remaining)
+        if x > 0:
+            bars.append(np.array([len(signs)], dtype=np.int64))
+            idxs.append(np.array([j]))
+            pieces.append(np.array([x]))
+            open_bar = True
+            theta += sign_j * x
+            remaining -= x
+        if not open_bar:
+            theta = 0.0
+        else:
+            bar_sign = 1 if theta > 0 else -1
+            signs.append(bar_sign)
+            open_bar = False
+            theta = theta - bar_sign * threshold
+        if remaining > 0:
+            i = j
+        else:
+            i = j + 1
+            remaining = float(vol[i]) if i < n else 0.0
+    n_closed = len(signs)
+    if open_bar:
+        signs.append(1 if theta > 0 else (-1 if theta < 0 else 1))
+    return (np.concatenate(bars), np.concatenate(idxs).astype(np.int64),
+            np.concatenate(pieces), np.asarray(signs, dtype=np.int8), n_closed)
+
+
+if njit is not None:
+    _imbalance_fragments = njit(cache=True, nogil=True)(_imbalance_fragments_loop)
+else:
+    _imbalance_fragments = _imbalance_fragments_numpy
+
+
+def count_imbalance_bars(size, side, threshold: float) -> int:
+    """Number of imbalance bars `imbalance_bars` would build, without the
+    aggregation pass. Cheap enough to drive threshold searches."""
+    size = np.asarray(size, dtype=np.float64)
+    side = np.asarray(side, dtype=np.float64)
+    keep = size > 0
+    size, side = size[keep], side[keep]
+    if len(size) == 0 or threshold <= 0:
+        return 0
+    return len(_imbalance_fragments(size, side, float(threshold))[3])
+
+
+def imbalance_bars(price, size, ts, side, threshold: float, *,
+                   weighted: Optional[dict] = None,
+                   first: Optional[dict] = None,
+                   ts_per_second: float = 1e9) -> Columns:
+    """Imbalance bars (López de Prado): θ = Σ side·size within the bar; the
+    bar closes when |θ| reaches `threshold`. The crossing trade splits so
+    the bar closes at exactly ±T and the remainder rolls into the next
+    bar; the residual θ - sign(θ)·T carries over. Pass size = price·qty
+    for dollar-imbalance bars. Adds a bar_sign column (+1 buy, -1 sell).
+    """
+    price, size, ts, side, weighted, first = _prepare(price, size, ts, side,
+                                                      weighted, first)
+    if len(size) == 0 or threshold <= 0:
+        out = _empty(side, weighted, first)
+        out["bar_sign"] = np.empty(0, dtype=np.int8)
+        return out
+    bar, trade_idx, piece_vol, bar_sign, n_closed = _imbalance_fragments(
+        size, side, float(threshold))
+    out = _aggregate(bar, trade_idx, piece_vol, len(bar_sign), price, ts,
+                     side, weighted, first, ts_per_second)
+    out["complete"][n_closed:] = False
+    out["bar_sign"] = bar_sign
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------------------------
+
+def slice_bars(bars: Columns, lo: int, hi: Optional[int] = None) -> Columns:
+    """Row slice [lo:hi] of a bar set."""
+    return {k: v[lo:hi] for k, v in bars.items()}
+
+
+def records(cols: Columns) -> list[dict]:
+    """Row-wise view for plotting code that still walks a list of bar
+    dicts. Values are plain Python scalars."""
+    keys = list(cols)
+    return [dict(zip(keys, row)) for row in zip(*(cols[k].tolist() for k in keys))]
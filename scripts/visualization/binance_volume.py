@@ -17,6 +17,8 @@ import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from bars import volume_bars, records
+
 
 def load_trades(path):
     cols = [
@@ -93,103 +95,37 @@ def build_volume_bars(df, volume_per_bar, posteriors=None):
 
     If posteriors is given (a tuple of 3 arrays p_up, p_consol, p_down each of
     length len(df)), each bar gets a volume-weighted posterior mean."""
-    prices = df["price"].to_numpy()
-    qtys = df["quantity"].to_numpy()
-    ts_us = df["timestamp"].to_numpy()
-    buyer_maker = df["is_buyer_maker"].to_numpy()
     # Signed aggression: +1 for buyer-aggressive (is_buyer_maker=False), -1 for sell.
-    signs = np.where(buyer_maker, -1.0, 1.0)
-    has_post = posteriors is not None
-    p_up_arr = posteriors[0] if has_post else None
-    p_con_arr = posteriors[1] if has_post else None
-    p_dn_arr = posteriors[2] if has_post else None
-
-    bars = []
-    cur = _empty_bar()
-    for i in range(len(df)):
-        remaining = float(qtys[i])
-        price = float(prices[i])
-        ts = int(ts_us[i])
-        sign = float(signs[i])
-        p_up = float(p_up_arr[i]) if has_post else 0.0
-        p_con = float(p_con_arr[i]) if has_post else 0.0
-        p_dn = float(p_dn_arr[i]) if has_post else 0.0
-        while remaining > 0:
-            space = volume_per_bar - cur["vol"]
-            if remaining <= space:
-                _add(cur, price, remaining, ts, sign, p_up, p_con, p_dn)
-                remaining = 0
-            else:
-                if space > 0:
-                    _add(cur, price, space, ts, sign, p_up, p_con, p_dn)
-                    remaining -= space
-                bars.append(_finalize(cur, has_post))
-                cur = _empty_bar()
-    if cur["vol"] > 0:
-        bars.append(_finalize(cur, has_post))
-
-    cum = 0.0
-    for b in bars:
-        cum += b["volume"]
-        b["cumulative_volume"] = cum
-    return bars
-
-
-def _empty_bar():
-    return {
-        "prices": [],
-        "vols": [],
-        "ts": [],
-        "signs": [],
-        "p_ups": [],
-        "p_cons": [],
-        "p_dns": [],
-        "vol": 0.0,
-    }
-
-
-def _add(bar, price, vol, ts, sign, p_up, p_con, p_dn):
-    bar["prices"].append(price)
-    bar["vols"].append(vol)
-    bar["ts"].append(ts)
-    bar["signs"].append(sign)
-    bar["p_ups"].append(p_up)
-    bar["p_cons"].append(p_con)
-    bar["p_dns"].append(p_dn)
-    bar["vol"] += vol
-
-
-def _finalize(bar, has_post):
-    prices = np.asarray(bar["prices"])
-    vols = np.asarray(bar["vols"])
-    signs = np.asarray(bar["signs"])
-    total_v = vols.sum()
-    vwap = float(np.sum(prices * vols) / total_v)
-    var = float(np.sum(vols * (prices - vwap) ** 2) / total_v)
-    stddev = float(np.sqrt(max(0.0, var)))
-    signed_vol = float(np.sum(signs * vols))
-    buy_vol = float(np.sum(vols[signs > 0]))
-    sell_vol = float(np.sum(vols[signs < 0]))
-    out = {
-        "volume": float(total_v),
-        "vwap": vwap,
-        "stddev": stddev,
-        "start_us": int(bar["ts"][0]),
-        "end_us": int(bar["ts"][-1]),
-        "time_duration_s": (bar["ts"][-1] - bar["ts"][0]) / 1e6,
-        "num_trades": len(bar["prices"]),
-        "signed_volume": signed_vol,
-        "buy_volume": buy_vol,
-        "sell_volume": sell_vol,
+    signs = np.where(df["is_buyer_maker"].to_numpy(), -1.0, 1.0)
+    weighted = None
+    if posteriors is not None:
+        weighted = dict(zip(("p_up", "p_consol", "p_down"), posteriors))
+    b = volume_bars(
+        df["price"].to_numpy(),
+        df["quantity"].to_numpy(),
+        df["timestamp"].to_numpy(),
+        volume_per_bar,
+        side=signs,
+        weighted=weighted,
+        ts_per_second=1e6,
+    )
+    cols = {
+        "volume": b["volume"],
+        "vwap": b["vwap"],
+        "stddev": b["stddev"],
+        "start_us": b["start_ts"],
+        "end_us": b["end_ts"],
+        "time_duration_s": b["duration_s"],
+        "num_trades": b["n_trades"],
+        "signed_volume": b["signed_volume"],
+        "buy_volume": b["buy_volume"],
+        "sell_volume": b["sell_volume"],
+        "cumulative_volume": b["cum_volume"],
     }
-    if has_post:
-        p_ups = np.asarray(bar["p_ups"])
-        p_cons = np.asarray(bar["p_cons"])
-        p_dns = np.asarray(bar["p_dns"])
-        out["p_up"] = float(np.sum(p_ups * vols) / total_v)
-        out["p_consol"] = float(np.sum(p_cons * vols) / total_v)
-        out["p_down"] = float(np.sum(p_dns * vols) / total_v)
-    return out
+    if weighted is not None:
+        for name in weighted:
+            cols[name] = b[name]
+    return records(cols)
 
 
 def us_to_datetime(us):
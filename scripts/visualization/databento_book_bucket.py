@@ -38,291 +38,616 @@ Replay semantics
 - T side=A/B (hidden): emits trade with aggressor = inverse of side.
 - T side=N (cross / dark-vs-dark): emits trade with aggressor = 0.
 - Price sentinel INT64_MAX skipped.
+
+Each venue file is decoded in one call (DBNStore.to_ndarray) and its
+order-id book replayed by a compiled kernel over the message arrays
+(numba when installed); the per-venue event streams are then merged by a
+stable argsort on timestamp.
+
+Usage
+-----
+  # one ticker-day, venues replayed in parallel
+  python scripts/visualization/databento_book_bucket.py --ticker NBIS --date 2025-09-09
+
+  # batch: every (ticker, date) in a list, resuming past finished days
+  python scripts/visualization/databento_book_bucket.py \\
+      --pairs data/gap_up_top200.json --workers 16 --pyramid
 """
 
 import argparse
-import heapq
+import csv
+import json
+import os
 import sys
+import time
+import zoneinfo
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 
 import databento as db
+import numpy as np
 import polars as pl
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from databento_book_pyramid import build_pyramid, read_meta  # noqa: E402
+
+try:
+    from numba import njit
+except ImportError:  # the replay kernel then runs as plain Python
+    njit = None
+
 
 PRICE_SCALE = 1_000_000_000
+PRICE_TO_CENTS = PRICE_SCALE // 100
 INT64_MAX = 2**63 - 1
 DEFAULT_BUCKET_MS = 100
+MBO_ROOT = "data/databento/mbo"
+BOOK_ROOT = "data/databento/book"
+
+# DBN action / side bytes.
+ACTION_ADD, ACTION_CANCEL, ACTION_MODIFY = ord('A'), ord('C'), ord('M')
+ACTION_FILL, ACTION_TRADE, ACTION_RESET = ord('F'), ord('T'), ord('R')
+SIDE_BID, SIDE_ASK = ord('B'), ord('A')
+
+# Derived event kinds, and the columns replay_venue emits per event.
+EV_RESET, EV_BOOK, EV_TRADE = 0, 1, 2
+EVENT_DTYPES = {'ts': np.int64, 'kind': np.uint8, 'side': np.uint8,
+                'price': np.int64, 'qty': np.int64}
+
+
+def load_venue(path: Path) -> dict[str, np.ndarray]:
+    """One venue's MBO file as flat NumPy columns (file order), decoded in
+    one call via DBNStore.to_ndarray instead of per-record Python objects."""
+    arr = db.DBNStore.from_file(path).to_ndarray()
+    return {
+        'ts': arr['ts_event'].astype(np.int64),
+        'action': np.ascontiguousarray(arr['action']).view(np.uint8),
+        'side': np.ascontiguousarray(arr['side']).view(np.uint8),
+        'price': arr['price'].astype(np.int64),
+        'size': arr['size'].astype(np.int64),
+        'order_id': arr['order_id'],
+    }
+
 
+def _replay_venue_loop(ts, action, side, price, size, oid,
+                       o_side, o_price, o_size, o_epoch,
+                       ev_ts, ev_kind, ev_side, ev_price, ev_qty):
+    """Order-id book replay for one venue (JIT-compiled when numba is
+    available). Orders live in arrays indexed by dense order id; an order is
+    resting iff o_epoch[id] equals the current epoch, so an R (reset) clears
+    the venue's book in O(1) by bumping the epoch.
 
-def replay_venue(path: Path):
-    """Generator of per-venue book/trade events.  See bucket_replay docstring."""
-    rs = db.DBNStore.from_file(path)
-    book: dict[int, tuple[int, int, int]] = {}   # order_id -> (side_byte, price_cents, size)
-    for rec in rs:
-        ts = int(rec.ts_event)
-        action = str(rec.action)
-        side = str(rec.side)
-        size = int(rec.size)
-        price_raw = int(rec.price)
-        order_id = int(rec.order_id)
-
-        if action == 'R':
-            yield ('reset', ts)
-            book.clear()
+    Writes derived events into the ev_* arrays (at most two per message) and
+    returns how many: EV_RESET, EV_BOOK (side, price_cents, signed size
+    delta) and EV_TRADE (aggressor, price_cents, size). See bucket_replay.
+    """
+    n = 0
+    epoch = 0
+    for i in range(ts.shape[0]):
+        t = ts[i]
+        a = action[i]
+        if a == ACTION_RESET:
+            ev_ts[n] = t
+            ev_kind[n] = EV_RESET
+            ev_side[n] = 0
+            ev_price[n] = 0
+            ev_qty[n] = 0
+            n += 1
+            epoch += 1
             continue
 
-        if price_raw == INT64_MAX:
+        if price[i] == INT64_MAX:
             continue
 
-        price_cents = price_raw // (PRICE_SCALE // 100)
-        side_b = 1 if side == 'B' else (2 if side == 'A' else 0)
+        pc = price[i] // PRICE_TO_CENTS
+        sb = 1 if side[i] == SIDE_BID else (2 if side[i] == SIDE_ASK else 0)
+        sz = size[i]
+        o = oid[i]
+        live = o_epoch[o] == epoch
 
-        if action == 'A':
-            if side_b == 0:
+        if a == ACTION_ADD:
+            if sb == 0:
                 continue
-            book[order_id] = (side_b, price_cents, size)
-            yield ('book', ts, side_b, price_cents, +size)
-
-        elif action == 'C':
-            prev = book.pop(order_id, None)
-            if prev is None:
+            o_side[o] = sb
+            o_price[o] = pc
+            o_size[o] = sz
+            o_epoch[o] = epoch
+            ev_ts[n] = t
+            ev_kind[n] = EV_BOOK
+            ev_side[n] = sb
+            ev_price[n] = pc
+            ev_qty[n] = sz
+            n += 1
+
+        elif a == ACTION_CANCEL:
+            if not live:
                 continue
-            pside, pprice, psize = prev
-            if size == 0 or size >= psize:
-                yield ('book', ts, pside, pprice, -psize)
+            ev_ts[n] = t
+            ev_kind[n] = EV_BOOK
+            ev_side[n] = o_side[o]
+            ev_price[n] = o_price[o]
+            if sz == 0 or sz >= o_size[o]:
+                ev_qty[n] = -o_size[o]
+                o_epoch[o] = -1
             else:
-                book[order_id] = (pside, pprice, psize - size)
-                yield ('book', ts, pside, pprice, -size)
-
-        elif action == 'M':
-            prev = book.pop(order_id, None)
-            if prev is not None:
-                pside, pprice, psize = prev
-                yield ('book', ts, pside, pprice, -psize)
-            if side_b != 0:
-                book[order_id] = (side_b, price_cents, size)
-                yield ('book', ts, side_b, price_cents, +size)
-
-        elif action == 'F':
-            prev = book.get(order_id)
-            if prev is not None:
-                pside, pprice, psize = prev
-                new_size = psize - size
-                if new_size <= 0:
-                    del book[order_id]
-                    yield ('book', ts, pside, pprice, -psize)
+                ev_qty[n] = -sz
+                o_size[o] -= sz
+            n += 1
+
+        elif a == ACTION_MODIFY:
+            if live:
+                ev_ts[n] = t
+                ev_kind[n] = EV_BOOK
+                ev_side[n] = o_side[o]
+                ev_price[n] = o_price[o]
+                ev_qty[n] = -o_size[o]
+                n += 1
+                o_epoch[o] = -1
+            if sb != 0:
+                o_side[o] = sb
+                o_price[o] = pc
+                o_size[o] = sz
+                o_epoch[o] = epoch
+                ev_ts[n] = t
+                ev_kind[n] = EV_BOOK
+                ev_side[n] = sb
+                ev_price[n] = pc
+                ev_qty[n] = sz
+                n += 1
+
+        elif a == ACTION_FILL:
+            if live:
+                ev_ts[n] = t
+                ev_kind[n] = EV_BOOK
+                ev_side[n] = o_side[o]
+                ev_price[n] = o_price[o]
+                if o_size[o] - sz <= 0:
+                    ev_qty[n] = -o_size[o]
+                    o_epoch[o] = -1
                 else:
-                    book[order_id] = (pside, pprice, new_size)
-                    yield ('book', ts, pside, pprice, -size)
-                aggressor = 2 if pside == 1 else 1
-                yield ('trade', ts, aggressor, pprice, size)
+                    ev_qty[n] = -sz
+                    o_size[o] -= sz
+                n += 1
+                ev_ts[n] = t
+                ev_kind[n] = EV_TRADE
+                ev_side[n] = 2 if o_side[o] == 1 else 1
+                ev_price[n] = o_price[o]
+                ev_qty[n] = sz
+                n += 1
             else:
-                aggressor = 2 if side_b == 1 else (1 if side_b == 2 else 0)
-                yield ('trade', ts, aggressor, price_cents, size)
-
-        elif action == 'T':
-            if side_b == 1:
-                aggressor = 2
-            elif side_b == 2:
-                aggressor = 1
-            else:
-                aggressor = 0
-            yield ('trade', ts, aggressor, price_cents, size)
+                ev_ts[n] = t
+                ev_kind[n] = EV_TRADE
+                ev_side[n] = 2 if sb == 1 else (1 if sb == 2 else 0)
+                ev_price[n] = pc
+                ev_qty[n] = sz
+                n += 1
+
+        elif a == ACTION_TRADE:
+            # Hidden / cross executions: aggressor is the inverse of side.
+            ev_ts[n] = t
+            ev_kind[n] = EV_TRADE
+            ev_side[n] = 2 if sb == 1 else (1 if sb == 2 else 0)
+            ev_price[n] = pc
+            ev_qty[n] = sz
+            n += 1
+    return n
+
+
+if njit is not None:
+    _replay_venue_kernel = njit(cache=True, nogil=True)(_replay_venue_loop)
+else:
+    _replay_venue_kernel = _replay_venue_loop
+
+
+def replay_venue(msgs: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Derived per-venue event columns (ts, kind, side, price, qty) from one
+    venue's MBO columns (see load_venue), in file order."""
+    n = len(msgs['ts'])
+    # Dense order ids so the book is plain arrays rather than a dict.
+    uniq, oid = np.unique(msgs['order_id'], return_inverse=True)
+    n_orders = len(uniq)
+    o_side = np.zeros(n_orders, dtype=np.uint8)
+    o_price = np.zeros(n_orders, dtype=np.int64)
+    o_size = np.zeros(n_orders, dtype=np.int64)
+    o_epoch = np.full(n_orders, -1, dtype=np.int64)
+    ev = {k: np.empty(2 * n, dtype=dt) for k, dt in EVENT_DTYPES.items()}
+    m = _replay_venue_kernel(msgs['ts'], msgs['action'], msgs['side'], msgs['price'],
+                             msgs['size'], oid.astype(np.int64).ravel(),
+                             o_side, o_price, o_size, o_epoch,
+                             ev['ts'], ev['kind'], ev['side'], ev['price'], ev['qty'])
+    return {k: v[:m] for k, v in ev.items()}
+
+
+def merge_venues(venue_events: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """Concatenate per-venue event columns, tag each with its venue index,
+    and order by timestamp with a stable argsort, so equal timestamps keep
+    venue order and each venue's own order (what heapq.merge gives for
+    time-ordered venue streams). No venues give empty columns."""
+    if not venue_events:
+        empty = {k: np.empty(0, dtype=dt) for k, dt in EVENT_DTYPES.items()}
+        empty['venue'] = np.empty(0, dtype=np.int32)
+        return empty
+    merged = {k: np.concatenate([ev[k] for ev in venue_events]) for k in venue_events[0]}
+    merged['venue'] = np.concatenate([
+        np.full(len(ev['ts']), vi, dtype=np.int32) for vi, ev in enumerate(venue_events)
+    ])
+    order = np.argsort(merged['ts'], kind='stable')
+    return {k: v[order] for k, v in merged.items()}
+
+
+def _grow(arr: np.ndarray) -> np.ndarray:
+    out = np.empty(2 * arr.shape[0], dtype=arr.dtype)
+    out[:arr.shape[0]] = arr
+    return out
+
+
+def _consolidate_loop(ts, venue, kind, side, pidx, qty, n_venues, n_prices,
+                      bucket_ns, window_start_ns, window_end_ns, capacity):
+    """Consolidated bucketing kernel (JIT-compiled when numba is available).
+
+    Cells are (side, price index) flattened to (side - 1) * n_prices + pidx.
+    `running[v, cell]` is venue v's resting size, `consolidated[cell]` the
+    cross-venue total and `last[cell]` the last emitted total. Each venue
+    also lists the cells it has held size at since its last reset
+    (`v_cells[v, :v_n[v]]`, appended on first nonzero), so an R costs
+    O(cells that venue touched), not the span between them. Returns
+    (n_rows, bucket, cell, size) with the row arrays grown as needed.
+    """
+    n_cells = 2 * n_prices
+    running = np.zeros((n_venues, n_cells), dtype=np.int64)
+    v_cells = np.empty((n_venues, n_cells), dtype=np.int64)
+    v_listed = np.zeros((n_venues, n_cells), dtype=np.bool_)
+    v_n = np.zeros(n_venues, dtype=np.int64)
+    consolidated = np.zeros(n_cells, dtype=np.int64)
+    last = np.zeros(n_cells, dtype=np.int64)
+    touched = np.empty(n_cells, dtype=np.int64)
+    is_touched = np.zeros(n_cells, dtype=np.bool_)
+    n_touched = 0
+
+    out_bucket = np.empty(capacity, dtype=np.int64)
+    out_cell = np.empty(capacity, dtype=np.int64)
+    out_size = np.empty(capacity, dtype=np.int64)
+    n_out = 0
+    current = -1
+
+    for i in range(ts.shape[0] + 1):
+        at_end = i == ts.shape[0] or ts[i] >= window_end_ns
+        b = current if at_end else ((ts[i] - window_start_ns) // bucket_ns) * bucket_ns + window_start_ns
+        if b != current or at_end:
+            # Flush the finished bucket: touched cells in (side, price) order.
+            if current >= window_start_ns and n_touched > 0:
+                cells = np.sort(touched[:n_touched])
+                for j in range(n_touched):
+                    c = cells[j]
+                    if consolidated[c] != last[c]:
+                        if n_out == out_bucket.shape[0]:
+                            out_bucket = _grow(out_bucket)
+                            out_cell = _grow(out_cell)
+                            out_size = _grow(out_size)
+                        out_bucket[n_out] = current
+                        out_cell[n_out] = c
+                        out_size[n_out] = consolidated[c]
+                        n_out += 1
+                        last[c] = consolidated[c]
+            for j in range(n_touched):
+                is_touched[touched[j]] = False
+            n_touched = 0
+            current = b
+        if at_end:
+            break
 
+        v = venue[i]
+        k = kind[i]
+        if k == EV_RESET:
+            # Drop this venue's contribution, touching only its own cells.
+            for j in range(v_n[v]):
+                c = v_cells[v, j]
+                v_listed[v, c] = False
+                sz = running[v, c]
+                if sz == 0:
+                    continue
+                running[v, c] = 0
+                consolidated[c] = max(consolidated[c] - sz, 0)
+                if not is_touched[c]:
+                    is_touched[c] = True
+                    touched[n_touched] = c
+                    n_touched += 1
+            v_n[v] = 0
+        elif k == EV_BOOK and side[i] != 0:
+            c = (side[i] - 1) * n_prices + pidx[i]
+            running[v, c] = max(running[v, c] + qty[i], 0)
+            if running[v, c] != 0 and not v_listed[v, c]:
+                v_listed[v, c] = True
+                v_cells[v, v_n[v]] = c
+                v_n[v] += 1
+            consolidated[c] = max(consolidated[c] + qty[i], 0)
+            if not is_touched[c]:
+                is_touched[c] = True
+                touched[n_touched] = c
+                n_touched += 1
+    return n_out, out_bucket, out_cell, out_size
+
+
+if njit is not None:
+    _grow = njit(cache=True)(_grow)
+    _consolidate_kernel = njit(cache=True, nogil=True)(_consolidate_loop)
+else:
+    _consolidate_kernel = _consolidate_loop
+
+
+def bucket_replay(events, bucket_ns, window_start_ns, window_end_ns):
+    """Run consolidated replay over merged venue events (merge_venues), emit
+    one row per consolidated (price, side, size) change within each bucket.
 
-def merge_venues(venue_paths):
-    iters = []
-    for idx, p in enumerate(venue_paths):
-        def tagged(gen, vi=idx):
-            for ev in gen:
-                yield (ev[1], vi, ev)
-        iters.append(tagged(replay_venue(p)))
-    yield from heapq.merge(*iters, key=lambda x: x[0])
+    Strategy:
+    - Map every book-event price to an index on the day's sorted distinct
+      prices, so a (side, price) cell is an array slot, not a tuple key
+    - Per-venue running sizes per cell; a venue reset walks only the cells
+      that venue has held size at since its previous reset
+    - Consolidated totals and last-emitted values as flat arrays
+    - Within each bucket, accumulate which cells were touched; at the bucket
+      boundary emit the touched cells whose consolidated total differs from
+      last-emitted, in (side, price) order
+    Trades in the window are taken straight from the event columns.
+    """
+    ts = events['ts']
+    kind = events['kind']
+    end = int(np.searchsorted(ts, window_end_ns, side='left'))
+    n_events = min(end + 1, len(ts))
+    pre_window_events = int(np.searchsorted(ts[:n_events], window_start_ns, side='left'))
+
+    is_book = kind[:end] == EV_BOOK
+    prices = np.unique(events['price'][:end][is_book])
+    pidx = np.searchsorted(prices, events['price'][:end]).astype(np.int64)
+    n_venues = int(events['venue'].max()) + 1 if len(ts) else 0
+    n_rows, bucket, cell, size = _consolidate_kernel(
+        ts[:end], events['venue'][:end].astype(np.int64), kind[:end],
+        events['side'][:end].astype(np.int64), pidx, events['qty'][:end],
+        n_venues, len(prices), bucket_ns, window_start_ns, window_end_ns,
+        max(1024, int(is_book.sum())),
+    )
+    cell = cell[:n_rows]
+
+    trade = (kind[:end] == EV_TRADE) & (ts[:end] >= window_start_ns)
 
+    print(f"  events processed: {n_events:,} (pre-window: {pre_window_events:,})")
+    print(f"  level rows      : {n_rows:,}")
+    print(f"  trade rows      : {int(trade.sum()):,}")
 
-def bucket_replay(venue_paths, bucket_ns, window_start_ns, window_end_ns):
-    """Run consolidated replay, emit one row per consolidated (price, side, size)
-    change within each bucket.
+    return {
+        'level_bucket_ns': bucket[:n_rows],
+        'level_price_cents': prices[cell % max(len(prices), 1)],
+        'level_side': cell // max(len(prices), 1) + 1,
+        'level_size': size[:n_rows],
+        'trade_ts_ns': ts[:end][trade],
+        'trade_price_cents': events['price'][:end][trade],
+        'trade_size': events['qty'][:end][trade],
+        'trade_aggressor': events['side'][:end][trade],
+    }
 
-    Strategy:
-    - Maintain per-venue running totals: dict[(venue_idx, side, price)] -> size
-    - Maintain consolidated last-emitted values: dict[(side, price)] -> size
-    - Within each bucket, accumulate which (side, price) cells were touched
-    - At bucket boundary, for each touched cell, compute current consolidated
-      size from per-venue totals; if it differs from last-emitted, emit a row
-      and update last-emitted.
-    """
-    # Per-venue running: dict[(venue_idx, side, price)] -> size
-    running: dict[tuple[int, int, int], int] = {}
-    # Consolidated totals across venues, kept incrementally
-    consolidated: dict[tuple[int, int], int] = {}
-    # Last-emitted consolidated value per (side, price)
-    last_emitted: dict[tuple[int, int], int] = {}
-    # Cells touched in the current bucket
-    touched: set[tuple[int, int]] = set()
-
-    level_buckets: list[int] = []
-    level_prices: list[int] = []
-    level_sides: list[int] = []
-    level_sizes: list[int] = []
-
-    trade_ts: list[int] = []
-    trade_prices: list[int] = []
-    trade_sizes: list[int] = []
-    trade_aggressors: list[int] = []
-
-    n_events = 0
-    pre_window_events = 0
-    current_bucket_ns = -1
-
-    def flush(bucket_ts_ns):
-        # For each cell touched this bucket, emit only if consolidated total differs from last-emitted.
-        for cell in touched:
-            cur = consolidated.get(cell, 0)
-            prev = last_emitted.get(cell, 0)
-            if cur != prev:
-                side, price = cell
-                level_buckets.append(bucket_ts_ns)
-                level_prices.append(price)
-                level_sides.append(side)
-                level_sizes.append(cur)
-                if cur == 0:
-                    last_emitted.pop(cell, None)
-                else:
-                    last_emitted[cell] = cur
 
-    for ts_ns, venue_idx, ev in merge_venues(venue_paths):
-        n_events += 1
-        if ts_ns < window_start_ns:
-            pre_window_events += 1
-        if ts_ns >= window_end_ns:
-            break
+def day_window(date: str) -> tuple[int, int]:
+    """[04:00, 20:00) America/New_York for one YYYY-MM-DD, in ns since epoch."""
+    et = zoneinfo.ZoneInfo("America/New_York")
+    day = datetime.strptime(date, "%Y-%m-%d").date()
+    window_start = datetime.combine(day, datetime.min.time().replace(hour=4), tzinfo=et)
+    window_end = datetime.combine(day, datetime.min.time().replace(hour=20), tzinfo=et)
+    return int(window_start.timestamp() * 1e9), int(window_end.timestamp() * 1e9)
 
-        # Quantize event time to bucket start
-        bucket_ts = ((ts_ns - window_start_ns) // bucket_ns) * bucket_ns + window_start_ns
-        if bucket_ts != current_bucket_ns:
-            # Flush previous bucket
-            if current_bucket_ns >= window_start_ns and touched:
-                flush(current_bucket_ns)
-            touched = set()
-            current_bucket_ns = bucket_ts
-
-        kind = ev[0]
-        if kind == 'reset':
-            # Drop this venue's contribution; decrement consolidated for each cell it held
-            to_drop = [(vi, s, p) for (vi, s, p) in running.keys() if vi == venue_idx]
-            for k in to_drop:
-                sz = running.pop(k)
-                cell = (k[1], k[2])
-                new_total = consolidated.get(cell, 0) - sz
-                if new_total > 0:
-                    consolidated[cell] = new_total
-                else:
-                    consolidated.pop(cell, None)
-                touched.add(cell)
-            continue
 
-        if kind == 'book':
-            _, _, side_b, price_cents, size_delta = ev
-            if side_b == 0:
-                continue
-            key = (venue_idx, side_b, price_cents)
-            running[key] = running.get(key, 0) + size_delta
-            if running[key] <= 0:
-                running.pop(key, None)
-            cell = (side_b, price_cents)
-            new_total = consolidated.get(cell, 0) + size_delta
-            if new_total > 0:
-                consolidated[cell] = new_total
-            else:
-                consolidated.pop(cell, None)
-            touched.add(cell)
+def _replay_venue_path(path: Path) -> dict[str, np.ndarray]:
+    """Pool task: decode and replay one venue file."""
+    return replay_venue(load_venue(path))
 
-        elif kind == 'trade':
-            _, _, aggressor, price_cents, size_qty = ev
-            if ts_ns >= window_start_ns:
-                trade_ts.append(ts_ns)
-                trade_prices.append(price_cents)
-                trade_sizes.append(size_qty)
-                trade_aggressors.append(aggressor)
 
-    # Final flush
-    if current_bucket_ns >= window_start_ns and touched:
-        flush(current_bucket_ns)
+def bucket_day(venue_events, date: str, bucket_ms: int = DEFAULT_BUCKET_MS):
+    """Merge one day's per-venue event streams and consolidate them."""
+    window_start_ns, window_end_ns = day_window(date)
+    events = merge_venues(venue_events)
+    return bucket_replay(events, bucket_ms * 1_000_000, window_start_ns, window_end_ns)
 
-    print(f"  events processed: {n_events:,} (pre-window: {pre_window_events:,})")
-    print(f"  level rows      : {len(level_buckets):,}")
-    print(f"  trade rows      : {len(trade_ts):,}")
 
-    return {
-        'level_bucket_ns': level_buckets,
-        'level_price_cents': level_prices,
-        'level_side': level_sides,
-        'level_size': level_sizes,
-        'trade_ts_ns': trade_ts,
-        'trade_price_cents': trade_prices,
-        'trade_size': trade_sizes,
-        'trade_aggressor': trade_aggressors,
-    }
+def _write_atomic(df: pl.DataFrame, path: Path):
+    tmp = path.with_name(path.name + ".tmp")
+    df.write_parquet(tmp, compression='zstd')
+    tmp.replace(path)
+
+
+def write_day(data, out_dir: Path) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Write levels.parquet and trades.parquet for one day. Each file goes
+    through a .tmp rename, so an interrupted run never leaves a partial
+    parquet that the resume check would mistake for a finished day."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    levels_df = pl.DataFrame({
+        'bucket_ts_ns': pl.Series(data['level_bucket_ns'], dtype=pl.Int64),
+        'price_cents':  pl.Series(data['level_price_cents'], dtype=pl.Int32),
+        'side':         pl.Series(data['level_side'], dtype=pl.UInt8),
+        'size':         pl.Series(data['level_size'], dtype=pl.Int32),
+    })
+    trades_df = pl.DataFrame({
+        'ts_ns':        pl.Series(data['trade_ts_ns'], dtype=pl.Int64),
+        'price_cents':  pl.Series(data['trade_price_cents'], dtype=pl.Int32),
+        'size':         pl.Series(data['trade_size'], dtype=pl.Int32),
+        'aggressor':    pl.Series(data['trade_aggressor'], dtype=pl.UInt8),
+    })
+    # trades first: levels.parquet is the marker a finished day is checked by.
+    _write_atomic(trades_df, out_dir / "trades.parquet")
+    _write_atomic(levels_df, out_dir / "levels.parquet")
+    return levels_df, trades_df
+
+
+def day_done(out_dir: Path) -> bool:
+    return (out_dir / "levels.parquet").exists() and (out_dir / "trades.parquet").exists()
+
+
+def load_pairs(path: str) -> list[tuple[str, str]]:
+    """(ticker, date) pairs from a JSON list of {ticker, date, ...} objects
+    (e.g. data/gap_up_top200.json) or a CSV with ticker and date columns.
+    Duplicates are dropped, first occurrence kept."""
+    if path.endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    pairs = [(str(r['ticker']), str(r['date'])[:10]) for r in rows]
+    return list(dict.fromkeys(pairs))
+
+
+def run_batch(pairs, mbo_root: Path, out_root: Path, bucket_ms: int = DEFAULT_BUCKET_MS,
+              workers: int | None = None, force: bool = False,
+              pyramid: bool = False) -> dict[str, int]:
+    """Bucket many ticker-days on a process pool.
+
+    Every venue file is one pool task, so a single day spreads over up to
+    `workers` cores and many days keep the pool saturated. The main process
+    merges and consolidates a day as soon as its last venue finishes and
+    writes it. At most `workers` days are admitted at a time, which bounds
+    how many days of venue event arrays are held in memory. Days whose two
+    parquets already exist are skipped unless `force`. With `pyramid` each
+    day also gets its viewer tile pyramid (databento_book_pyramid), and a
+    finished day missing one is rebuilt from its parquets alone.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = {'done': 0, 'skipped': 0, 'missing': 0, 'failed': 0}
+    todo = []
+    for ticker, date in pairs:
+        mbo_dir = mbo_root / ticker / date
+        out_dir = out_root / ticker / date
+        if not force and day_done(out_dir):
+            if pyramid and read_meta(out_dir) is None:
+                build_pyramid(out_dir)
+            counts['skipped'] += 1
+            continue
+        venue_paths = sorted(mbo_dir.glob("*.dbn.zst")) if mbo_dir.exists() else []
+        if not venue_paths:
+            counts['missing'] += 1
+            print(f"  MISS {ticker} {date}: no venue files in {mbo_dir}", file=sys.stderr)
+            continue
+        todo.append((ticker, date, venue_paths, out_dir))
+    print(f"{len(todo)} day(s) to bucket, {counts['skipped']} already done, "
+          f"{counts['missing']} missing, {workers} worker(s)")
+
+    pending = iter(todo)
+    active = {}    # (ticker, date) -> [out_dir, venue results by index, n left]
+    owner = {}     # future -> ((ticker, date), venue index)
+    sw = time.time()
+    n_total = len(todo)
+
+    def admit():
+        while len(active) < workers:
+            item = next(pending, None)
+            if item is None:
+                return
+            ticker, date, venue_paths, out_dir = item
+            key = (ticker, date)
+            active[key] = [out_dir, [None] * len(venue_paths), len(venue_paths)]
+            for i, p in enumerate(venue_paths):
+                owner[pool.submit(_replay_venue_path, p)] = (key, i)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        admit()
+        while owner:
+            finished, _ = wait(list(owner), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                key, i = owner.pop(fut)
+                state = active.get(key)
+                if state is None:           # day already failed on another venue
+                    continue
+                try:
+                    state[1][i] = fut.result()
+                except Exception as e:
+                    counts['failed'] += 1
+                    print(f"  FAIL {key[0]} {key[1]}: {e}", file=sys.stderr)
+                    del active[key]
+                    continue
+                state[2] -= 1
+                if state[2]:
+                    continue
+                out_dir, venue_events, _ = active.pop(key)
+                try:
+                    levels_df, trades_df = write_day(bucket_day(venue_events, key[1], bucket_ms), out_dir)
+                    if pyramid:
+                        build_pyramid(out_dir)
+                except Exception as e:
+                    counts['failed'] += 1
+                    print(f"  FAIL {key[0]} {key[1]}: {e}", file=sys.stderr)
+                    continue
+                counts['done'] += 1
+                n = counts['done'] + counts['failed']
+                rate = n / (time.time() - sw)
+                print(f"[{n}/{n_total}] {key[0]} {key[1]}: {len(levels_df):,} levels, "
+                      f"{len(trades_df):,} trades ({rate * 60:.1f} days/min, "
+                      f"ETA {(n_total - n) / rate / 60:.1f}m)")
+                sys.stdout.flush()
+            admit()
+    return counts
 
 
 def parse_args():
-    ap = argparse.ArgumentParser(description=__doc__)
-    ap.add_argument("--ticker", required=True)
-    ap.add_argument("--date", required=True, help="YYYY-MM-DD")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--ticker", help="Single-day mode: ticker (with --date).")
+    ap.add_argument("--date", help="Single-day mode: YYYY-MM-DD (with --ticker).")
+    ap.add_argument("--pairs", help="Batch mode: JSON list of {ticker, date} objects "
+                    "(e.g. data/gap_up_top200.json) or a CSV with ticker,date columns.")
     ap.add_argument("--bucket-ms", type=int, default=DEFAULT_BUCKET_MS,
                     help=f"Time-quantization granularity in ms (default {DEFAULT_BUCKET_MS}).")
-    ap.add_argument("--mbo-dir", default=None)
-    ap.add_argument("--out-dir", default=None)
-    return ap.parse_args()
+    ap.add_argument("--mbo-dir", default=None, help="Single-day mode: venue file directory.")
+    ap.add_argument("--out-dir", default=None, help="Single-day mode: output directory.")
+    ap.add_argument("--mbo-root", default=MBO_ROOT,
+                    help=f"Batch mode: <root>/<TICKER>/<DATE>/*.dbn.zst (default {MBO_ROOT}).")
+    ap.add_argument("--out-root", default=BOOK_ROOT,
+                    help=f"Batch mode: <root>/<TICKER>/<DATE>/ output (default {BOOK_ROOT}).")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Worker processes (default: all cores). Single-day mode uses them per venue.")
+    ap.add_argument("--force", action="store_true",
+                    help="Batch mode: rebuild days whose parquets already exist.")
+    ap.add_argument("--pyramid", action="store_true",
+                    help="Also write the viewer's multi-resolution tile pyramid per day.")
+    args = ap.parse_args()
+    if args.pairs is None and not (args.ticker and args.date):
+        ap.error("give --ticker and --date, or --pairs")
+    return args
 
 
 def main():
     args = parse_args()
-    mbo_dir = Path(args.mbo_dir) if args.mbo_dir else Path("data/databento/mbo") / args.ticker / args.date
+    if args.pairs:
+        counts = run_batch(load_pairs(args.pairs), Path(args.mbo_root), Path(args.out_root),
+                           args.bucket_ms, args.workers, args.force, args.pyramid)
+        print(" ".join(f"{k}={v}" for k, v in counts.items()))
+        sys.exit(1 if counts['failed'] else 0)
+
+    mbo_dir = Path(args.mbo_dir) if args.mbo_dir else Path(args.mbo_root) / args.ticker / args.date
     if not mbo_dir.exists():
         print(f"Missing: {mbo_dir}", file=sys.stderr)
         sys.exit(2)
-    out_dir = Path(args.out_dir) if args.out_dir else Path("data/databento/book") / args.ticker / args.date
-    out_dir.mkdir(parents=True, exist_ok=True)
+    out_dir = Path(args.out_dir) if args.out_dir else Path(args.out_root) / args.ticker / args.date
 
     venue_paths = sorted(mbo_dir.glob("*.dbn.zst"))
     print(f"Replaying {len(venue_paths)} venue files from {mbo_dir}")
     for p in venue_paths:
         print(f"  {p.stem:<6} {p.stat().st_size/(1024*1024):>7.2f} MB")
 
-    import zoneinfo
+    window_start_ns, window_end_ns = day_window(args.date)
     et = zoneinfo.ZoneInfo("America/New_York")
-    day = datetime.strptime(args.date, "%Y-%m-%d").date()
-    window_start = datetime.combine(day, datetime.min.time().replace(hour=4), tzinfo=et)
-    window_end = datetime.combine(day, datetime.min.time().replace(hour=20), tzinfo=et)
-    window_start_ns = int(window_start.timestamp() * 1e9)
-    window_end_ns = int(window_end.timestamp() * 1e9)
-    bucket_ns = args.bucket_ms * 1_000_000
-    print(f"Window: {window_start} → {window_end}")
+    print(f"Window: {datetime.fromtimestamp(window_start_ns / 1e9, et)} → "
+          f"{datetime.fromtimestamp(window_end_ns / 1e9, et)}")
     print(f"Bucket: {args.bucket_ms}ms")
 
-    data = bucket_replay(venue_paths, bucket_ns, window_start_ns, window_end_ns)
-
-    levels_df = pl.DataFrame({
-        'bucket_ts_ns': pl.Series(data['level_bucket_ns'], dtype=pl.Int64),
-        'price_cents':  pl.Series(data['level_price_cents'], dtype=pl.Int32),
-        'side':         pl.Series(data['level_side'], dtype=pl.UInt8),
-        'size':         pl.Series(data['level_size'], dtype=pl.Int32),
-    })
-    trades_df = pl.DataFrame({
-        'ts_ns':        pl.Series(data['trade_ts_ns'], dtype=pl.Int64),
-        'price_cents':  pl.Series(data['trade_price_cents'], dtype=pl.Int32),
-        'size':         pl.Series(data['trade_size'], dtype=pl.Int32),
-        'aggressor':    pl.Series(data['trade_aggressor'], dtype=pl.UInt8),
-    })
+    if args.workers == 1 or len(venue_paths) < 2:
+        venue_events = [_replay_venue_path(p) for p in venue_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers or os.cpu_count() or 1,
+                                                 len(venue_paths))) as pool:
+            venue_events = list(pool.map(_replay_venue_path, venue_paths))
+    levels_df, trades_df = write_day(bucket_day(venue_events, args.date, args.bucket_ms), out_dir)
+    if args.pyramid:
+        build_pyramid(out_dir)
 
     levels_path = out_dir / "levels.parquet"
     trades_path = out_dir / "trades.parquet"
-    levels_df.write_parquet(levels_path, compression='zstd')
-    trades_df.write_parquet(trades_path, compression='zstd')
-
     lsize = levels_path.stat().st_size / (1024*1024)
     tsize = trades_path.stat().st_size / (1024*1024)
     print(f"Wrote {levels_path} ({lsize:.2f} MB, {len(levels_df):,} rows)")
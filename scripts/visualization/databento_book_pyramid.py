@@ -0,0 +1,345 @@
+"""Multi-resolution tile pyramid for the Databento book heatmap viewer.
+
+databento_book_bucket.py writes one change-log per ticker-day at the bucket
+resolution (default 100ms). Rendering a full session from it means turning
+every change into a rectangle and handing all of them to datashader on each
+pan/zoom. The pyramid stores those rectangles precomputed and downsampled,
+split into time chunks, so the viewer reads only the chunks it shows, at
+the coarsest resolution the viewport can display:
+
+    data/databento/book/<TICKER>/<DATE>/pyramid/
+        meta.json                     resolutions, chunk sizes, data bounds
+        levels_<RES>ms/<CHUNK>.parquet
+        trades_<RES>ms/<CHUNK>.parquet
+
+Resolutions are PYRAMID_RES_MS (100ms, 1s, 10s, 1m), dropping any finer
+than the bucketer's bucket. A chunk holds CHUNK_BUCKETS buckets of its
+level and is named by its index, `t // chunk_ns`, so a viewport maps to a
+fixed, small number of files at whichever level it picks.
+
+levels_<RES>ms schema, one row per rectangle, sorted by (side, price, t0):
+    t0_ns, t1_ns   int64    [t0, t1) span, clipped to the chunk
+    price_cents    int32
+    side           uint8    1 = bid, 2 = ask
+    size           float32  time-weighted mean resting size over the span
+
+trades_<RES>ms schema: the raw trades at the base level; above it, trades
+summed per (bucket, price, aggressor) with ts_ns the bucket start:
+    ts_ns int64, price_cents int32, size int64, aggressor uint8, count int32
+
+Downsampling is exact for the mean: a coarse bucket that one rectangle
+covers entirely keeps its size, a bucket cut by several changes gets the
+time-weighted mean of them (absent time counts as zero), and adjacent
+equal-size buckets merge back into one rectangle.
+
+Usage
+-----
+    python scripts/visualization/databento_book_pyramid.py --ticker EOSE --date 2026-05-13
+    python scripts/visualization/databento_book_pyramid.py data/databento/book/*/*
+"""
+
+import argparse
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+PYRAMID_VERSION = 1
+PYRAMID_RES_MS = (100, 1_000, 10_000, 60_000)
+CHUNK_BUCKETS = 6_000
+DEFAULT_BUCKET_NS = 100_000_000
+
+# Viewer: largest on-screen width of one bucket, in pixels, before the
+# next finer level is used instead.
+MAX_PX_PER_BUCKET = 2.0
+
+_RECT_SCHEMA = {'t0_ns': pl.Int64, 't1_ns': pl.Int64, 'price_cents': pl.Int32,
+                'side': pl.UInt8, 'size': pl.Float32}
+_TRADE_SCHEMA = {'ts_ns': pl.Int64, 'price_cents': pl.Int32, 'size': pl.Int64,
+                 'aggressor': pl.UInt8, 'count': pl.Int32}
+
+
+def pyramid_dir(day_dir: Path) -> Path:
+    return Path(day_dir) / "pyramid"
+
+
+def chunk_ns(res_ms: int) -> int:
+    return res_ms * 1_000_000 * CHUNK_BUCKETS
+
+
+def detect_bucket_ns(levels: pl.DataFrame) -> int:
+    """Smallest gap between distinct bucket timestamps (the bucketer's
+    --bucket-ms), DEFAULT_BUCKET_NS when there is only one bucket."""
+    bucket_ts = levels['bucket_ts_ns'].unique().sort()
+    if len(bucket_ts) < 2:
+        return DEFAULT_BUCKET_NS
+    return int(bucket_ts.diff().drop_nulls().min())
+
+
+def _cell_key(side: np.ndarray, price_cents: np.ndarray) -> np.ndarray:
+    return side.astype(np.int64) * 2**32 + price_cents.astype(np.int64)
+
+
+def _rects_frame(t0, t1, price_cents, side, size) -> pl.DataFrame:
+    return pl.DataFrame({'t0_ns': t0, 't1_ns': t1, 'price_cents': price_cents,
+                         'side': side, 'size': size}, schema=_RECT_SCHEMA)
+
+
+def level_rects(levels: pl.DataFrame, bucket_ns: int) -> pl.DataFrame:
+    """Change-log -> rectangles: each nonzero row spans from its bucket to
+    the bucket where the same (price, side) cell next changes, or to the
+    end of the last bucket. Rows come out in (side, price, t0) order."""
+    ts = levels['bucket_ts_ns'].to_numpy()
+    cell = _cell_key(levels['side'].to_numpy(), levels['price_cents'].to_numpy())
+    # The bucketer writes in time order, so a stable sort on the cell alone
+    # gives (cell, time) order; lexsort only for files from elsewhere.
+    if len(ts) < 2 or (np.diff(ts) >= 0).all():
+        order = np.argsort(cell, kind='stable')
+    else:
+        order = np.lexsort((ts, cell))
+    ts, cell = ts[order], cell[order]
+    size = levels['size'].to_numpy()[order]
+    t1 = np.empty_like(ts)
+    t1[:-1] = ts[1:]
+    t1[-1:] = ts.max(initial=0) + bucket_ns
+    t1[:-1][cell[1:] != cell[:-1]] = ts.max(initial=0) + bucket_ns
+    keep = size > 0
+    return _rects_frame(ts[keep], t1[keep], (cell[keep] & 0xFFFFFFFF).astype(np.int32),
+                        (cell[keep] >> 32).astype(np.uint8), size[keep].astype(np.float32))
+
+
+def _merge_runs(t0, t1, cell, size):
+    """Collapse consecutive rectangles of one cell that touch and share a
+    size (inputs in (cell, t0) order): keep each run's first row with the
+    run's last t1."""
+    joins_next = (cell[1:] == cell[:-1]) & (t0[1:] == t1[:-1]) & (size[1:] == size[:-1])
+    start = np.r_[True, ~joins_next]
+    end = np.r_[~joins_next, True]
+    return t0[start], t1[end], cell[start], size[start]
+
+
+def downsample_rects(rects: pl.DataFrame, res_ns: int) -> pl.DataFrame:
+    """Rectangles at a coarser resolution whose sizes are the time-weighted
+    means over each res_ns bucket. `rects` must be in (side, price, t0)
+    order, as level_rects returns them; the output keeps that order.
+
+    Rectangles of one cell never overlap, so a bucket strictly inside a
+    rectangle has no other contributor and keeps that rectangle's size; only
+    the first and last bucket a rectangle touches are shared. Each rectangle
+    becomes head / interior / tail pieces, which laid out in that order are
+    already sorted by (cell, bucket): pieces landing in the same bucket of a
+    cell are adjacent and summed with one reduceat, then equal neighbours
+    are merged.
+    """
+    if rects.is_empty():
+        return rects
+    t0, t1 = rects['t0_ns'].to_numpy(), rects['t1_ns'].to_numpy()
+    cell = _cell_key(rects['side'].to_numpy(), rects['price_cents'].to_numpy())
+    size = rects['size'].to_numpy().astype(np.float64)
+    b0, b1 = t0 // res_ns, (t1 - 1) // res_ns
+
+    p_t0 = np.stack([b0 * res_ns, (b0 + 1) * res_ns, b1 * res_ns], axis=1)
+    p_t1 = np.stack([(b0 + 1) * res_ns, b1 * res_ns, (b1 + 1) * res_ns], axis=1)
+    covered = np.stack([np.minimum(t1, (b0 + 1) * res_ns) - t0,
+                        (b1 - b0 - 1) * res_ns,
+                        t1 - b1 * res_ns], axis=1)
+    valid = np.stack([np.ones_like(b0, dtype=bool), b1 > b0 + 1, b1 > b0], axis=1)
+    p_t0, p_t1 = p_t0[valid], p_t1[valid]
+    p_w = (size[:, None] * covered)[valid]
+    p_cell = np.broadcast_to(cell[:, None], valid.shape)[valid]
+
+    starts = np.flatnonzero(np.r_[True, (p_cell[1:] != p_cell[:-1]) | (p_t0[1:] != p_t0[:-1])])
+    t0, t1, cell = p_t0[starts], np.maximum.reduceat(p_t1, starts), p_cell[starts]
+    mean = (np.add.reduceat(p_w, starts) / (t1 - t0)).astype(np.float32)
+    keep = mean > 0
+    t0, t1, cell, mean = _merge_runs(t0[keep], t1[keep], cell[keep], mean[keep])
+    return _rects_frame(t0, t1, (cell & 0xFFFFFFFF).astype(np.int32),
+                        (cell >> 32).astype(np.uint8), mean)
+
+
+def downsample_trades(trades: pl.DataFrame, res_ns: int | None) -> pl.DataFrame:
+    """Trades summed per (bucket, price, aggressor); res_ns=None keeps the
+    raw prints (count 1 each)."""
+    if res_ns is None:
+        out = trades.with_columns(count=pl.lit(1))
+    else:
+        out = (
+            trades.with_columns(ts_ns=pl.col('ts_ns') // res_ns * res_ns)
+            .group_by(['ts_ns', 'price_cents', 'aggressor'])
+            .agg(pl.col('size').cast(pl.Int64).sum(), count=pl.len())
+        )
+    return out.select(list(_TRADE_SCHEMA)).cast(_TRADE_SCHEMA).sort('ts_ns')
+
+
+def split_chunks(rects: pl.DataFrame, size_ns: int) -> pl.DataFrame:
+    """Cut rectangles at multiples of size_ns and tag each piece with its
+    chunk index, so every chunk file is complete on its own."""
+    c0, c1 = pl.col('t0_ns') // size_ns, (pl.col('t1_ns') - 1) // size_ns
+    return (
+        rects.with_columns(chunk=pl.int_ranges(c0, c1 + 1))
+        .explode('chunk')
+        .with_columns(
+            t0_ns=pl.max_horizontal('t0_ns', pl.col('chunk') * size_ns),
+            t1_ns=pl.min_horizontal('t1_ns', (pl.col('chunk') + 1) * size_ns),
+        )
+    )
+
+
+def _write_chunks(df: pl.DataFrame, out_dir: Path) -> list[int]:
+    """One parquet per chunk index, rows in their incoming order."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    chunks = []
+    for (chunk,), part in df.partition_by('chunk', as_dict=True, maintain_order=True).items():
+        part.drop('chunk').write_parquet(
+            out_dir / f"{chunk}.parquet", compression='zstd', statistics=True,
+            row_group_size=64_000)
+        chunks.append(int(chunk))
+    return sorted(chunks)
+
+
+def _source_stat(day_dir: Path) -> dict:
+    out = {}
+    for name in ("levels.parquet", "trades.parquet"):
+        st = (day_dir / name).stat()
+        out[name] = {'bytes': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return out
+
+
+def build_pyramid(day_dir: Path, res_ms=PYRAMID_RES_MS) -> dict:
+    """Build day_dir/pyramid from levels.parquet and trades.parquet,
+    replacing any previous pyramid atomically. Returns the meta dict."""
+    day_dir = Path(day_dir)
+    levels = pl.read_parquet(day_dir / "levels.parquet")
+    trades = pl.read_parquet(day_dir / "trades.parquet")
+    bucket_ns = detect_bucket_ns(levels) if len(levels) else DEFAULT_BUCKET_NS
+    base_ms = bucket_ns // 1_000_000
+    resolutions = sorted({base_ms, *(r for r in res_ms if r * 1_000_000 >= bucket_ns)})
+
+    tmp = day_dir / "pyramid.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    base = level_rects(levels, bucket_ns) if len(levels) else pl.DataFrame(schema=_RECT_SCHEMA)
+    meta = {
+        'version': PYRAMID_VERSION,
+        'source': _source_stat(day_dir),
+        'bucket_ns': bucket_ns,
+        'levels': {},
+    }
+    if len(base):
+        meta['t_lo_ns'] = int(base['t0_ns'].min())
+        meta['t_hi_ns'] = int(base['t1_ns'].max())
+        meta['price_lo_cents'] = int(base['price_cents'].min())
+        meta['price_hi_cents'] = int(base['price_cents'].max())
+    if len(trades):
+        meta['traded_lo_cents'] = int(trades['price_cents'].min())
+        meta['traded_hi_cents'] = int(trades['price_cents'].max())
+
+    for res in resolutions:
+        res_ns = res * 1_000_000
+        size_ns = chunk_ns(res)
+        rects = base if res == base_ms else downsample_rects(base, res_ns)
+        level_chunks = _write_chunks(split_chunks(rects, size_ns), tmp / f"levels_{res}ms")
+        td = downsample_trades(trades, None if res == base_ms else res_ns)
+        trade_chunks = _write_chunks(td.with_columns(chunk=pl.col('ts_ns') // size_ns),
+                                     tmp / f"trades_{res}ms")
+        meta['levels'][str(res)] = {'chunk_ns': size_ns, 'rects': len(rects),
+                                    'level_chunks': level_chunks, 'trade_chunks': trade_chunks}
+
+    with open(tmp / "meta.json", 'w') as f:
+        json.dump(meta, f, indent=1)
+    out = pyramid_dir(day_dir)
+    shutil.rmtree(out, ignore_errors=True)
+    tmp.rename(out)
+    return meta
+
+
+def read_meta(day_dir: Path) -> dict | None:
+    """The pyramid's meta.json when it exists and matches the current
+    levels/trades parquets, else None."""
+    try:
+        with open(pyramid_dir(day_dir) / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != PYRAMID_VERSION or meta.get('source') != _source_stat(Path(day_dir)):
+        return None
+    return meta
+
+
+def ensure_pyramid(day_dir: Path) -> dict:
+    return read_meta(day_dir) or build_pyramid(day_dir)
+
+
+def choose_res(meta: dict, span_ns: int, width_px: int) -> int:
+    """Coarsest resolution whose buckets are at most MAX_PX_PER_BUCKET
+    pixels wide across a span_ns viewport; the finest one otherwise."""
+    resolutions = sorted(int(r) for r in meta['levels'])
+    fits = [r for r in resolutions if span_ns / (r * 1_000_000) * MAX_PX_PER_BUCKET >= width_px]
+    return fits[-1] if fits else resolutions[0]
+
+
+def _chunk_paths(day_dir: Path, meta: dict, kind: str, res: int, t_lo: int, t_hi: int) -> list[Path]:
+    info = meta['levels'][str(res)]
+    size_ns = info['chunk_ns']
+    lo, hi = t_lo // size_ns, (t_hi - 1) // size_ns
+    folder = pyramid_dir(day_dir) / f"{kind}_{res}ms"
+    return [folder / f"{c}.parquet" for c in info[f"{kind[:-1]}_chunks"] if lo <= c <= hi]
+
+
+def read_rects(day_dir: Path, meta: dict, res: int, t_lo: int, t_hi: int,
+               price_lo_cents: int | None = None, price_hi_cents: int | None = None) -> pl.DataFrame:
+    """Rectangles of one level that overlap [t_lo, t_hi) and, optionally,
+    the price band, reading only the chunk files that cover the range."""
+    paths = _chunk_paths(day_dir, meta, 'levels', res, t_lo, t_hi)
+    if not paths:
+        return pl.DataFrame(schema=_RECT_SCHEMA)
+    pred = (pl.col('t1_ns') > t_lo) & (pl.col('t0_ns') < t_hi)
+    if price_lo_cents is not None:
+        pred &= pl.col('price_cents') >= price_lo_cents
+    if price_hi_cents is not None:
+        pred &= pl.col('price_cents') <= price_hi_cents
+    return pl.scan_parquet(paths).filter(pred).collect()
+
+
+def read_trades(day_dir: Path, meta: dict, res: int, t_lo: int, t_hi: int) -> pl.DataFrame:
+    paths = _chunk_paths(day_dir, meta, 'trades', res, t_lo, t_hi)
+    if not paths:
+        return pl.DataFrame(schema=_TRADE_SCHEMA)
+    return pl.scan_parquet(paths).filter(pl.col('ts_ns').is_between(t_lo, t_hi, closed='left')).collect()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("day_dirs", nargs="*", help="<TICKER>/<DATE> directories holding levels.parquet")
+    ap.add_argument("--ticker")
+    ap.add_argument("--date", help="YYYY-MM-DD")
+    ap.add_argument("--book-root", default="data/databento/book")
+    ap.add_argument("--force", action="store_true", help="Rebuild pyramids that are already current")
+    args = ap.parse_args()
+
+    day_dirs = [Path(d) for d in args.day_dirs]
+    if args.ticker and args.date:
+        day_dirs.append(Path(args.book_root) / args.ticker / args.date)
+    if not day_dirs:
+        ap.error("give day directories or --ticker and --date")
+
+    n_built = n_skip = 0
+    for d in day_dirs:
+        if not (d / "levels.parquet").exists():
+            print(f"  MISS {d}", file=sys.stderr)
+            continue
+        if not args.force and read_meta(d) is not None:
+            n_skip += 1
+            continue
+        meta = build_pyramid(d)
+        n_built += 1
+        counts = ", ".join(f"{r}ms {v['rects']:,}" for r, v in meta['levels'].items())
+        print(f"  OK   {d}: {counts}")
+    print(f"built={n_built} skipped={n_skip}")
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,14 @@ materialise each row as a *rectangle* spanning from its bucket to the next
 bucket where the same (price, side) cell next changes. Datashader's
 Rectangles aggregator rasterizes the rectangles at the current viewport.
 
+The rectangles come from the day's tile pyramid (databento_book_pyramid.py,
+built on first view if the bucketer did not already write it). Each
+pan/zoom picks the coarsest of the 100ms/1s/10s/1m levels whose buckets
+still resolve at --width-px and reads only that level's chunks covering the
+visible time range and price band, so a full-session view touches a few
+thousand 1m rectangles instead of the whole 100ms log. Trades come from the
+same level, summed per bucket, price and aggressor above the base level.
+
 Bids and asks share one signed-size column (bid +, ask -) and are rendered
 with a diverging blue/red colormap. Trades overlay as colored points.
 """
@@ -34,9 +42,11 @@ import holoviews as hv
 import numpy as np
 import pandas as pd
 import panel as pn
-import polars as pl
 from holoviews.operation.datashader import rasterize
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from databento_book_pyramid import choose_res, ensure_pyramid, read_rects, read_trades  # noqa: E402
+
 
 hv.extension('bokeh')
 pn.extension()
@@ -50,67 +60,91 @@ def parse_args():
                     help="Override input dir. Default: data/databento/book/<TICKER>/<DATE>")
     ap.add_argument("--price-pad", type=float, default=0.20,
                     help="Padding in dollars above/below the day's traded range (default 0.20)")
+    ap.add_argument("--width-px", type=int, default=1600,
+                    help="Plot width used to pick the pyramid level (default 1600)")
     return ap.parse_args()
 
 
-def build_app(ticker, date_str, in_dir, price_pad):
-    levels = pl.read_parquet(in_dir / "levels.parquet")
-    trades = pl.read_parquet(in_dir / "trades.parquet")
-    print(f"Loaded {len(levels):,} level rows, {len(trades):,} trade rows")
+def _et_naive(ns):
+    """ns since epoch -> ET-local naive datetime(s).
 
-    bucket_ts = levels.select('bucket_ts_ns').unique().sort('bucket_ts_ns')['bucket_ts_ns']
-    if len(bucket_ts) > 1:
-        diffs = bucket_ts.diff().drop_nulls()
-        bucket_ns = int(diffs.min())
-    else:
-        bucket_ns = 100_000_000
-    print(f"Detected bucket: {bucket_ns/1e6:.0f}ms")
+    Bokeh's datetime axis treats whatever naive datetime it receives as the
+    displayed value, without any timezone reinterpretation, so the axis
+    ticks read in ET."""
+    ts = pd.to_datetime(ns, unit='ns', utc=True)
+    if isinstance(ts, pd.Series):
+        return ts.dt.tz_convert('America/New_York').dt.tz_localize(None)
+    return ts.tz_convert('America/New_York').tz_localize(None)
 
-    levels = levels.sort(['side', 'price_cents', 'bucket_ts_ns'])
-    eod_ns = int(bucket_ts.max()) + bucket_ns
-    levels = levels.with_columns(
-        next_ts_ns=pl.col('bucket_ts_ns')
-            .shift(-1)
-            .over(['side', 'price_cents'])
-            .fill_null(eod_ns)
-    )
-    rect = levels.filter(pl.col('size') > 0)
-    print(f"  {len(rect):,} rectangles")
 
-    if len(trades) > 0:
-        traded_lo = int(trades['price_cents'].min())
-        traded_hi = int(trades['price_cents'].max())
-    else:
-        traded_lo = int(rect['price_cents'].min())
-        traded_hi = int(rect['price_cents'].max())
+def _utc_ns(x) -> int:
+    """Inverse of _et_naive for one axis value from a RangeXY stream."""
+    return pd.Timestamp(x).tz_localize('America/New_York').value
+
+
+def build_app(ticker, date_str, in_dir, price_pad, width_px):
+    meta = ensure_pyramid(in_dir)
+    if 't_lo_ns' not in meta:
+        raise SystemExit(f"{in_dir}: no book levels")
+    bucket_ns = meta['bucket_ns']
+    print(f"Detected bucket: {bucket_ns/1e6:.0f}ms")
+    print("Pyramid: " + ", ".join(f"{r}ms {v['rects']:,} rects" for r, v in meta['levels'].items()))
+
+    traded_lo = meta.get('traded_lo_cents', meta['price_lo_cents'])
+    traded_hi = meta.get('traded_hi_cents', meta['price_hi_cents'])
     pad_cents = int(price_pad * 100)
     p_lo = (traded_lo - pad_cents) / 100.0
     p_hi = (traded_hi + pad_cents) / 100.0
     print(f"Price range: ${p_lo:.2f} → ${p_hi:.2f}")
 
-    rect_df = rect.to_pandas()
-    # Convert to ET-local naive datetimes so the Bokeh axis ticks read in ET
-    # (Bokeh's datetime axis treats whatever naive datetime it receives as
-    # the displayed value, without any timezone reinterpretation).
-    rect_df['x0'] = (pd.to_datetime(rect_df['bucket_ts_ns'], unit='ns', utc=True)
-                     .dt.tz_convert('America/New_York').dt.tz_localize(None))
-    rect_df['x1'] = (pd.to_datetime(rect_df['next_ts_ns'], unit='ns', utc=True)
-                     .dt.tz_convert('America/New_York').dt.tz_localize(None))
-    rect_df['y0'] = (rect_df['price_cents'] - 0.5) / 100.0
-    rect_df['y1'] = (rect_df['price_cents'] + 0.5) / 100.0
-    rect_df['signed_size'] = np.where(rect_df['side'] == 1, rect_df['size'], -rect_df['size'])
-
-    rectangles = hv.Rectangles(
-        rect_df[['x0', 'y0', 'x1', 'y1', 'signed_size']],
-        kdims=['x0', 'y0', 'x1', 'y1'],
-        vdims=['signed_size'],
-    )
+    t_lo_day, t_hi_day = meta['t_lo_ns'], meta['t_hi_ns']
+    x_lo, x_hi = _et_naive(t_lo_day), _et_naive(t_hi_day)
+
+    def viewport(x_range):
+        if x_range is None or None in x_range:
+            return t_lo_day, t_hi_day
+        t_lo, t_hi = (_utc_ns(x) for x in x_range)
+        return max(t_lo, t_lo_day), max(min(t_hi, t_hi_day), t_lo + 1)
+
+    def book_rects(x_range=None, y_range=None):
+        # Only the chunks of the chosen level that intersect the viewport
+        # are read, so the cost tracks the screen, not the session length.
+        t_lo, t_hi = viewport(x_range)
+        res = choose_res(meta, t_hi - t_lo, width_px)
+        band = (None, None) if y_range is None or None in y_range else (
+            int(np.floor(y_range[0] * 100)) - 1, int(np.ceil(y_range[1] * 100)) + 1)
+        rect_df = read_rects(in_dir, meta, res, t_lo, t_hi, *band).to_pandas()
+        rect_df['x0'] = _et_naive(rect_df['t0_ns'])
+        rect_df['x1'] = _et_naive(rect_df['t1_ns'])
+        rect_df['y0'] = (rect_df['price_cents'] - 0.5) / 100.0
+        rect_df['y1'] = (rect_df['price_cents'] + 0.5) / 100.0
+        rect_df['signed_size'] = np.where(rect_df['side'] == 1, rect_df['size'], -rect_df['size'])
+        return hv.Rectangles(
+            rect_df[['x0', 'y0', 'x1', 'y1', 'signed_size']],
+            kdims=['x0', 'y0', 'x1', 'y1'],
+            vdims=['signed_size'],
+        )
 
-    x_lo = rect_df['x0'].min()
-    x_hi = rect_df['x1'].max()
+    def trade_points(x_range=None, y_range=None):
+        t_lo, t_hi = viewport(x_range)
+        res = choose_res(meta, t_hi - t_lo, width_px)
+        td = read_trades(in_dir, meta, res, t_lo, t_hi).to_pandas()
+        td['ts'] = _et_naive(td['ts_ns'])
+        td['price'] = td['price_cents'] / 100.0
+        td['color'] = td['aggressor'].map({1: 'green', 2: 'red', 0: 'grey'}).fillna('grey')
+        td['msize'] = np.clip(np.log10(np.maximum(td['size'], 1)) * 3, 2, 12)
+        return hv.Points(
+            td[['ts', 'price', 'color', 'msize', 'size', 'count']],
+            kdims=['ts', 'price'],
+            vdims=['color', 'msize', 'size', 'count'],
+        )
+
+    range_xy = hv.streams.RangeXY()
+    book_rects_dmap = hv.DynamicMap(book_rects, streams=[range_xy])
 
-    # dynamic=True: Datashader re-rasterizes on every pan/zoom.
-    book_layer = rasterize(rectangles, aggregator='sum', dynamic=True).opts(
+    # Datashader re-rasterizes on every pan/zoom, over the rectangles the
+    # DynamicMap just read for the new viewport.
+    book_layer = rasterize(book_rects_dmap, aggregator='sum').opts(
         cmap='RdBu_r',
         cnorm='eq_hist',
         symmetric=True,
@@ -127,21 +161,9 @@ def build_app(ticker, date_str, in_dir, price_pad):
         active_tools=['xwheel_zoom'],
     )
 
-    if len(trades) > 0:
-        td = trades.to_pandas()
-        td['ts'] = (pd.to_datetime(td['ts_ns'], unit='ns', utc=True)
-                    .dt.tz_convert('America/New_York').dt.tz_localize(None))
-        td['price'] = td['price_cents'] / 100.0
-        td['color'] = td['aggressor'].map({1: 'green', 2: 'red', 0: 'grey'}).fillna('grey')
-        td['msize'] = np.clip(np.log10(np.maximum(td['size'], 1)) * 3, 2, 12)
-        trades_points = hv.Points(
-            td[['ts', 'price', 'color', 'msize']],
-            kdims=['ts', 'price'],
-            vdims=['color', 'msize'],
-        ).opts(
-            color='color', size='msize', alpha=0.5,
-            tools=['hover'],
-        )
+    if sum(len(v['trade_chunks']) for v in meta['levels'].values()) > 0:
+        trades_points = hv.DynamicMap(trade_points, streams=[range_xy]).opts(
+            hv.opts.Points(color='color', size='msize', alpha=0.5, tools=['hover']))
         view = book_layer * trades_points
     else:
         view = book_layer
@@ -155,7 +177,7 @@ def main():
     if not in_dir.exists():
         print(f"Missing: {in_dir}", file=sys.stderr)
         sys.exit(2)
-    view = build_app(args.ticker, args.date, in_dir, args.price_pad)
+    view = build_app(args.ticker, args.date, in_dir, args.price_pad, args.width_px)
     pane = pn.pane.HoloViews(view, sizing_mode='stretch_both')
     pane.servable()
 
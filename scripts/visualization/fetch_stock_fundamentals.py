@@ -10,8 +10,8 @@ import duckdb
 
 # Add visualization scripts to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'visualization'))
-from trade_filters import filter_trades
-from market_hours import split_by_market_hours
+from trade_filters import filter_trades_columnar
+from market_hours import split_by_market_hours_columnar
 
 # Load API keys from config files
 CONFIG = {}
@@ -103,15 +103,15 @@ def get_gap_and_premarket(ticker, date_str):
     premarket_volume = 0
 
     if os.path.exists(trades_path):
-        from trade_io import load_trades as _load_parquet_trades
-        trades = _load_parquet_trades(trades_path)
+        from trade_io import load_trades_columnar
+        trades = load_trades_columnar(trades_path)
 
         # Filter trades first
-        trades = filter_trades(trades)
+        trades = filter_trades_columnar(trades)
 
         # Split by market hours
-        pre_market, regular, post_market = split_by_market_hours(trades)
-        premarket_volume = sum(t['size'] for t in pre_market)
+        pre_market, regular, post_market = split_by_market_hours_columnar(trades)
+        premarket_volume = int(trades['size'][pre_market].sum())
 
     return {
         'gap_pct': gap_pct,
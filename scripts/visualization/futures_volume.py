@@ -15,6 +15,8 @@ import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from bars import volume_bars, records
+
 
 def load_trades(path):
     cols = [
@@ -45,75 +47,28 @@ def load_trades(path):
 
 
 def build_volume_bars(df, volume_per_bar):
-    prices = df["price"].to_numpy()
-    qtys = df["quantity"].to_numpy()
-    ts_us = df["timestamp"].to_numpy()
-    buyer_maker = df["is_buyer_maker"].to_numpy()
-    signs = np.where(buyer_maker, -1.0, 1.0)
-
-    bars = []
-    cur = _empty_bar()
-    for i in range(len(df)):
-        remaining = float(qtys[i])
-        price = float(prices[i])
-        ts = int(ts_us[i])
-        sign = float(signs[i])
-        while remaining > 0:
-            space = volume_per_bar - cur["vol"]
-            if remaining <= space:
-                _add(cur, price, remaining, ts, sign)
-                remaining = 0
-            else:
-                if space > 0:
-                    _add(cur, price, space, ts, sign)
-                    remaining -= space
-                bars.append(_finalize(cur))
-                cur = _empty_bar()
-    if cur["vol"] > 0:
-        bars.append(_finalize(cur))
-
-    cum = 0.0
-    for b in bars:
-        cum += b["volume"]
-        b["cumulative_volume"] = cum
-    return bars
-
-
-def _empty_bar():
-    return {"prices": [], "vols": [], "ts": [], "signs": [], "vol": 0.0}
-
-
-def _add(bar, price, vol, ts, sign):
-    bar["prices"].append(price)
-    bar["vols"].append(vol)
-    bar["ts"].append(ts)
-    bar["signs"].append(sign)
-    bar["vol"] += vol
-
-
-def _finalize(bar):
-    prices = np.asarray(bar["prices"])
-    vols = np.asarray(bar["vols"])
-    signs = np.asarray(bar["signs"])
-    total_v = vols.sum()
-    vwap = float(np.sum(prices * vols) / total_v)
-    var = float(np.sum(vols * (prices - vwap) ** 2) / total_v)
-    stddev = float(np.sqrt(max(0.0, var)))
-    signed_vol = float(np.sum(signs * vols))
-    buy_vol = float(np.sum(vols[signs > 0]))
-    sell_vol = float(np.sum(vols[signs < 0]))
-    return {
-        "volume": float(total_v),
-        "vwap": vwap,
-        "stddev": stddev,
-        "start_us": int(bar["ts"][0]),
-        "end_us": int(bar["ts"][-1]),
-        "time_duration_s": (bar["ts"][-1] - bar["ts"][0]) / 1e6,
-        "num_trades": len(bar["prices"]),
-        "signed_volume": signed_vol,
-        "buy_volume": buy_vol,
-        "sell_volume": sell_vol,
-    }
+    signs = np.where(df["is_buyer_maker"].to_numpy(), -1.0, 1.0)
+    b = volume_bars(
+        df["price"].to_numpy(),
+        df["quantity"].to_numpy(),
+        df["timestamp"].to_numpy(),
+        volume_per_bar,
+        side=signs,
+        ts_per_second=1e6,
+    )
+    return records({
+        "volume": b["volume"],
+        "vwap": b["vwap"],
+        "stddev": b["stddev"],
+        "start_us": b["start_ts"],
+        "end_us": b["end_ts"],
+        "time_duration_s": b["duration_s"],
+        "num_trades": b["n_trades"],
+        "signed_volume": b["signed_volume"],
+        "buy_volume": b["buy_volume"],
+        "sell_volume": b["sell_volume"],
+        "cumulative_volume": b["cum_volume"],
+    })
 
 
 def fmt(us):
@@ -1,5 +1,13 @@
-"""Market hours detection from trade conditions."""
+"""Market hours detection from trade conditions.
+
+Each function comes in two forms: the original one over a list of trade
+dicts, and a ``_columnar`` one over a trade_io.load_trades_columnar dict
+(effective ``timestamp`` column plus uint64 ``conditions`` bitmask). The dict
+forms encode their input once and delegate to the columnar code, so the
+effective timestamp is computed a single time per call.
+"""
 import json
+import numpy as np
 from typing import List, Dict, Tuple, Optional
 
 # Opening conditions: 16 (Market Center Official Open)
@@ -8,6 +16,11 @@ OPENING_CONDITIONS = {16}
 CLOSING_CONDITIONS = {15}
 EXTENDED_HOURS_CONDITION = 12
 
+# Bitmask forms, bit c set iff code c is present (see trade_io).
+OPENING_MASK = np.uint64(sum(1 << c for c in OPENING_CONDITIONS))
+CLOSING_MASK = np.uint64(sum(1 << c for c in CLOSING_CONDITIONS))
+EXTENDED_HOURS_MASK = np.uint64(1 << EXTENDED_HOURS_CONDITION)
+
 
 def load_trades(filepath: str) -> List[Dict]:
     """Load trades from JSON file."""
@@ -15,89 +28,106 @@ def load_trades(filepath: str) -> List[Dict]:
         return json.load(f)
 
 
-def detect_market_hours(trades: List[Dict]) -> Optional[Tuple[int, int]]:
+def _columns(trades: List[Dict]) -> Dict[str, np.ndarray]:
+    """Effective timestamps and condition bitmasks for a list of trade dicts.
+
+    Codes >= 64 are left out of the mask; none of the marker codes above are
+    that large, so detection is unaffected.
     """
-    Detect market open/close times from opening/closing print conditions.
+    ts = np.array(
+        [t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp'] for t in trades],
+        dtype=np.int64,
+    )
+    conditions = np.array(
+        [sum(1 << c for c in set(t.get('conditions') or ()) if c < 64) for t in trades],
+        dtype=np.uint64,
+    )
+    return {'timestamp': ts, 'conditions': conditions}
+
+
+def detect_market_hours_columnar(cols: Dict) -> Optional[Tuple[int, int]]:
+    """
+    detect_market_hours over a columnar trade dict.
     Returns (open_timestamp, close_timestamp) in nanoseconds, or None if not found.
     """
-    open_ts = None
-    close_ts = None
-
-    for trade in trades:
-        conditions = trade.get('conditions')
-        if not conditions:
-            continue
-
-        ts = trade['participant_timestamp'] if trade['participant_timestamp'] != 0 else trade['sip_timestamp']
-
-        if any(c in OPENING_CONDITIONS for c in conditions):
-            if open_ts is None or ts < open_ts:
-                open_ts = ts
-
-        if any(c in CLOSING_CONDITIONS for c in conditions):
-            # Take the earliest close marker (not the latest)
-            if close_ts is None or ts < close_ts:
-                close_ts = ts
-
+    ts = cols['timestamp']
+    conds = cols['conditions']
+    opening = (conds & OPENING_MASK) != 0
+    closing = (conds & CLOSING_MASK) != 0
+    if not opening.any() or not closing.any():
+        return None
+
+    open_ts = int(ts[opening].min())
+    # Take the earliest close marker (not the latest)
+    close_ts = int(ts[closing].min())
     if open_ts and close_ts:
         return (open_ts, close_ts)
     return None
 
 
-def split_by_market_hours(trades: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+def split_by_market_hours_columnar(cols: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Split trades into pre-market, regular, and post-market.
-    Returns (pre_market, regular, post_market).
+    split_by_market_hours over a columnar trade dict.
+    Returns (pre_market, regular, post_market) as boolean row masks.
     """
-    hours = detect_market_hours(trades)
+    ts = cols['timestamp']
+    hours = detect_market_hours_columnar(cols)
 
     if hours:
         open_ts, close_ts = hours
-        pre = [t for t in trades if (t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp']) < open_ts]
-        regular = [t for t in trades if open_ts <= (t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp']) <= close_ts]
-        post = [t for t in trades if (t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp']) > close_ts]
-        return (pre, regular, post)
+        return (ts < open_ts, (ts >= open_ts) & (ts <= close_ts), ts > close_ts)
 
     # Fallback: use condition 12 to split regular vs extended hours
-    regular = []
-    extended = []
-
-    for trade in trades:
-        conditions = trade.get('conditions')
-        if conditions and EXTENDED_HOURS_CONDITION in conditions:
-            extended.append(trade)
-        else:
-            regular.append(trade)
+    extended = (cols['conditions'] & EXTENDED_HOURS_MASK) != 0
+    regular = ~extended
 
-    if not regular:
-        return ([], [], extended)
-
-    # Find regular hours boundaries from trades without condition 12
-    regular_start = min(t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp'] for t in regular)
-    regular_end = max(t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp'] for t in regular)
+    if not regular.any():
+        return (np.zeros_like(extended), regular, extended)
 
     # Split extended hours into pre and post based on regular hours boundaries
-    pre = [t for t in extended if (t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp']) < regular_start]
-    post = [t for t in extended if (t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp']) > regular_end]
-
-    return (pre, regular, post)
+    regular_start = ts[regular].min()
+    regular_end = ts[regular].max()
+    return (extended & (ts < regular_start), regular, extended & (ts > regular_end))
 
 
-def get_market_hours_bounds(trades: List[Dict]) -> Optional[Tuple[float, float]]:
+def get_market_hours_bounds_columnar(cols: Dict) -> Optional[Tuple[int, int]]:
     """
-    Get market hours as (open_timestamp, close_timestamp) in nanoseconds.
-    Returns (open_ts, close_ts) or None.
+    get_market_hours_bounds over a columnar trade dict.
+    Returns (open_ts, close_ts) in nanoseconds or None.
     """
-    hours = detect_market_hours(trades)
+    hours = detect_market_hours_columnar(cols)
     if hours:
         return hours
 
     # Fallback: use condition 12 to find regular hours boundaries
-    regular = [t for t in trades if not t.get('conditions') or EXTENDED_HOURS_CONDITION not in t.get('conditions', [])]
-
-    if regular:
-        regular_start = min(t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp'] for t in regular)
-        regular_end = max(t['participant_timestamp'] if t['participant_timestamp'] != 0 else t['sip_timestamp'] for t in regular)
-        return (regular_start, regular_end)
+    ts = cols['timestamp']
+    regular = (cols['conditions'] & EXTENDED_HOURS_MASK) == 0
+    if regular.any():
+        return (int(ts[regular].min()), int(ts[regular].max()))
 
     return None
+
+
+def detect_market_hours(trades: List[Dict]) -> Optional[Tuple[int, int]]:
+    """
+    Detect market open/close times from opening/closing print conditions.
+    Returns (open_timestamp, close_timestamp) in nanoseconds, or None if not found.
+    """
+    return detect_market_hours_columnar(_columns(trades))
+
+
+def split_by_market_hours(trades: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Split trades into pre-market, regular, and post-market.
+    Returns (pre_market, regular, post_market).
+    """
+    masks = split_by_market_hours_columnar(_columns(trades))
+    return tuple([trades[i] for i in np.flatnonzero(m)] for m in masks)
+
+
+def get_market_hours_bounds(trades: List[Dict]) -> Optional[Tuple[float, float]]:
+    """
+    Get market hours as (open_timestamp, close_timestamp) in nanoseconds.
+    Returns (open_ts, close_ts) or None.
+    """
+    return get_market_hours_bounds_columnar(_columns(trades))
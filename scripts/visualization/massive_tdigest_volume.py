@@ -2,51 +2,22 @@ import sys
 import os
 import numpy as np
 import plotly.graph_objects as go
-from tdigest import TDigest
-from market_hours import get_market_hours_bounds
-from trade_filters import filter_trades
-from trade_io import load_trades as _load_parquet_trades
-
-def load_trades(trades_path):
-    # trade_io already sorts by participant_timestamp with sip_timestamp
-    # fallback for OTC stocks, so the OTC fixup the old JSON loader did is
-    # handled inside trade_io.
-    trades = _load_parquet_trades(trades_path)
-    for t in trades:
-        if t['participant_timestamp'] == 0:
-            t['participant_timestamp'] = t['sip_timestamp']
-    return trades
+from sketch_cache import day_digest
 
 def plot_tdigest(json_path, output_html, show_extended_hours=True):
-    all_trades = load_trades(json_path)
-
-    # Filter out special trade types
-    all_trades = filter_trades(all_trades)
-
-    # Filter to regular hours if requested
-    trades = all_trades
-    if not show_extended_hours:
-        hours = get_market_hours_bounds(all_trades)
-        if hours:
-            open_ts, close_ts = hours
-            trades = [t for t in all_trades if open_ts <= t['participant_timestamp'] <= close_ts]
-            print(f'Filtered to regular hours: {len(trades)} trades')
-
-    sizes = [t['size'] for t in trades if t['size'] > 0]
-
-    # Build t-digest
-    digest = TDigest(delta=0.00022, K=1024)
-    for size in sizes:
-        digest.update(size)
+    # Lit-only prints, optionally clipped to regular hours; the per-day
+    # digest is cached next to the parquet (see sketch_cache.py).
+    filter_set = 'lit' if show_extended_hours else 'lit_rth'
+    digest = day_digest(json_path, 'size', filter_set)
 
     # Get quantiles for plotting
     quantiles = np.linspace(0, 1, 1000)
-    values = [digest.percentile(q * 100) for q in quantiles]
+    values = digest.quantile(quantiles)
 
     # Get median and range
     median = digest.percentile(50)
-    min_val = max(min(sizes), 1e-10)
-    max_val = max(sizes)
+    min_val = max(digest.min, 1e-10)
+    max_val = digest.max
 
     fig = go.Figure()
 
@@ -68,7 +39,7 @@ def plot_tdigest(json_path, output_html, show_extended_hours=True):
         post_script = f.read()
 
     fig.update_layout(
-        title=f'T-Digest of Trade Sizes ({len(trades):,} trades)',
+        title=f'T-Digest of Trade Sizes ({digest.count:,.0f} trades)',
         xaxis_title='Trade Size',
         yaxis_title='Cumulative Probability',
         xaxis_type='log',
@@ -80,29 +51,13 @@ def plot_tdigest(json_path, output_html, show_extended_hours=True):
     fig.write_html(output_html, post_script=post_script, config={'scrollZoom': True})
 
     # Calculate statistics from centroids
-    centroids = digest.centroids_to_list()
-    total_count = sum(c['c'] for c in centroids)
-    overall_mean = sum(c['m'] * c['c'] for c in centroids) / total_count
+    overall_mean = digest.mean
 
     # Calculate means for bottom and top 50%
-    bottom_sum = 0
-    bottom_count = 0
-    top_sum = 0
-    top_count = 0
-
-    for c in centroids:
-        if c['m'] < median:
-            bottom_sum += c['m'] * c['c']
-            bottom_count += c['c']
-        else:
-            top_sum += c['m'] * c['c']
-            top_count += c['c']
-
-    bottom_mean = bottom_sum / bottom_count if bottom_count > 0 else 0
-    top_mean = top_sum / top_count if top_count > 0 else 0
+    bottom_mean, top_mean = digest.split_means(median)
 
     print(f"Saved to {output_html}")
-    print(f"Centroids: {len(digest.C)}")
+    print(f"Centroids: {len(digest)}")
     print(f"Average: {overall_mean:.2f}")
     print(f"Median: {median:.2f}")
     print(f"Bottom 50% avg: {bottom_mean:.2f}")
@@ -2,87 +2,55 @@ import sys
 import os
 import numpy as np
 import plotly.graph_objects as go
-from tdigest import TDigest
+from sketches import MergingDigest
 from datetime import datetime, timezone
-from market_hours import get_market_hours_bounds
-from trade_filters import filter_trades
-from trade_io import load_trades as _load_parquet_trades
-
-def load_trades(trades_path):
-    trades = _load_parquet_trades(trades_path)
-    for t in trades:
-        if t['participant_timestamp'] == 0:
-            t['participant_timestamp'] = t['sip_timestamp']
-    return trades
+from market_hours import get_market_hours_bounds_columnar
+from trade_filters import filter_trades_columnar
+from trade_io import load_trades_columnar, take_trades
+from bars import volume_bars
 
 def create_volume_bars(trades, volume_per_bar):
-    """Group trades into fixed volume chunks and track duration."""
-    bars = []
-    current_volume = 0
-    bar_start_time = None
-    bar_end_time = None
-
-    for trade in trades:
-        timestamp = trade['participant_timestamp']
-        size = trade['size']
-        remaining_size = size
-
-        while remaining_size > 0:
-            space_left = volume_per_bar - current_volume
-
-            if remaining_size <= space_left:
-                if bar_start_time is None:
-                    bar_start_time = timestamp
-                bar_end_time = timestamp
-                current_volume += remaining_size
-                remaining_size = 0
-            else:
-                if bar_start_time is None:
-                    bar_start_time = timestamp
-                bar_end_time = timestamp
-                current_volume += space_left
-                remaining_size -= space_left
-
-            if current_volume >= volume_per_bar:
-                duration_ns = bar_end_time - bar_start_time
-                duration_s = duration_ns / 1e9
-                bars.append(duration_s)
-                current_volume = 0
-                bar_start_time = None
-                bar_end_time = None
-
-    return bars
+    """Group trades (a trade_io.load_trades_columnar dict) into fixed volume
+    chunks and return the duration (s) of each completed chunk; the trailing
+    partial chunk is dropped."""
+    b = volume_bars(
+        trades['price'],
+        trades['size'].astype(np.float64),
+        trades['timestamp'],
+        volume_per_bar,
+        close_when_full=True,
+    )
+    return b['duration_s'][b['complete']]
 
 def plot_tdigest(json_path, output_html, volume_per_bar, show_extended_hours=True):
-    all_trades = load_trades(json_path)
+    all_trades = load_trades_columnar(json_path)
 
     # Filter out special trade types
-    all_trades = filter_trades(all_trades)
+    all_trades = filter_trades_columnar(all_trades)
 
     # Filter to regular hours if requested
     trades = all_trades
     if not show_extended_hours:
-        hours = get_market_hours_bounds(all_trades)
+        hours = get_market_hours_bounds_columnar(all_trades)
         if hours:
             open_ts, close_ts = hours
-            trades = [t for t in all_trades if open_ts <= t['participant_timestamp'] <= close_ts]
-            print(f'Filtered to regular hours: {len(trades)} trades')
+            ts = all_trades['timestamp']
+            trades = take_trades(all_trades, (ts >= open_ts) & (ts <= close_ts))
+            print(f'Filtered to regular hours: {len(trades["timestamp"])} trades')
 
     durations = create_volume_bars(trades, volume_per_bar)
 
     # Build t-digest
-    digest = TDigest(delta=0.00022, K=1024)
-    for d in durations:
-        digest.update(d)
+    digest = MergingDigest.from_values(durations)
 
     # Get quantiles for plotting
     quantiles = np.linspace(0, 1, 1000)
-    values = [digest.percentile(q * 100) for q in quantiles]
+    values = digest.quantile(quantiles)
 
     # Get median and range
     median = digest.percentile(50)
-    min_val = max(min(durations), 1e-10)
-    max_val = max(durations)
+    min_val = max(digest.min, 1e-10)
+    max_val = digest.max
 
     fig = go.Figure()
 
@@ -116,29 +84,13 @@ def plot_tdigest(json_path, output_html, volume_per_bar, show_extended_hours=Tru
     fig.write_html(output_html, post_script=post_script, config={'scrollZoom': True})
 
     # Calculate statistics from centroids
-    centroids = digest.centroids_to_list()
-    total_count = sum(c['c'] for c in centroids)
-    overall_mean = sum(c['m'] * c['c'] for c in centroids) / total_count
+    overall_mean = digest.mean
 
     # Calculate means for bottom and top 50%
-    bottom_sum = 0
-    bottom_count = 0
-    top_sum = 0
-    top_count = 0
-
-    for c in centroids:
-        if c['m'] < median:
-            bottom_sum += c['m'] * c['c']
-            bottom_count += c['c']
-        else:
-            top_sum += c['m'] * c['c']
-            top_count += c['c']
-
-    bottom_mean = bottom_sum / bottom_count if bottom_count > 0 else 0
-    top_mean = top_sum / top_count if top_count > 0 else 0
+    bottom_mean, top_mean = digest.split_means(median)
 
     print(f"Saved to {output_html}")
-    print(f"Centroids: {len(digest.C)}")
+    print(f"Centroids: {len(digest)}")
     print(f"Average: {overall_mean:.4f}s")
     print(f"Median: {median:.4f}s")
     print(f"Bottom 50% avg: {bottom_mean:.4f}s")
@@ -1,76 +1,68 @@
 import sys
 import os
-import math
+import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timezone
-from trade_filters import filter_trades
-from market_hours import get_market_hours_bounds
-from trade_io import load_trades as _load_parquet_trades
-
-def load_trades(trades_path):
-    trades = _load_parquet_trades(trades_path)
-    for t in trades:
-        if t['participant_timestamp'] == 0:
-            t['participant_timestamp'] = t['sip_timestamp']
-    return trades
+from trade_filters import filter_trades_columnar
+from market_hours import get_market_hours_bounds_columnar
+from trade_io import load_trades_columnar, take_trades
 
 def merge_trades(trades, threshold_ns=100000):
-    """Merge trades within threshold_ns nanoseconds to reduce HFT noise."""
-    if not trades:
-        return []
-
-    merged = []
-    current_group = [trades[0]]
-
-    for trade in trades[1:]:
-        if trade['participant_timestamp'] - current_group[0]['participant_timestamp'] < threshold_ns:
-            current_group.append(trade)
-        else:
-            merged.append(merge_group(current_group))
-            current_group = [trade]
-
-    merged.append(merge_group(current_group))
-    return merged
-
-def merge_group(group):
-    """Merge a group of trades into one with VWAP."""
-    if len(group) == 1:
-        return group[0]
-
-    total_size = sum(t['size'] for t in group)
-    vwap = sum(t['price'] * t['size'] for t in group) / total_size
-
-    return {
-        'participant_timestamp': group[0]['participant_timestamp'],
-        'price': vwap,
-        'size': total_size
-    }
+    """Merge trades within threshold_ns nanoseconds to reduce HFT noise.
+
+    A group starts at the first trade not yet merged and absorbs every later
+    trade less than threshold_ns after that first trade; each group collapses
+    to one row with the group's first timestamp, total size and VWAP.
+    """
+    ts = trades['timestamp']
+    n = len(ts)
+    if n == 0:
+        return {'timestamp': ts, 'price': trades['price'], 'size': trades['size']}
+
+    # Group starts are path dependent (each is anchored on the previous
+    # group's first trade), so walk them with searchsorted: one step per
+    # group rather than per trade.
+    starts = []
+    i = 0
+    while i < n:
+        starts.append(i)
+        i = int(np.searchsorted(ts, ts[i] + threshold_ns, side='left'))
+    starts = np.asarray(starts, dtype=np.int64)
+
+    price = trades['price']
+    size = trades['size']
+    total_size = np.add.reduceat(size, starts)
+    notional = np.add.reduceat(price * size, starts)
+    singles = np.diff(np.append(starts, n)) == 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = np.where(singles, price[starts], notional / total_size)
+    return {'timestamp': ts[starts], 'price': vwap, 'size': total_size}
 
 def plot_trades(trades, output_html, all_trades, show_extended_hours=True):
-    hours = get_market_hours_bounds(all_trades)
+    hours = get_market_hours_bounds_columnar(all_trades)
 
     if not show_extended_hours and hours:
         open_ts, close_ts = hours
-        trades = [t for t in trades if open_ts <= t['participant_timestamp'] <= close_ts]
-        print(f'Filtered to regular hours: {len(trades)} trades')
+        ts = trades['timestamp']
+        trades = take_trades(trades, (ts >= open_ts) & (ts <= close_ts))
+        print(f'Filtered to regular hours: {len(trades["timestamp"])} trades')
 
-    if not trades:
+    if len(trades['timestamp']) == 0:
         print('No trades to plot')
         return
 
     # Plot all trades (Scattergl handles large datasets efficiently)
-    times = [datetime.fromtimestamp(t['participant_timestamp'] / 1e9, timezone.utc) for t in trades]
-    prices = [t['price'] for t in trades]
-    sizes = [t['size'] for t in trades]
-    marker_sizes = [0.5 * math.sqrt(s) for s in sizes]
-
-    hover_text = [
-        f"Time: {times[i].strftime('%H:%M:%S.%f')[:-3]}<br>"
-        f"Price: ${prices[i]:.2f}<br>"
-        f"Size: {sizes[i]:,}"
-        for i in range(len(trades))
-    ]
+    times = trades['timestamp'].astype('datetime64[ns]')
+    prices = trades['price']
+    sizes = trades['size']
+    marker_sizes = 0.5 * np.sqrt(sizes)
+
+    # Hover text is formatted client-side instead of one Python string per trade.
+    customdata = np.column_stack([prices, sizes])
+    hovertemplate = ('Time: %{x|%H:%M:%S.%L}<br>'
+                     'Price: $%{customdata[0]:.2f}<br>'
+                     'Size: %{customdata[1]:,}<extra></extra>')
 
     fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
         row_heights=[3, 1], vertical_spacing=0.05,
@@ -82,8 +74,8 @@ def plot_trades(trades, output_html, all_trades, show_extended_hours=True):
         open_dt = datetime.fromtimestamp(open_ts / 1e9, timezone.utc)
         close_dt = datetime.fromtimestamp(close_ts / 1e9, timezone.utc)
 
-        first_ts = min(t['participant_timestamp'] for t in all_trades)
-        last_ts = max(t['participant_timestamp'] for t in all_trades)
+        first_ts = int(all_trades['timestamp'].min())
+        last_ts = int(all_trades['timestamp'].max())
         first_dt = datetime.fromtimestamp(first_ts / 1e9, timezone.utc)
         last_dt = datetime.fromtimestamp(last_ts / 1e9, timezone.utc)
 
@@ -114,16 +106,16 @@ def plot_trades(trades, output_html, all_trades, show_extended_hours=True):
     fig.add_trace(go.Scattergl(
         x=times, y=prices, mode='markers',
         marker=dict(size=marker_sizes, color='blue', opacity=0.3),
-        text=hover_text,
-        hoverinfo='text',
+        customdata=customdata,
+        hovertemplate=hovertemplate,
         name='Price'
     ), row=1, col=1)
 
     fig.add_trace(go.Scattergl(
         x=times, y=sizes, mode='markers',
         marker=dict(size=marker_sizes, color='blue', opacity=0.3),
-        text=hover_text,
-        hoverinfo='text',
+        customdata=customdata,
+        hovertemplate=hovertemplate,
         name='Size', showlegend=False
     ), row=2, col=1)
 
@@ -157,16 +149,16 @@ if __name__ == '__main__':
     show_extended_hours = sys.argv[3].lower() == 'true' if len(sys.argv) > 3 else True
 
     print(f'Loading trades from {input_json}...')
-    all_trades = load_trades(input_json)
-    print(f'Loaded {len(all_trades)} trades')
+    all_trades = load_trades_columnar(input_json)
+    print(f'Loaded {len(all_trades["timestamp"])} trades')
 
     # Filter out special trade types
-    all_trades = filter_trades(all_trades)
-    print(f'After filtering: {len(all_trades)} trades')
+    all_trades = filter_trades_columnar(all_trades)
+    print(f'After filtering: {len(all_trades["timestamp"])} trades')
 
     print(f'Merging trades within 100 microseconds...')
     trades = merge_trades(all_trades)
-    print(f'After merging: {len(trades)} trades')
+    print(f'After merging: {len(trades["timestamp"])} trades')
 
     print(f'Plotting...')
     plot_trades(trades, output_html, all_trades, show_extended_hours)
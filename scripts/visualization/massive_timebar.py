@@ -5,77 +5,45 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timezone
-from trade_filters import filter_trades
-from market_hours import get_market_hours_bounds
-from trade_io import load_trades as _load_parquet_trades
-
-def load_trades(trades_path):
-    """Load trades from the per-ticker-day Parquet file."""
-    trades = _load_parquet_trades(trades_path)
-    for t in trades:
-        if t['participant_timestamp'] == 0:
-            t['participant_timestamp'] = t['sip_timestamp']
-    return trades
+from trade_filters import filter_trades_columnar
+from market_hours import get_market_hours_bounds_columnar
+from trade_io import load_trades_columnar, take_trades
+from bars import time_bars, records
 
 def create_time_bars_vwap(trades, seconds_per_bar):
     """
-    Group trades into fixed time intervals and compute VWAP + volume-weighted stddev.
+    Group trades (a trade_io.load_trades_columnar dict) into fixed time
+    intervals and compute VWAP + volume-weighted stddev.
 
     Mirrors the ORB system's TimeBarBuilder: trades are bucketed by
     `floor(timestamp_ns / bucket_ns)`, empty buckets are skipped.
 
     Returns list of bars with:
-    - start_time, end_time: time range (participant_timestamp)
+    - start_time, end_time: time range (effective timestamp)
     - vwap: volume-weighted average price
     - stddev: volume-weighted standard deviation
     - volume: total volume in bar
     - num_trades: number of trades in bar
     """
-    if not trades:
+    if len(trades['timestamp']) == 0:
         return []
 
-    bars = []
     bucket_ns = seconds_per_bar * 1_000_000_000
-    current_bucket = None
-    bar_trades = []
-
-    for trade in trades:
-        ts = trade['participant_timestamp']
-        bucket = ts // bucket_ns
-
-        if current_bucket is None:
-            current_bucket = bucket
-        elif bucket != current_bucket:
-            if bar_trades:
-                bars.append(compute_bar_stats(bar_trades, current_bucket * bucket_ns, bucket_ns))
-            bar_trades = []
-            current_bucket = bucket
-
-        bar_trades.append(trade)
-
-    if bar_trades:
-        bars.append(compute_bar_stats(bar_trades, current_bucket * bucket_ns, bucket_ns))
-
-    return bars
-
-def compute_bar_stats(bar_trades, bucket_start_ns, bucket_ns):
-    """Compute VWAP + volume-weighted stddev for a time bar."""
-    prices = np.array([t['price'] for t in bar_trades])
-    volumes = np.array([t['size'] for t in bar_trades])
-
-    total_volume = volumes.sum()
-    vwap = np.sum(prices * volumes) / total_volume
-    variance = np.sum(volumes * (prices - vwap) ** 2) / total_volume
-    stddev = np.sqrt(max(0.0, variance))
-
-    return {
-        'start_time': bucket_start_ns,
-        'end_time': bucket_start_ns + bucket_ns,
-        'vwap': vwap,
-        'stddev': stddev,
-        'volume': total_volume,
-        'num_trades': len(bar_trades)
-    }
+    b = time_bars(
+        trades['price'],
+        trades['size'].astype(np.float64),
+        trades['timestamp'],
+        bucket_ns,
+    )
+    start = b['bucket'] * bucket_ns
+    return records({
+        'start_time': start,
+        'end_time': start + bucket_ns,
+        'vwap': b['vwap'],
+        'stddev': b['stddev'],
+        'volume': b['volume'],
+        'num_trades': b['n_trades'],
+    })
 
 def plot_time_bars_vwap(bars, output_html, seconds_per_bar, all_trades=None):
     """
@@ -107,15 +75,15 @@ def plot_time_bars_vwap(bars, output_html, seconds_per_bar, all_trades=None):
         return ns_to_datetime(ns).strftime('%H:%M:%S')
 
     # Add background shading for market hours zones
-    if all_trades and show_extended_hours:
-        hours = get_market_hours_bounds(all_trades)
+    if all_trades is not None and len(all_trades['timestamp']) and show_extended_hours:
+        hours = get_market_hours_bounds_columnar(all_trades)
         if hours:
             open_ts, close_ts = hours
             open_dt = ns_to_datetime(open_ts)
             close_dt = ns_to_datetime(close_ts)
 
-            first_ts = min(t['participant_timestamp'] for t in all_trades)
-            last_ts = max(t['participant_timestamp'] for t in all_trades)
+            first_ts = int(all_trades['timestamp'].min())
+            last_ts = int(all_trades['timestamp'].max())
             first_dt = ns_to_datetime(first_ts)
             last_dt = ns_to_datetime(last_ts)
 
@@ -269,21 +237,22 @@ if __name__ == '__main__':
         output_html = f'{output_dir}/timebar.html'
 
     print(f'Loading trades from {input_parquet}...')
-    all_trades = load_trades(input_parquet)
-    print(f'Loaded {len(all_trades)} trades')
+    all_trades = load_trades_columnar(input_parquet)
+    print(f'Loaded {len(all_trades["timestamp"])} trades')
 
     # Filter out special trade types (match massive_volume.py defaults)
-    all_trades = filter_trades(all_trades)
-    print(f'After filtering: {len(all_trades)} trades')
+    all_trades = filter_trades_columnar(all_trades)
+    print(f'After filtering: {len(all_trades["timestamp"])} trades')
 
     # Filter to regular hours if requested
     trades = all_trades
     if not show_extended_hours:
-        hours = get_market_hours_bounds(all_trades)
+        hours = get_market_hours_bounds_columnar(all_trades)
         if hours:
             open_ts, close_ts = hours
-            trades = [t for t in all_trades if open_ts <= t['participant_timestamp'] <= close_ts]
-            print(f'Filtered to regular hours: {len(trades)} trades')
+            ts = all_trades['timestamp']
+            trades = take_trades(all_trades, (ts >= open_ts) & (ts <= close_ts))
+            print(f'Filtered to regular hours: {len(trades["timestamp"])} trades')
 
     print(f'Creating {seconds_per_bar}s time bars...')
     bars = create_time_bars_vwap(trades, seconds_per_bar)
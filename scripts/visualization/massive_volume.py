@@ -5,21 +5,15 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timezone
-from trade_filters import filter_trades
-from market_hours import get_market_hours_bounds
-from trade_io import load_trades as _load_parquet_trades
-
-def load_trades(trades_path):
-    """Load trades from the per-ticker-day Parquet file."""
-    trades = _load_parquet_trades(trades_path)
-    for t in trades:
-        if t['participant_timestamp'] == 0:
-            t['participant_timestamp'] = t['sip_timestamp']
-    return trades
+from trade_filters import filter_trades_columnar
+from market_hours import get_market_hours_bounds_columnar
+from trade_io import load_trades_columnar, take_trades
+from bars import volume_bars, records
 
 def create_volume_bars_vwap(trades, volume_per_bar):
     """
-    Group trades into fixed volume chunks and compute VWAP with stddev.
+    Group trades (a trade_io.load_trades_columnar dict) into fixed volume
+    chunks and compute VWAP with stddev.
 
     Splits trades across bars when they exceed the volume threshold.
 
@@ -27,80 +21,26 @@ def create_volume_bars_vwap(trades, volume_per_bar):
     - cumulative_volume: x-axis position
     - vwap: volume-weighted average price
     - stddev: standard deviation of prices
-    - start_time, end_time: time range (participant_timestamp)
-    - num_trades: number of trades (partial trades count fractionally)
+    - start_time, end_time: time range (effective timestamp)
+    - num_trades: number of trade fragments in the bar
     """
-    bars = []
-    current_volume = 0
-    bar_data = []  # List of (price, volume, timestamp) tuples
-
-    for trade in trades:
-        price = trade['price']
-        size = trade['size']
-        timestamp = trade['participant_timestamp']
-
-        remaining_size = size
-
-        while remaining_size > 0:
-            space_left = volume_per_bar - current_volume
-
-            if remaining_size <= space_left:
-                # Trade fits in current bar
-                bar_data.append((price, remaining_size, timestamp))
-                current_volume += remaining_size
-                remaining_size = 0
-            else:
-                # Split trade: fill current bar and continue to next
-                if space_left > 0:
-                    bar_data.append((price, space_left, timestamp))
-                    current_volume += space_left
-                    remaining_size -= space_left
-
-                # Complete current bar
-                if current_volume >= volume_per_bar:
-                    bar = compute_bar_stats(bar_data, bars)
-                    bars.append(bar)
-
-                    # Reset for next bar
-                    current_volume = 0
-                    bar_data = []
-
-    # Handle remaining data
-    if bar_data:
-        bar = compute_bar_stats(bar_data, bars)
-        bars.append(bar)
-
-    return bars
-
-def compute_bar_stats(bar_data, existing_bars):
-    """Compute VWAP, stddev, and time duration for a bar."""
-    prices = np.array([p for p, v, t in bar_data])
-    volumes = np.array([v for p, v, t in bar_data])
-    timestamps = [t for p, v, t in bar_data]
-
-    total_volume = volumes.sum()
-    vwap = np.sum(prices * volumes) / total_volume
-
-    # Weighted standard deviation
-    variance = np.sum(volumes * (prices - vwap) ** 2) / total_volume
-    stddev = np.sqrt(variance)
-
-    cumulative_volume = existing_bars[-1]['cumulative_volume'] + total_volume if existing_bars else total_volume
-
-    # Calculate time duration in seconds
-    time_duration_ns = timestamps[-1] - timestamps[0]
-    time_duration_s = time_duration_ns / 1e9
-
-    return {
-        'cumulative_volume': cumulative_volume,
-        'vwap': vwap,
-        'stddev': stddev,
-        'volume': total_volume,
-        'start_time': timestamps[0],
-        'end_time': timestamps[-1],
-        'time_duration_s': time_duration_s,
-        'num_trades': len(bar_data)
-    }
+    b = volume_bars(
+        trades['price'],
+        trades['size'].astype(np.float64),
+        trades['timestamp'],
+        volume_per_bar,
+        close_when_full=True,
+    )
+    return records({
+        'cumulative_volume': b['cum_volume'],
+        'vwap': b['vwap'],
+        'stddev': b['stddev'],
+        'volume': b['volume'],
+        'start_time': b['start_ts'],
+        'end_time': b['end_ts'],
+        'time_duration_s': b['duration_s'],
+        'num_trades': b['n_trades'],
+    })
 
 def plot_volume_bars_vwap(bars, output_html, all_trades=None):
     """
@@ -147,8 +87,8 @@ def plot_volume_bars_vwap(bars, output_html, all_trades=None):
     ]
 
     # Add background shading for market hours zones (based on time, not volume)
-    if all_trades and bars and show_extended_hours:
-        hours = get_market_hours_bounds(all_trades)
+    if all_trades is not None and bars and show_extended_hours:
+        hours = get_market_hours_bounds_columnar(all_trades)
         if hours:
             open_ts, close_ts = hours
 
@@ -318,35 +258,36 @@ if __name__ == '__main__':
         output_html = f'{output_dir}/volume.html'
 
     print(f'Loading trades from {input_parquet}...')
-    all_trades = load_trades(input_parquet)
-    print(f'Loaded {len(all_trades)} trades')
+    all_trades = load_trades_columnar(input_parquet)
+    print(f'Loaded {len(all_trades["timestamp"])} trades')
 
     # Filter out special trade types
-    all_trades = filter_trades(all_trades)
-    print(f'After filtering: {len(all_trades)} trades')
+    all_trades = filter_trades_columnar(all_trades)
+    print(f'After filtering: {len(all_trades["timestamp"])} trades')
 
     # Auto-calculate volume_per_bar if not specified
     if volume_per_bar is None:
-        hours = get_market_hours_bounds(all_trades)
+        hours = get_market_hours_bounds_columnar(all_trades)
         if hours:
             open_ts, close_ts = hours
-            regular_hours_trades = [t for t in all_trades if open_ts <= t['participant_timestamp'] <= close_ts]
-            regular_hours_volume = sum(t['size'] for t in regular_hours_trades)
+            ts = all_trades['timestamp']
+            regular_hours_volume = all_trades['size'][(ts >= open_ts) & (ts <= close_ts)].sum()
             volume_per_bar = int(np.ceil(regular_hours_volume / 3000 / 1000) * 1000)
             print(f'Auto-calculated volume_per_bar: {volume_per_bar} (regular hours volume: {regular_hours_volume:,.0f})')
         else:
-            total_volume = sum(t['size'] for t in all_trades)
+            total_volume = all_trades['size'].sum()
             volume_per_bar = int(np.ceil(total_volume / 3000 / 1000) * 1000)
             print(f'Auto-calculated volume_per_bar: {volume_per_bar} (total volume: {total_volume:,.0f}, market hours not determined)')
 
     # Filter to regular hours if requested
     trades = all_trades
     if not show_extended_hours:
-        hours = get_market_hours_bounds(all_trades)
+        hours = get_market_hours_bounds_columnar(all_trades)
         if hours:
             open_ts, close_ts = hours
-            trades = [t for t in all_trades if open_ts <= t['participant_timestamp'] <= close_ts]
-            print(f'Filtered to regular hours: {len(trades)} trades')
+            ts = all_trades['timestamp']
+            trades = take_trades(all_trades, (ts >= open_ts) & (ts <= close_ts))
+            print(f'Filtered to regular hours: {len(trades["timestamp"])} trades')
 
     print(f'Creating volume bars with {volume_per_bar} volume per bar...')
     bars = create_volume_bars_vwap(trades, volume_per_bar)
@@ -3,7 +3,7 @@ import sys
 import os
 import numpy as np
 import plotly.graph_objects as go
-from tdigest import TDigest
+from sketches import MergingDigest
 
 def load_trades(csv_path):
     trades = []
@@ -18,28 +18,22 @@ def load_trades(csv_path):
 
 def plot_tdigest(csv_path, output_html):
     trades = load_trades(csv_path)
-    trades = [t for t in trades if t['size'] > 0]
+    times = np.array([t['time'] for t in trades if t['size'] > 0], dtype=np.float64)
 
     # Calculate time deltas in seconds (time is in minutes)
-    deltas = []
-    for i in range(1, len(trades)):
-        delta_min = trades[i]['time'] - trades[i-1]['time']
-        delta_s = delta_min * 60
-        deltas.append(delta_s)
+    deltas = np.diff(times) * 60
 
     # Build t-digest
-    digest = TDigest(delta=0.00022, K=1024)
-    for d in deltas:
-        digest.update(d)
+    digest = MergingDigest.from_values(deltas)
 
     # Get quantiles for plotting
     quantiles = np.linspace(0, 1, 1000)
-    values = [digest.percentile(q * 100) for q in quantiles]
+    values = digest.quantile(quantiles)
 
     # Get median and range
     median = digest.percentile(50)
-    min_val = max(min(deltas), 1e-10)
-    max_val = max(deltas)
+    min_val = max(digest.min, 1e-10)
+    max_val = digest.max
 
     fig = go.Figure()
 
@@ -73,29 +67,13 @@ def plot_tdigest(csv_path, output_html):
     fig.write_html(output_html, post_script=post_script, config={'scrollZoom': True})
 
     # Calculate statistics from centroids
-    centroids = digest.centroids_to_list()
-    total_count = sum(c['c'] for c in centroids)
-    overall_mean = sum(c['m'] * c['c'] for c in centroids) / total_count
+    overall_mean = digest.mean
 
     # Calculate means for bottom and top 50%
-    bottom_sum = 0
-    bottom_count = 0
-    top_sum = 0
-    top_count = 0
-
-    for c in centroids:
-        if c['m'] < median:
-            bottom_sum += c['m'] * c['c']
-            bottom_count += c['c']
-        else:
-            top_sum += c['m'] * c['c']
-            top_count += c['c']
-
-    bottom_mean = bottom_sum / bottom_count if bottom_count > 0 else 0
-    top_mean = top_sum / top_count if top_count > 0 else 0
+    bottom_mean, top_mean = digest.split_means(median)
 
     print(f"Saved to {output_html}")
-    print(f"Centroids: {len(digest.C)}")
+    print(f"Centroids: {len(digest)}")
     print(f"Average: {overall_mean:.4f}s")
     print(f"Median: {median:.4f}s")
     print(f"Bottom 50% avg: {bottom_mean:.4f}s")
@@ -3,7 +3,7 @@ import sys
 import os
 import numpy as np
 import plotly.graph_objects as go
-from tdigest import TDigest
+from sketches import MergingDigest
 
 def load_trades(csv_path):
     trades = []
@@ -15,21 +15,19 @@ def load_trades(csv_path):
 
 def plot_tdigest(json_path, output_html):
     trades = load_trades(json_path)
-    sizes = [t['size'] for t in trades if t['size'] > 0]
+    sizes = np.array([t['size'] for t in trades if t['size'] > 0], dtype=np.float64)
 
     # Build t-digest
-    digest = TDigest(delta=0.00022, K=1024)
-    for size in sizes:
-        digest.update(size)
+    digest = MergingDigest.from_values(sizes)
 
     # Get quantiles for plotting
     quantiles = np.linspace(0, 1, 1000)
-    values = [digest.percentile(q * 100) for q in quantiles]
+    values = digest.quantile(quantiles)
 
     # Get median and range
     median = digest.percentile(50)
-    min_val = max(min(sizes), 1e-10)
-    max_val = max(sizes)
+    min_val = max(digest.min, 1e-10)
+    max_val = digest.max
 
     fig = go.Figure()
 
@@ -63,29 +61,13 @@ def plot_tdigest(json_path, output_html):
     fig.write_html(output_html, post_script=post_script, config={'scrollZoom': True})
 
     # Calculate statistics from centroids
-    centroids = digest.centroids_to_list()
-    total_count = sum(c['c'] for c in centroids)
-    overall_mean = sum(c['m'] * c['c'] for c in centroids) / total_count
+    overall_mean = digest.mean
 
     # Calculate means for bottom and top 50%
-    bottom_sum = 0
-    bottom_count = 0
-    top_sum = 0
-    top_count = 0
-
-    for c in centroids:
-        if c['m'] < median:
-            bottom_sum += c['m'] * c['c']
-            bottom_count += c['c']
-        else:
-            top_sum += c['m'] * c['c']
-            top_count += c['c']
-
-    bottom_mean = bottom_sum / bottom_count if bottom_count > 0 else 0
-    top_mean = top_sum / top_count if top_count > 0 else 0
+    bottom_mean, top_mean = digest.split_means(median)
 
     print(f"Saved to {output_html}")
-    print(f"Centroids: {len(digest.C)}")
+    print(f"Centroids: {len(digest)}")
     print(f"Average: {overall_mean:.2f}")
     print(f"Median: {median:.2f}")
     print(f"Bottom 50% avg: {bottom_mean:.2f}")
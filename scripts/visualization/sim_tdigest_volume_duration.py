@@ -3,7 +3,8 @@ import sys
 import os
 import numpy as np
 import plotly.graph_objects as go
-from tdigest import TDigest
+from sketches import MergingDigest
+from bars import volume_bars
 
 def load_trades(csv_path):
     trades = []
@@ -17,60 +18,33 @@ def load_trades(csv_path):
     return trades
 
 def create_volume_bars(trades, volume_per_bar):
-    """Group trades into fixed volume chunks and track duration."""
-    bars = []
-    current_volume = 0
-    bar_start_time = None
-    bar_end_time = None
-
-    for trade in trades:
-        time_min = trade['time']
-        size = trade['size']
-        remaining_size = size
-
-        while remaining_size > 0:
-            space_left = volume_per_bar - current_volume
-
-            if remaining_size <= space_left:
-                if bar_start_time is None:
-                    bar_start_time = time_min
-                bar_end_time = time_min
-                current_volume += remaining_size
-                remaining_size = 0
-            else:
-                if bar_start_time is None:
-                    bar_start_time = time_min
-                bar_end_time = time_min
-                current_volume += space_left
-                remaining_size -= space_left
-
-            if current_volume >= volume_per_bar:
-                duration_min = bar_end_time - bar_start_time
-                duration_s = duration_min * 60
-                bars.append(duration_s)
-                current_volume = 0
-                bar_start_time = None
-                bar_end_time = None
-
-    return bars
+    """Group trades into fixed volume chunks and return the duration (s) of
+    each completed chunk; the trailing partial chunk is dropped."""
+    time_min = np.array([t['time'] for t in trades], dtype=np.float64)
+    b = volume_bars(
+        np.zeros_like(time_min),  # durations only; price is not needed
+        np.array([t['size'] for t in trades], dtype=np.float64),
+        time_min,
+        volume_per_bar,
+        ts_per_second=1 / 60,  # sim time is in minutes
+    )
+    return b['duration_s'][b['complete']]
 
 def plot_tdigest(csv_path, output_html, volume_per_bar):
     trades = load_trades(csv_path)
     durations = create_volume_bars(trades, volume_per_bar)
 
     # Build t-digest
-    digest = TDigest(delta=0.00022, K=1024)
-    for d in durations:
-        digest.update(d)
+    digest = MergingDigest.from_values(durations)
 
     # Get quantiles for plotting
     quantiles = np.linspace(0, 1, 1000)
-    values = [digest.percentile(q * 100) for q in quantiles]
+    values = digest.quantile(quantiles)
 
     # Get median and range
     median = digest.percentile(50)
-    min_val = max(min(durations), 1e-10)
-    max_val = max(durations)
+    min_val = max(digest.min, 1e-10)
+    max_val = digest.max
 
     fig = go.Figure()
 
@@ -104,29 +78,13 @@ def plot_tdigest(csv_path, output_html, volume_per_bar):
     fig.write_html(output_html, post_script=post_script, config={'scrollZoom': True})
 
     # Calculate statistics from centroids
-    centroids = digest.centroids_to_list()
-    total_count = sum(c['c'] for c in centroids)
-    overall_mean = sum(c['m'] * c['c'] for c in centroids) / total_count
+    overall_mean = digest.mean
 
     # Calculate means for bottom and top 50%
-    bottom_sum = 0
-    bottom_count = 0
-    top_sum = 0
-    top_count = 0
-
-    for c in centroids:
-        if c['m'] < median:
-            bottom_sum += c['m'] * c['c']
-            bottom_count += c['c']
-        else:
-            top_sum += c['m'] * c['c']
-            top_count += c['c']
-
-    bottom_mean = bottom_sum / bottom_count if bottom_count > 0 else 0
-    top_mean = top_sum / top_count if top_count > 0 else 0
+    bottom_mean, top_mean = digest.split_means(median)
 
     print(f"Saved to {output_html}")
-    print(f"Centroids: {len(digest.C)}")
+    print(f"Centroids: {len(digest)}")
     print(f"Average: {overall_mean:.4f}s")
     print(f"Median: {median:.4f}s")
     print(f"Bottom 50% avg: {bottom_mean:.4f}s")
@@ -4,6 +4,7 @@ import os
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from bars import volume_bars, records
 
 def load_trades(csv_path):
     """Load trades from simulation CSV file."""
@@ -26,82 +27,39 @@ def create_volume_bars(trades, volume_per_bar):
     Group trades into fixed volume chunks with trade splitting.
     Computes VWAP with stddev per bar.
 
-    Note: no trade_count tracked here. If added, count each trade exactly once
-    against the bar where its first fragment lands — spillover bars get count
-    0. Without that, a single large print is indistinguishable from a hold
-    that fills the same number of bars. See TradingEdge.Simulation/VolumeBar.fs
-    for the same rule applied to the F# builder used for training data.
+    Note: num_trades counts trade fragments. The VolumeBar.fs rule (count
+    each trade once, against the bar where its first fragment lands) is
+    available as the engine's n_first column — without it a single large
+    print is indistinguishable from a hold that fills the same number of
+    bars. See TradingEdge.Simulation/VolumeBar.fs for the F# builder used
+    for training data.
     """
-    bars = []
-    current_volume = 0
-    bar_data = []
-
-    for trade in trades:
-        price = trade['price']
-        size = trade['size']
-        time = trade['time']
-        target_mean = trade['target_mean']
-        target_sigma = trade['target_sigma']
-        label = trade['label']
-
-        remaining_size = size
-
-        while remaining_size > 0:
-            space_left = volume_per_bar - current_volume
-
-            if remaining_size <= space_left:
-                bar_data.append((price, remaining_size, time, target_mean, target_sigma, label))
-                current_volume += remaining_size
-                remaining_size = 0
-            else:
-                if space_left > 0:
-                    bar_data.append((price, space_left, time, target_mean, target_sigma, label))
-                    current_volume += space_left
-                    remaining_size -= space_left
-
-                if current_volume >= volume_per_bar:
-                    bars.append(compute_bar_stats(bar_data, bars))
-                    current_volume = 0
-                    bar_data = []
-
-    if bar_data:
-        bars.append(compute_bar_stats(bar_data, bars))
-
-    return bars
-
-def compute_bar_stats(bar_data, existing_bars):
-    """Compute VWAP, stddev, and time duration for a bar."""
-    prices = np.array([d[0] for d in bar_data])
-    volumes = np.array([d[1] for d in bar_data])
-    times = [d[2] for d in bar_data]
-
-    total_volume = volumes.sum()
-    vwap = np.sum(prices * volumes) / total_volume
-
-    variance = np.sum(volumes * (prices - vwap) ** 2) / total_volume
-    stddev = np.sqrt(variance)
-
-    cumulative_volume = existing_bars[-1]['cumulative_volume'] + total_volume if existing_bars else total_volume
-
-    time_duration = times[-1] - times[0]
-
-    # Volume-weighted target mean and sigma
-    target_means = np.array([d[3] for d in bar_data])
-    target_sigmas = np.array([d[4] for d in bar_data])
-
-    return {
-        'cumulative_volume': cumulative_volume,
-        'vwap': vwap,
-        'stddev': stddev,
-        'volume': total_volume,
-        'start_time': times[0],
-        'end_time': times[-1],
-        'time_duration': time_duration,
-        'target_mean': np.sum(target_means * volumes) / total_volume,
-        'target_sigma': np.sum(target_sigmas * volumes) / total_volume,
-        'num_trades': len(bar_data),
-        'labels': bar_data[0][5] if bar_data else ''
-    }
+    b = volume_bars(
+        np.array([t['price'] for t in trades], dtype=np.float64),
+        np.array([t['size'] for t in trades], dtype=np.float64),
+        np.array([t['time'] for t in trades], dtype=np.float64),
+        volume_per_bar,
+        weighted={
+            'target_mean': [t['target_mean'] for t in trades],
+            'target_sigma': [t['target_sigma'] for t in trades],
+        },
+        first={'labels': np.array([t['label'] for t in trades], dtype=object)},
+        ts_per_second=1.0,
+        close_when_full=True,
+    )
+    return records({
+        'cumulative_volume': b['cum_volume'],
+        'vwap': b['vwap'],
+        'stddev': b['stddev'],
+        'volume': b['volume'],
+        'start_time': b['start_ts'],
+        'end_time': b['end_ts'],
+        'time_duration': b['duration_s'],
+        'target_mean': b['target_mean'],
+        'target_sigma': b['target_sigma'],
+        'num_trades': b['n_trades'],
+        'labels': b['labels'],
+    })
 
 def plot_volume_bars(bars, output_html, input_csv):
     """
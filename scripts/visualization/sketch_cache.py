@@ -0,0 +1,193 @@
+"""Per-day t-digest cache for trade-size and inter-arrival distributions.
+
+Each (ticker, date, metric, filter-set) digest is stored as JSON centroids
+next to the day's trade parquet:
+
+    data/trades/NBIS/2025-09-09.parquet
+    data/trades/NBIS/2025-09-09.size.lit.tdigest.json
+
+A cache entry records the parquet's size and mtime and is rebuilt when
+either changes. Multi-day / multi-ticker profiles merge the cached digests
+(sketches.MergingDigest.merge_all) instead of reloading every tape.
+
+Metrics:
+    size          trade size of every kept print
+    interarrival  seconds between consecutive kept prints (within a day)
+
+Filter sets:
+    all      every print in the file
+    lit      trade_filters.filter_trades_columnar
+    lit_rth  lit, clipped to the session bounds from market_hours
+
+Usage:
+    python scripts/visualization/sketch_cache.py NBIS --days 60
+    python scripts/visualization/sketch_cache.py NBIS SMCI --metric interarrival \\
+        --filter lit_rth --start 2025-07-01 --end 2025-09-30
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from market_hours import get_market_hours_bounds_columnar  # noqa: E402
+from sketches import MergingDigest  # noqa: E402
+from trade_filters import filter_trades_columnar  # noqa: E402
+from trade_io import load_trades_columnar, take_trades  # noqa: E402
+
+CACHE_VERSION = 1
+TRADES_ROOT = 'data/trades'
+
+
+def _regular_hours(cols):
+    hours = get_market_hours_bounds_columnar(cols)
+    if not hours:
+        return cols
+    open_ts, close_ts = hours
+    ts = cols['timestamp']
+    return take_trades(cols, (ts >= open_ts) & (ts <= close_ts))
+
+
+FILTER_SETS = {
+    'all': lambda cols: cols,
+    'lit': filter_trades_columnar,
+    'lit_rth': lambda cols: _regular_hours(filter_trades_columnar(cols)),
+}
+
+METRICS = {
+    'size': lambda cols: cols['size'][cols['size'] > 0],
+    'interarrival': lambda cols: np.diff(cols['timestamp'][cols['size'] > 0]) / 1e9,
+}
+
+
+def trades_path(ticker: str, date: str, root: str = TRADES_ROOT) -> str:
+    return os.path.join(root, ticker, f'{date}.parquet')
+
+
+def cache_path(path: str, metric: str, filter_set: str) -> str:
+    """Cache file for one trade parquet, metric and filter set."""
+    return f'{os.path.splitext(path)[0]}.{metric}.{filter_set}.tdigest.json'
+
+
+def _source_stat(path: str) -> dict:
+    st = os.stat(path)
+    return {'bytes': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def build_day_digests(path: str, metrics=None, filter_sets=None) -> dict:
+    """Compute digests for one trade parquet from the tape, loading it once.
+    Returns {(metric, filter_set): MergingDigest}."""
+    metrics = list(metrics or METRICS)
+    filter_sets = list(filter_sets or FILTER_SETS)
+    cols = load_trades_columnar(path)
+    out = {}
+    for f in filter_sets:
+        kept = FILTER_SETS[f](cols)
+        for m in metrics:
+            out[(m, f)] = MergingDigest.from_values(METRICS[m](kept))
+    return out
+
+
+def _write(path: str, metric: str, filter_set: str, digest: MergingDigest, source: dict):
+    out_path = cache_path(path, metric, filter_set)
+    tmp = out_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({
+            'version': CACHE_VERSION,
+            'metric': metric,
+            'filter_set': filter_set,
+            'source': source,
+            'digest': digest.to_dict(),
+        }, f)
+    os.replace(tmp, out_path)
+
+
+def _read(path: str, metric: str, filter_set: str, source: dict):
+    try:
+        with open(cache_path(path, metric, filter_set)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != CACHE_VERSION or state.get('source') != source:
+        return None
+    return MergingDigest.from_dict(state['digest'])
+
+
+def day_digest(path: str, metric: str = 'size', filter_set: str = 'lit',
+               refresh: bool = False) -> MergingDigest:
+    """Digest of one trade parquet, from the cache when it is current.
+
+    On a miss the tape is loaded once and every metric for this filter set is
+    cached, so the sibling metric is free on the next call.
+    """
+    if metric not in METRICS:
+        raise ValueError(f'unknown metric {metric!r}; expected one of {sorted(METRICS)}')
+    if filter_set not in FILTER_SETS:
+        raise ValueError(f'unknown filter set {filter_set!r}; expected one of {sorted(FILTER_SETS)}')
+    source = _source_stat(path)
+    if not refresh:
+        cached = _read(path, metric, filter_set, source)
+        if cached is not None:
+            return cached
+    digests = build_day_digests(path, filter_sets=[filter_set])
+    for (m, f), d in digests.items():
+        _write(path, m, f, d, source)
+    return digests[(metric, filter_set)]
+
+
+def merged_digest(paths, metric: str = 'size', filter_set: str = 'lit',
+                  refresh: bool = False) -> MergingDigest:
+    """Merge the per-day digests of several trade parquets."""
+    return MergingDigest.merge_all(day_digest(p, metric, filter_set, refresh) for p in paths)
+
+
+def list_days(ticker: str, start: str | None = None, end: str | None = None,
+              days: int | None = None, root: str = TRADES_ROOT) -> list[str]:
+    """Trade parquets for a ticker, sorted by date, optionally clipped to
+    [start, end] and then to the last `days` files."""
+    paths = sorted(glob.glob(os.path.join(root, ticker, '*.parquet')))
+    date_of = lambda p: os.path.splitext(os.path.basename(p))[0]
+    if start:
+        paths = [p for p in paths if date_of(p) >= start]
+    if end:
+        paths = [p for p in paths if date_of(p) <= end]
+    if days:
+        paths = paths[-days:]
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('tickers', nargs='+')
+    ap.add_argument('--metric', choices=sorted(METRICS), default='size')
+    ap.add_argument('--filter', dest='filter_set', choices=sorted(FILTER_SETS), default='lit')
+    ap.add_argument('--start', help='First date (YYYY-MM-DD), inclusive')
+    ap.add_argument('--end', help='Last date (YYYY-MM-DD), inclusive')
+    ap.add_argument('--days', type=int, help='Keep only the most recent N days per ticker')
+    ap.add_argument('--root', default=TRADES_ROOT)
+    ap.add_argument('--refresh', action='store_true', help='Ignore cached digests and rebuild from tapes')
+    args = ap.parse_args()
+
+    paths = []
+    for ticker in args.tickers:
+        paths.extend(list_days(ticker, args.start, args.end, args.days, args.root))
+    if not paths:
+        print('No trade files found')
+        return
+
+    digest = merged_digest(paths, args.metric, args.filter_set, args.refresh)
+    unit = 's' if args.metric == 'interarrival' else ''
+    print(f'{len(paths)} day(s), {digest.count:,.0f} values, {len(digest)} centroids')
+    print(f'Average: {digest.mean:.4f}{unit}')
+    for p in (5, 25, 50, 75, 95, 99):
+        print(f'P{p}: {digest.percentile(p):.4f}{unit}')
+
+
+if __name__ == '__main__':
+    main()
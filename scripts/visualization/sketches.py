@@ -0,0 +1,157 @@
+"""Batch-built merging t-digest for the tdigest chart scripts.
+
+The scripts used to feed the pure-Python ``tdigest`` package one value at a
+time and then call ``percentile`` a thousand times to draw the CDF. Here the
+digest is built from a whole NumPy array in one pass: sort, assign each point
+to a k-scale bucket, reduce the buckets to centroids. Quantile and CDF
+queries take arrays and interpolate between centroids with ``np.interp``.
+
+Centroid layout follows Dunning's merging digest with the k1 scale function
+k(q) = compression / (2π) · asin(2q - 1): centroids are narrow near the
+tails and wide near the median, and a digest never holds more than about
+compression / 2 centroids. Two digests merge by re-bucketing their pooled
+centroids the same way, so per-day digests can be combined without going
+back to the raw values.
+
+Usage from a sibling script::
+
+    from sketches import MergingDigest
+    d = MergingDigest.from_values(sizes)
+    values = d.quantile(np.linspace(0, 1, 1000))
+    state = d.to_dict()            # JSON-serializable centroids
+    d2 = MergingDigest.from_dict(state).merge(other)
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+
+
+# Matches the old TDigest(delta=0.00022) accuracy: compression = 1 / delta.
+DEFAULT_COMPRESSION = 1 / 0.00022
+
+
+def _k_bucket(q: np.ndarray, compression: float) -> np.ndarray:
+    """Integer k1-scale bucket of each quantile position."""
+    return np.floor(compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+
+
+def _compress(means: np.ndarray, weights: np.ndarray, compression: float):
+    """Merge sorted (mean, weight) pairs whose weight midpoints share a k1
+    bucket into single centroids."""
+    total = weights.sum()
+    mid = (np.cumsum(weights) - weights / 2) / total
+    bucket = _k_bucket(mid, compression)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    w = np.add.reduceat(weights, starts)
+    m = np.add.reduceat(means * weights, starts) / w
+    return m, w
+
+
+class MergingDigest:
+    """Immutable t-digest: centroid means/weights sorted by mean plus the
+    exact min and max of everything added."""
+
+    def __init__(self, means, weights, min_value: float, max_value: float,
+                 compression: float = DEFAULT_COMPRESSION):
+        self.means = np.asarray(means, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.min = float(min_value)
+        self.max = float(max_value)
+        self.compression = float(compression)
+
+    @classmethod
+    def from_values(cls, values, compression: float = DEFAULT_COMPRESSION) -> 'MergingDigest':
+        """Digest of a 1-D array of finite values (unit weight each)."""
+        x = np.sort(np.asarray(values, dtype=np.float64).ravel())
+        if x.size == 0:
+            return cls([], [], np.nan, np.nan, compression)
+        m, w = _compress(x, np.ones_like(x), compression)
+        return cls(m, w, x[0], x[-1], compression)
+
+    @classmethod
+    def merge_all(cls, digests: Iterable['MergingDigest'],
+                  compression: float | None = None) -> 'MergingDigest':
+        """Single digest of the union of every input digest's data."""
+        digests = [d for d in digests if d.count > 0]
+        if compression is None:
+            compression = max((d.compression for d in digests), default=DEFAULT_COMPRESSION)
+        if not digests:
+            return cls([], [], np.nan, np.nan, compression)
+        means = np.concatenate([d.means for d in digests])
+        weights = np.concatenate([d.weights for d in digests])
+        order = np.argsort(means, kind='stable')
+        m, w = _compress(means[order], weights[order], compression)
+        return cls(m, w, min(d.min for d in digests), max(d.max for d in digests), compression)
+
+    def merge(self, *others: 'MergingDigest') -> 'MergingDigest':
+        return MergingDigest.merge_all((self, *others), self.compression)
+
+    # -- queries -------------------------------------------------------------
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    @property
+    def mean(self) -> float:
+        return float(np.dot(self.means, self.weights) / self.count) if self.count else np.nan
+
+    def __len__(self) -> int:
+        """Number of centroids."""
+        return len(self.means)
+
+    def _knots(self):
+        """Interpolation knots: (min, 0), each centroid at its weight
+        midpoint, (max, count)."""
+        pos = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate([[self.min], self.means, [self.max]])
+        ps = np.concatenate([[0.0], pos, [self.count]])
+        return xs, ps
+
+    def quantile(self, q):
+        """Value at quantile(s) q in [0, 1]; scalar in, scalar out."""
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        xs, ps = self._knots()
+        return np.interp(np.asarray(q, dtype=np.float64) * self.count, ps, xs)
+
+    def percentile(self, p):
+        """quantile(p / 100), matching the old TDigest.percentile call."""
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100)
+
+    def cdf(self, x):
+        """Fraction of the data <= x, for scalar or array x."""
+        if self.count == 0:
+            return np.full(np.shape(x), np.nan)[()]
+        xs, ps = self._knots()
+        return np.interp(np.asarray(x, dtype=np.float64), xs, ps) / self.count
+
+    def split_means(self, at: float) -> tuple[float, float]:
+        """Weighted mean of the centroids below `at` and of the rest (0 for
+        an empty side), as the scripts report for the bottom/top 50%."""
+        lo = self.means < at
+        out = []
+        for side in (lo, ~lo):
+            w = self.weights[side].sum()
+            out.append(float(np.dot(self.means[side], self.weights[side]) / w) if w > 0 else 0)
+        return out[0], out[1]
+
+    # -- serialization ---------------------------------------------------------
+
+    def to_dict(self) -> dict:
+        """JSON-serializable state; inverse of from_dict."""
+        return {
+            'compression': self.compression,
+            'min': self.min,
+            'max': self.max,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'MergingDigest':
+        return cls(state['means'], state['weights'], state['min'], state['max'],
+                   state.get('compression', DEFAULT_COMPRESSION))
@@ -32,104 +32,55 @@ import pyarrow as pa
 import pyarrow.parquet as pq
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from trade_filters import filter_trades
-from market_hours import get_market_hours_bounds
-from trade_io import load_trades
+from trade_filters import filter_trades_columnar
+from market_hours import get_market_hours_bounds_columnar
+from trade_io import load_trades_columnar, take_trades
+from bars import volume_bars
 
 
 def build_bars(trades, bar_volume):
-    """Replicate VolumeBarBuilder semantics from VolumeBar.fs.
+    """Replicate VolumeBarBuilder semantics from VolumeBar.fs over a
+    trade_io.load_trades_columnar dict.
 
     - Trade fragments split when a trade overflows the current bar; volumes
       are split exactly so VWAP/StdDev/Volume stay correct.
     - TradeCount counts the whole trade against the bar where its first
       fragment lands; spillover bars get TradeCount=0.
+    - Only completed bars are emitted; the trailing partial bar is dropped.
     - Returns dict-of-arrays in HoldDataset parquet column order.
     """
-    rel_stddev_arr = []
-    ret_arr = []
-    duration_sec_arr = []
-    trade_count_arr = []
-    volume_arr = []
-    start_us_arr = []
-    end_us_arr = []
-    prev_vwap = None
-
-    cur_prices = []
-    cur_vols = []
-    cur_volume_sum = 0.0
-    cur_trade_count = 0
-    cur_start_us = 0
-    cur_end_us = 0
-    has_started = False
-
-    def emit_bar():
-        nonlocal prev_vwap
-        prices = np.asarray(cur_prices, dtype=np.float64)
-        vols = np.asarray(cur_vols, dtype=np.float64)
-        v_sum = vols.sum()
-        vwap = float((prices * vols).sum() / v_sum)
-        var = float((prices * prices * vols).sum() / v_sum - vwap * vwap)
-        std = (max(0.0, var)) ** 0.5
-        rel_stddev_arr.append(std / vwap if vwap > 0 else 0.0)
-        if prev_vwap is None or prev_vwap <= 0 or vwap <= 0:
-            ret_arr.append(0.0)
-        else:
-            ret_arr.append(float(np.log(vwap / prev_vwap)))
-        duration_sec_arr.append((cur_end_us - cur_start_us) / 1e6)
-        trade_count_arr.append(cur_trade_count)
-        volume_arr.append(float(v_sum))
-        start_us_arr.append(cur_start_us)
-        end_us_arr.append(cur_end_us)
-        prev_vwap = vwap
-
-    for t in trades:
-        price = float(t['price'])
-        size = float(t['size'])
-        ts_us = int(t['participant_timestamp']) // 1000  # ns -> us
-        remaining = size
-        counted = False
-        while remaining > 0.0:
-            if cur_volume_sum == 0.0 and not cur_prices:
-                cur_start_us = ts_us
-                has_started = True
-            if not counted:
-                cur_trade_count += 1
-                counted = True
-            cur_end_us = ts_us
-            space_left = bar_volume - cur_volume_sum
-            if remaining <= space_left:
-                cur_prices.append(price)
-                cur_vols.append(remaining)
-                cur_volume_sum += remaining
-                remaining = 0.0
-            else:
-                if space_left > 0:
-                    cur_prices.append(price)
-                    cur_vols.append(space_left)
-                    cur_volume_sum += space_left
-                    remaining -= space_left
-                if cur_volume_sum >= bar_volume:
-                    emit_bar()
-                    cur_prices.clear()
-                    cur_vols.clear()
-                    cur_volume_sum = 0.0
-                    cur_trade_count = 0
-
-    n = len(rel_stddev_arr)
+    b = volume_bars(
+        trades['price'],
+        trades['size'].astype(np.float64),
+        trades['timestamp'] // 1000,  # ns -> us
+        bar_volume,
+        ts_per_second=1e6,
+        close_on_next=True,
+        close_when_full=True,
+    )
+    b = {k: v[b['complete']] for k, v in b.items()}
+    vwap = b['vwap']
+    n = len(vwap)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rel_stddev = np.where(vwap > 0, b['stddev'] / vwap, 0.0)
+        ret = np.zeros(n, dtype=np.float64)
+        prev = vwap[:-1]
+        cur = vwap[1:]
+        ret[1:] = np.where((prev > 0) & (cur > 0), np.log(cur / prev), 0.0)
+    trade_count = b['n_first'].astype(np.int32)
     return {
         'day_id': np.zeros(n, dtype=np.int32),
         'bar_idx': np.arange(n, dtype=np.int32),
-        'rel_stddev': np.asarray(rel_stddev_arr, dtype=np.float64),
-        'ret': np.asarray(ret_arr, dtype=np.float64),
-        'duration_sec': np.asarray(duration_sec_arr, dtype=np.float64),
-        'trade_count': np.asarray(trade_count_arr, dtype=np.int32),
+        'rel_stddev': rel_stddev,
+        'ret': ret,
+        'duration_sec': b['duration_s'],
+        'trade_count': trade_count,
         # Stocks have no aggression flag in the tape; mirror trade_count so
         # the chart's sidedness panel reads as constant +1 instead of NaN.
-        'buy_count': np.asarray(trade_count_arr, dtype=np.int32),
-        'volume': np.asarray(volume_arr, dtype=np.float64),
-        'start_us': np.asarray(start_us_arr, dtype=np.int64),
-        'end_us': np.asarray(end_us_arr, dtype=np.int64),
+        'buy_count': trade_count.copy(),
+        'volume': b['volume'],
+        'start_us': b['start_ts'].astype(np.int64),
+        'end_us': b['end_ts'].astype(np.int64),
         'label': np.zeros(n, dtype=np.int32),
     }
 
@@ -143,28 +94,25 @@ def main():
     args = ap.parse_args()
 
     print(f'Loading trades from {args.input}')
-    trades = load_trades(args.input)
-    print(f'  loaded {len(trades):,} trades')
+    trades = load_trades_columnar(args.input)
+    print(f'  loaded {len(trades["timestamp"]):,} trades')
 
-    for t in trades:
-        if t['participant_timestamp'] == 0:
-            t['participant_timestamp'] = t['sip_timestamp']
-
-    trades = filter_trades(trades)
-    print(f'  after condition filter: {len(trades):,}')
+    trades = filter_trades_columnar(trades)
+    print(f'  after condition filter: {len(trades["timestamp"]):,}')
 
     if args.regular_hours:
-        hours = get_market_hours_bounds(trades)
+        hours = get_market_hours_bounds_columnar(trades)
         if hours:
             open_ts, close_ts = hours
-            trades = [t for t in trades if open_ts <= t['participant_timestamp'] <= close_ts]
-            print(f'  regular hours only: {len(trades):,}')
+            ts = trades['timestamp']
+            trades = take_trades(trades, (ts >= open_ts) & (ts <= close_ts))
+            print(f'  regular hours only: {len(trades["timestamp"]):,}')
 
-    if not trades:
+    if len(trades['timestamp']) == 0:
         print('  no trades after filtering, skipping')
         return
 
-    total_volume = sum(t['size'] for t in trades)
+    total_volume = int(trades['size'].sum())
     bar_volume = total_volume / args.bars_per_day
     print(f'  total volume {total_volume:,.0f}, target bars {args.bars_per_day} -> bar_volume {bar_volume:,.4f}')
 
@@ -0,0 +1,416 @@
+"""Parity of the bars.py-backed builders with the per-trade loops they
+replaced.
+
+The legacy_* functions are the loops from before the migration, reduced
+to their bar logic (same split arithmetic, same per-bar stats) and fed
+arrays instead of trade dicts. Every builder is run on random tapes with
+fractional sizes, where a global cumsum used to drift across bar edges,
+and on integer tapes, where trades fill bars exactly. Bar count, fragment
+count, trade counts, timestamps, open/close and labels must match
+exactly; float stats to 1e-9.
+
+    python -m pytest -q scripts/visualization/tests
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bars  # noqa: E402
+import binance_volume  # noqa: E402
+import futures_volume  # noqa: E402
+import massive_tdigest_volume_duration  # noqa: E402
+import massive_timebar  # noqa: E402
+import massive_volume  # noqa: E402
+import sim_volume  # noqa: E402
+import stock_bars  # noqa: E402
+
+SEEDS = range(40)
+
+
+def _tape(seed, n=2000, fractional=True):
+    rng = np.random.default_rng(seed)
+    price = np.round(100.0 + np.cumsum(rng.normal(0.0, 0.05, n)), 2)
+    ts = 1_700_000_000_000_000 + np.cumsum(rng.integers(0, 5000, n))
+    side = np.where(rng.random(n) < 0.5, -1.0, 1.0)
+    if fractional:
+        # Lots on a 0.001 grid and a few trades per bar: the running sum
+        # lands within an ulp of the edge many times per tape.
+        size = np.round(rng.exponential(0.05, n), 3)  # includes some zeros
+        bar_volume = round(float(size.sum()) / n * rng.uniform(4, 16), 3)
+    else:
+        size = rng.integers(1, 400, n).astype(np.float64)
+        bar_volume = float(rng.choice([100, 250, 500, 1000]))
+    return price, size, ts, side, bar_volume
+
+
+def _tapes():
+    for seed in SEEDS:
+        yield pytest.param(*_tape(seed), id=f"frac{seed}")
+    for seed in range(5):
+        yield pytest.param(*_tape(seed, fractional=False), id=f"int{seed}")
+
+
+def _assert_rows_equal(old, new):
+    assert len(new) == len(old)
+    for k, (a, b) in enumerate(zip(old, new)):
+        assert set(b) == set(a), k
+        for key, va in a.items():
+            vb = b[key]
+            if isinstance(va, (float, np.floating)):
+                assert math.isclose(vb, va, rel_tol=1e-9, abs_tol=1e-9), (k, key, va, vb)
+            else:
+                assert vb == va, (k, key, va, vb)
+
+
+# -----------------------------------------------------------------------------
+# Legacy loops
+# -----------------------------------------------------------------------------
+
+def legacy_binance(price, qty, ts, side, volume_per_bar, posteriors=None):
+    """binance_volume / futures_volume: close as soon as the bar is topped
+    up."""
+    has_post = posteriors is not None
+
+    def empty():
+        return {"prices": [], "vols": [], "ts": [], "signs": [], "post": [], "vol": 0.0}
+
+    def add(bar, p, v, t, s, post):
+        bar["prices"].append(p)
+        bar["vols"].append(v)
+        bar["ts"].append(t)
+        bar["signs"].append(s)
+        bar["post"].append(post)
+        bar["vol"] += v
+
+    def finalize(bar):
+        prices = np.asarray(bar["prices"])
+        vols = np.asarray(bar["vols"])
+        signs = np.asarray(bar["signs"])
+        total_v = vols.sum()
+        vwap = float(np.sum(prices * vols) / total_v)
+        var = float(np.sum(vols * (prices - vwap) ** 2) / total_v)
+        out = {
+            "volume": float(total_v),
+            "vwap": vwap,
+            "stddev": float(np.sqrt(max(0.0, var))),
+            "start_us": int(bar["ts"][0]),
+            "end_us": int(bar["ts"][-1]),
+            "time_duration_s": (bar["ts"][-1] - bar["ts"][0]) / 1e6,
+            "num_trades": len(bar["prices"]),
+            "signed_volume": float(np.sum(signs * vols)),
+            "buy_volume": float(np.sum(vols[signs > 0])),
+            "sell_volume": float(np.sum(vols[signs < 0])),
+        }
+        if has_post:
+            post = np.asarray(bar["post"])
+            for c, name in enumerate(("p_up", "p_consol", "p_down")):
+                out[name] = float(np.sum(post[:, c] * vols) / total_v)
+        return out
+
+    rows = []
+    cur = empty()
+    for i in range(len(price)):
+        remaining = float(qty[i])
+        post = tuple(float(p[i]) for p in posteriors) if has_post else None
+        while remaining > 0:
+            space = volume_per_bar - cur["vol"]
+            if remaining <= space:
+                add(cur, float(price[i]), remaining, int(ts[i]), float(side[i]), post)
+                remaining = 0
+            else:
+                if space > 0:
+                    add(cur, float(price[i]), space, int(ts[i]), float(side[i]), post)
+                    remaining -= space
+                rows.append(finalize(cur))
+                cur = empty()
+    if cur["vol"] > 0:
+        rows.append(finalize(cur))
+    cum = 0.0
+    for b in rows:
+        cum += b["volume"]
+        b["cumulative_volume"] = cum
+    return rows
+
+
+def legacy_massive(price, size, ts, volume_per_bar, extra=None):
+    """massive_volume / sim_volume: close once the running sum is full.
+    `extra` is (target_mean, target_sigma, labels) for the sim loop."""
+    rows = []
+    current_volume = 0
+    bar_data = []
+
+    def stats(bar_data):
+        prices = np.array([d[0] for d in bar_data])
+        volumes = np.array([d[1] for d in bar_data])
+        times = [d[2] for d in bar_data]
+        total_volume = volumes.sum()
+        vwap = np.sum(prices * volumes) / total_volume
+        variance = np.sum(volumes * (prices - vwap) ** 2) / total_volume
+        out = {
+            "cumulative_volume": (rows[-1]["cumulative_volume"] + total_volume
+                                  if rows else total_volume),
+            "vwap": vwap,
+            "stddev": np.sqrt(variance),
+            "volume": total_volume,
+            "start_time": times[0],
+            "end_time": times[-1],
+            "num_trades": len(bar_data),
+        }
+        if extra is None:
+            out["time_duration_s"] = (times[-1] - times[0]) / 1e9
+        else:
+            out["time_duration"] = times[-1] - times[0]
+            out["target_mean"] = np.sum(np.array([d[3] for d in bar_data]) * volumes) / total_volume
+            out["target_sigma"] = np.sum(np.array([d[4] for d in bar_data]) * volumes) / total_volume
+            out["labels"] = bar_data[0][5]
+        return out
+
+    for i in range(len(price)):
+        ext = tuple(e[i] for e in extra) if extra is not None else ()
+        remaining_size = size[i]
+        while remaining_size > 0:
+            space_left = volume_per_bar - current_volume
+            if remaining_size <= space_left:
+                bar_data.append((price[i], remaining_size, ts[i]) + ext)
+                current_volume += remaining_size
+                remaining_size = 0
+            else:
+                if space_left > 0:
+                    bar_data.append((price[i], space_left, ts[i]) + ext)
+                    current_volume += space_left
+                    remaining_size -= space_left
+                if current_volume >= volume_per_bar:
+                    rows.append(stats(bar_data))
+                    current_volume = 0
+                    bar_data = []
+    if bar_data:
+        rows.append(stats(bar_data))
+    return rows
+
+
+def legacy_tdigest_durations(size, ts, volume_per_bar):
+    """massive_tdigest_volume_duration: durations of the full bars only."""
+    durations = []
+    current_volume = 0
+    bar_start_time = None
+    bar_end_time = None
+    for i in range(len(size)):
+        remaining_size = size[i]
+        while remaining_size > 0:
+            space_left = volume_per_bar - current_volume
+            if bar_start_time is None:
+                bar_start_time = ts[i]
+            bar_end_time = ts[i]
+            if remaining_size <= space_left:
+                current_volume += remaining_size
+                remaining_size = 0
+            else:
+                current_volume += space_left
+                remaining_size -= space_left
+            if current_volume >= volume_per_bar:
+                durations.append((bar_end_time - bar_start_time) / 1e9)
+                current_volume = 0
+                bar_start_time = None
+                bar_end_time = None
+    return durations
+
+
+def legacy_stock(price, size, ts_ns, bar_volume):
+    """stock_bars (VolumeBar.fs): a full bar is emitted when the next
+    trade arrives; that trade is counted in it and sets its end_us."""
+    out = {k: [] for k in ("rel_stddev", "ret", "duration_sec", "trade_count",
+                           "volume", "start_us", "end_us")}
+    prev_vwap = None
+    cur_prices, cur_vols = [], []
+    cur_volume_sum = 0.0
+    cur_trade_count = 0
+    cur_start_us = cur_end_us = 0
+
+    def emit_bar():
+        nonlocal prev_vwap
+        prices = np.asarray(cur_prices, dtype=np.float64)
+        vols = np.asarray(cur_vols, dtype=np.float64)
+        v_sum = vols.sum()
+        vwap = float((prices * vols).sum() / v_sum)
+        var = float((prices * prices * vols).sum() / v_sum - vwap * vwap)
+        std = (max(0.0, var)) ** 0.5
+        out["rel_stddev"].append(std / vwap if vwap > 0 else 0.0)
+        if prev_vwap is None or prev_vwap <= 0 or vwap <= 0:
+            out["ret"].append(0.0)
+        else:
+            out["ret"].append(float(np.log(vwap / prev_vwap)))
+        out["duration_sec"].append((cur_end_us - cur_start_us) / 1e6)
+        out["trade_count"].append(cur_trade_count)
+        out["volume"].append(float(v_sum))
+        out["start_us"].append(cur_start_us)
+        out["end_us"].append(cur_end_us)
+        prev_vwap = vwap
+
+    for i in range(len(price)):
+        p = float(price[i])
+        remaining = float(size[i])
+        ts_us = int(ts_ns[i]) // 1000
+        counted = False
+        while remaining > 0.0:
+            if cur_volume_sum == 0.0 and not cur_prices:
+                cur_start_us = ts_us
+            if not counted:
+                cur_trade_count += 1
+                counted = True
+            cur_end_us = ts_us
+            space_left = bar_volume - cur_volume_sum
+            if remaining <= space_left:
+                cur_prices.append(p)
+                cur_vols.append(remaining)
+                cur_volume_sum += remaining
+                remaining = 0.0
+            else:
+                if space_left > 0:
+                    cur_prices.append(p)
+                    cur_vols.append(space_left)
+                    cur_volume_sum += space_left
+                    remaining -= space_left
+                if cur_volume_sum >= bar_volume:
+                    emit_bar()
+                    cur_prices.clear()
+                    cur_vols.clear()
+                    cur_volume_sum = 0.0
+                    cur_trade_count = 0
+    return out
+
+
+def legacy_timebars(price, size, ts, seconds_per_bar):
+    """massive_timebar: floor(ts / bucket) buckets, empty ones skipped."""
+    bucket_ns = seconds_per_bar * 1_000_000_000
+    rows = []
+    groups = {}
+    for i in range(len(price)):
+        groups.setdefault(int(ts[i]) // bucket_ns, []).append(i)
+    for bucket, idx in groups.items():
+        prices = price[idx]
+        volumes = size[idx]
+        total_volume = volumes.sum()
+        vwap = np.sum(prices * volumes) / total_volume
+        variance = np.sum(volumes * (prices - vwap) ** 2) / total_volume
+        rows.append({
+            "start_time": bucket * bucket_ns,
+            "end_time": (bucket + 1) * bucket_ns,
+            "vwap": vwap,
+            "stddev": np.sqrt(max(0.0, variance)),
+            "volume": total_volume,
+            "num_trades": len(idx),
+        })
+    return rows
+
+
+# -----------------------------------------------------------------------------
+# Kernels
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize("close_when_full", [False, True])
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_volume_kernels_agree(price, size, ts, side, bar_volume, close_when_full):
+    size = size[size > 0]
+    ref = bars._volume_fragments_loop(size, bar_volume, close_when_full)
+    for got in (bars._volume_fragments_numpy(size, bar_volume, close_when_full),
+                bars._volume_fragments(size, bar_volume, close_when_full)):
+        for a, b in zip(ref[:4], got[:4]):
+            np.testing.assert_array_equal(a, b)
+        assert got[4:] == ref[4:]
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_imbalance_kernels_agree(price, size, ts, side, bar_volume):
+    keep = size > 0
+    size, side = size[keep], side[keep]
+    threshold = bar_volume / 2
+    ref = bars._imbalance_fragments_loop(size, side, threshold)
+    for got in (bars._imbalance_fragments_numpy(size, side, threshold),
+                bars._imbalance_fragments(size, side, threshold)):
+        for a, b in zip(ref[:4], got[:4]):
+            np.testing.assert_array_equal(a, b)
+        assert got[4] == ref[4]
+
+
+# -----------------------------------------------------------------------------
+# Builders
+# -----------------------------------------------------------------------------
+
+def _binance_df(price, size, ts, side):
+    return pd.DataFrame({"price": price, "quantity": size, "timestamp": ts,
+                         "is_buyer_maker": side < 0})
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_binance_volume(price, size, ts, side, bar_volume):
+    post = np.random.default_rng(0).dirichlet(np.ones(3), len(price)).T
+    new = binance_volume.build_volume_bars(_binance_df(price, size, ts, side),
+                                           bar_volume, posteriors=tuple(post))
+    _assert_rows_equal(legacy_binance(price, size, ts, side, bar_volume, post), new)
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_futures_volume(price, size, ts, side, bar_volume):
+    new = futures_volume.build_volume_bars(_binance_df(price, size, ts, side), bar_volume)
+    _assert_rows_equal(legacy_binance(price, size, ts, side, bar_volume), new)
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_massive_volume(price, size, ts, side, bar_volume):
+    ts_ns = ts * 1000
+    new = massive_volume.create_volume_bars_vwap(
+        {"price": price, "size": size, "timestamp": ts_ns}, bar_volume)
+    _assert_rows_equal(legacy_massive(price, size, ts_ns, bar_volume), new)
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_sim_volume(price, size, ts, side, bar_volume):
+    rng = np.random.default_rng(1)
+    time = ts / 1e6
+    mean = price + rng.normal(0.0, 0.1, len(price))
+    sigma = rng.uniform(0.01, 0.2, len(price))
+    labels = rng.choice(["up", "down", "flat"], len(price))
+    trades = [{"time": float(time[i]), "price": float(price[i]), "size": float(size[i]),
+               "target_mean": float(mean[i]), "target_sigma": float(sigma[i]),
+               "label": str(labels[i])} for i in range(len(price))]
+    new = sim_volume.create_volume_bars(trades, bar_volume)
+    old = legacy_massive(price, size, time, bar_volume, extra=(mean, sigma, labels))
+    _assert_rows_equal(old, new)
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_tdigest_volume_duration(price, size, ts, side, bar_volume):
+    ts_ns = ts * 1000
+    new = massive_tdigest_volume_duration.create_volume_bars(
+        {"price": price, "size": size, "timestamp": ts_ns}, bar_volume)
+    np.testing.assert_array_equal(new, legacy_tdigest_durations(size, ts_ns, bar_volume))
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes()))
+def test_stock_bars(price, size, ts, side, bar_volume):
+    ts_ns = ts * 1000
+    new = stock_bars.build_bars({"price": price, "size": size, "timestamp": ts_ns},
+                                bar_volume)
+    old = legacy_stock(price, size, ts_ns, bar_volume)
+    for key in ("trade_count", "start_us", "end_us"):
+        np.testing.assert_array_equal(new[key], old[key], err_msg=key)
+    np.testing.assert_array_equal(new["buy_count"], old["trade_count"])
+    for key in ("volume", "duration_sec", "ret"):
+        np.testing.assert_allclose(new[key], old[key], rtol=1e-9, atol=1e-9, err_msg=key)
+    # The old E[p²] - vwap² variance cancels to ~1e-12 on flat bars.
+    np.testing.assert_allclose(new["rel_stddev"], old["rel_stddev"], atol=1e-7)
+
+
+@pytest.mark.parametrize("price,size,ts,side,bar_volume", list(_tapes())[:10])
+def test_massive_timebar(price, size, ts, side, bar_volume):
+    ts_ns = ts * 1000
+    new = massive_timebar.create_time_bars_vwap(
+        {"price": price, "size": size, "timestamp": ts_ns}, 1)
+    _assert_rows_equal(legacy_timebars(price, size, ts_ns, 1), new)
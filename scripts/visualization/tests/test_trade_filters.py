@@ -0,0 +1,80 @@
+"""keep_mask / WHERE_CLAUSE_SQL parity with should_keep_trade.
+
+Random trades cover every condition code 0..63 plus NULL/empty lists.
+NULL conditions are compared against should_keep_trade only: in DuckDB
+list_has_any(NULL, ...) is NULL, so WHERE_CLAUSE_SQL drops those rows,
+while the Python/F# predicates keep them. The Parquet builders write []
+instead of NULL, so the difference never shows up on our own files.
+
+    python -m pytest -q scripts/visualization/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trade_filters import (  # noqa: E402
+    EXCLUDE_FOR_PRICE_DISCOVERY, EXCLUDE_SET_SQL, OPEN_CLOSE_PRINTS,
+    OPEN_CLOSE_SET_SQL, WHERE_CLAUSE_SQL, keep_mask, should_keep_trade)
+
+N = 200_000
+
+
+def _sql_codes(sql_list):
+    """Parse the integer codes out of a ``[a, b, ...]::UTINYINT[]`` literal."""
+    return {int(c) for c in sql_list.split('::')[0].strip('[]').split(',')}
+
+
+@pytest.fixture(scope='module')
+def trades():
+    rng = np.random.default_rng(0)
+    size = rng.choice([-1.0, 0.0, 1.0, 100.0], N)
+    trf_id = rng.choice([0, 0, 0, 1, 4], N).astype(np.int64)
+    # Bias draws toward the codes that matter so every branch gets hit.
+    pool = np.array(sorted(EXCLUDE_FOR_PRICE_DISCOVERY | OPEN_CLOSE_PRINTS) * 4 + list(range(64)))
+    conditions = []
+    for k in rng.integers(-1, 4, N):
+        conditions.append(None if k < 0 else [int(c) for c in rng.choice(pool, k)])
+    bits = np.array([sum(1 << c for c in set(c or ())) for c in conditions], dtype=np.uint64)
+    return size, trf_id, conditions, keep_mask(size, trf_id, bits)
+
+
+def test_sql_sets_match_constants():
+    assert _sql_codes(EXCLUDE_SET_SQL) == EXCLUDE_FOR_PRICE_DISCOVERY
+    assert _sql_codes(OPEN_CLOSE_SET_SQL) == OPEN_CLOSE_PRINTS
+
+
+def test_keep_mask_matches_should_keep_trade(trades):
+    size, trf_id, conditions, vec = trades
+    ref = np.array([
+        should_keep_trade({'size': s, 'trf_id': t, 'conditions': c})
+        for s, t, c in zip(size, trf_id, conditions)
+    ])
+    bad = np.flatnonzero(vec != ref)
+    assert not bad.size, f'{bad.size} rows differ, e.g. {conditions[bad[0]]}'
+    assert 0 < vec.sum() < N
+
+
+def test_keep_mask_matches_where_clause(trades):
+    duckdb = pytest.importorskip('duckdb')
+    pa = pytest.importorskip('pyarrow')
+    size, trf_id, conditions, vec = trades
+    table = pa.table({
+        'i': np.arange(N),
+        'size': size,
+        'trf_id': trf_id,
+        'conditions': pa.array(conditions, pa.list_(pa.uint8())),
+    })
+    conn = duckdb.connect(':memory:')
+    conn.register('t', table)
+    kept = conn.execute(f'SELECT i FROM t WHERE {WHERE_CLAUSE_SQL} ORDER BY i').fetchnumpy()['i']
+    conn.close()
+    sql = np.zeros(N, dtype=bool)
+    sql[kept] = True
+    non_null = np.array([c is not None for c in conditions])
+    bad = np.flatnonzero((vec != sql) & non_null)
+    assert not bad.size, f'{bad.size} rows differ, e.g. {conditions[bad[0]]}'
@@ -3,7 +3,8 @@ Canonical lit-only trade filter — Python mirror of TradingEdge.Orb.TradeFilter
 
 If either side changes, the other MUST follow. Used by visualization scripts
 that load trade dicts from JSON/parquet; the same constants are also exposed
-as SQL strings for use inside DuckDB queries.
+as uint64 bitmasks for columnar trades (keep_mask / filter_trades_columnar)
+and as SQL strings for use inside DuckDB queries.
 
 Filter semantics: keep a trade iff
   size > 0
@@ -19,6 +20,8 @@ tail we now exclude wholesale via trf_id = 0.
 Based on CTA/UTP trade condition codes documented in docs/trade_conditions.md.
 """
 
+import numpy as np
+
 # CTA/UTP trade condition codes that disqualify a print from price discovery.
 # Codes 12 (Form T) and 37 (Odd Lot) are intentionally NOT here: 99%+ of
 # premarket trades carry 12, and odd lots make up a large share of modern
@@ -85,6 +88,36 @@ def filter_trades(trades):
     return [t for t in trades if should_keep_trade(t)]
 
 
+# -----------------------------------------------------------------------------
+# Vectorized form — same predicate over uint64 condition bitmasks (bit c set
+# iff code c is present), as returned by trade_io.load_trades_columnar.
+# The masks are derived from the sets above, so they cannot drift from them;
+# tests/test_trade_filters.py checks parity with should_keep_trade and
+# WHERE_CLAUSE_SQL.
+# -----------------------------------------------------------------------------
+
+EXCLUDE_MASK = np.uint64(sum(1 << c for c in EXCLUDE_FOR_PRICE_DISCOVERY))
+OPEN_CLOSE_MASK = np.uint64(sum(1 << c for c in OPEN_CLOSE_PRINTS))
+
+
+def exclude_mask(conditions):
+    """Vectorized should_exclude_trade over an array of condition bitmasks."""
+    return ((conditions & OPEN_CLOSE_MASK) == 0) & ((conditions & EXCLUDE_MASK) != 0)
+
+
+def keep_mask(size, trf_id, conditions):
+    """Vectorized should_keep_trade: boolean array, True where the trade
+    passes size > 0 AND trf_id = 0 AND the conditions check."""
+    return (size > 0) & (trf_id == 0) & ~exclude_mask(conditions)
+
+
+def filter_trades_columnar(cols):
+    """Columnar filter_trades: keep rows of a trade_io.load_trades_columnar
+    dict that pass the full lit-only predicate."""
+    keep = keep_mask(cols['size'], cols['trf_id'], cols['conditions'])
+    return {k: v[keep] for k, v in cols.items()}
+
+
 # -----------------------------------------------------------------------------
 # SQL fragments — DuckDB-flavored. Must stay in sync with the constants above
 # AND with TradingEdge.Orb.TradeFilters in F#.